@@ -33,17 +33,19 @@ class ArgsParser:
             parser.add_argument("-i", "--included-headers", type=str, help="Specifying C-like Headers")
             parser.add_argument("-I", "--enable-header-preprocess", action="store_true", help="Deal with C-like Headers")
             parser.add_argument("-p", "--print-stmts", action="store_true", help="Print statements")
-            parser.add_argument("-c", "--cores", default=1, help="Configure the available CPU cores")
+            parser.add_argument("-c", "--cores", default=1, type=int, help="Configure the available CPU cores")
             parser.add_argument("--android", action="store_true", help="Enable the Android analysis mode")
             parser.add_argument("-e", "--event-handlers", default=[], action='append', help="Config the event handlers dir")
             parser.add_argument('-l', "--lang", default="", type=str, help='programming lang', required=True)
             parser.add_argument("--strict-parse-mode", action="store_true", help="Enable the strict way to parse code")
+            parser.add_argument("--in-place", action="store_true", help="Analyze the source files in place instead of copying them into the workspace")
             parser.add_argument("-inc", "--incremental", action="store_true", help="Reuse previous analysis results for GIR, scope and cfg")
             parser.add_argument("--default-settings", type=str, help="Specify the default settings folder")
             parser.add_argument("--additional-settings",  type=str, help="Specify the additional settings folder")
             parser.add_argument("--graph", action="store_true", help="Output sfg (state flow graph) to .dot files")
             parser.add_argument("--complete-graph", action="store_true", help="Output the sfg with more detailed information for each node")
             parser.add_argument("--enable-p2", action="store_true", help="Enable the second phase of analysis")
+            parser.add_argument("--taint-witnesses", default=config.TAINT_WITNESS_COUNT, type=int, help="Report the k shortest data flow paths for each taint flow")
 
             parser.add_argument("--nomock", action="store_true", help="Disable the external processing module")
 
@@ -74,12 +76,14 @@ class ArgsParser:
             sub_command = "",
             in_path = "",
             incremental = False,
+            in_place = False,
             default_settings = config.DEFAULT_SETTINGS_PATH,
             additional_settings = "",
             graph = False,
             complete_graph = False,
             nomock = False,
             enable_p2 = False,
+            taint_witnesses = config.TAINT_WITNESS_COUNT,
         )
 
     def print_help(self):
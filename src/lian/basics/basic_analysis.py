@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
+import multiprocessing
 import pprint
 import sys
 import traceback
 
+from lian import common_structs
 from lian.util import util
 from lian.config import config
 import lian.util.data_model as dm
@@ -29,7 +31,7 @@ from lian.common_structs import (
     MethodSummaryInstance,
     SimplyGroupedMethodTypes,
 )
-from lian.util.loader import Loader
+from lian.util.loader import Loader, LoaderSaveRecorder
 from lian.util.gir_block import GIRBlockViewer
 from lian.incremental.unit_level_incremental_checker import UnitLevelIncrementalChecker
 from lian.core.resolver import Resolver
@@ -41,6 +43,22 @@ from lian.basics.entry_points import EntryPointGenerator
 from lian.basics.control_flow import ControlFlowAnalysis
 from lian.basics.stmt_def_use_analysis import StmtDefUseAnalysis
 
+# 分析各unit时由父进程设置，子进程通过fork继承
+_parallel_p1_context = None
+
+def _analyze_unit_in_worker(index):
+    """
+    unit分析入口（子进程中或单核时在本进程中执行）：
+    1. 从上下文中取出第index个unit
+    2. 在该unit独占的ID区间内分析其所有方法
+    3. 返回记录下的保存操作、调用边以及ID用量
+    """
+    p1, unit_list, import_analysis = _parallel_p1_context
+    try:
+        return p1.analyze_unit_in_id_block(index, unit_list[index], import_analysis)
+    except SystemExit:
+        # error_and_quit在子进程中只会结束该worker，需要交给父进程处理
+        raise RuntimeError(f"Failed to analyze unit {unit_list[index]}")
 
 class P1BasicSemanticAnalysis:
     def __init__(self, lian):
@@ -54,6 +72,7 @@ class P1BasicSemanticAnalysis:
         self.entry_points = EntryPointGenerator(lian.options, lian.event_manager, lian.loader)
         self.basic_call_graph = BasicCallGraph()
         self.analyzed_method_ids = set()
+        self.parallel_id_bases = None
         self.incremental_checker = None
         if self.options.incremental:
             self.incremental_checker = UnitLevelIncrementalChecker.unit_level_incremental_checker()
@@ -189,6 +208,106 @@ class P1BasicSemanticAnalysis:
                 for row in parameter_decls:
                     self.loader.save_method_parameter(method_id, row)
 
+    def analyze_unit(self, unit_id, import_analysis):
+        external_symbol_id_collection = {}
+        all_unit_methods = self.loader.convert_unit_id_to_method_ids(unit_id)
+        if self.options.incremental:
+            unit_is_analyzed = (self.incremental_checker.check_unit_id_analyzed(unit_id) is not None)
+        else:
+            unit_is_analyzed = False
+        for method_id in all_unit_methods:
+            if self.options.strict_parse_mode:
+                external_symbol_id_collection = {}
+                self.analyze_method(method_id, import_analysis, external_symbol_id_collection, unit_is_analyzed)
+                self.loader.save_method_external_symbol_id_collection(method_id, external_symbol_id_collection)
+            else:
+                self.analyze_method(method_id, import_analysis, external_symbol_id_collection, unit_is_analyzed)
+
+    def analyze_unit_in_id_block(self, unit_index, unit_id, import_analysis):
+        state_id_base, negative_symbol_id_base = self.parallel_id_bases
+        offset = unit_index * config.PARALLEL_P1_ID_BLOCK_SIZE
+        common_structs.global_state_id = state_id_base + offset
+        self.loader.set_last_negative_symbol_id(negative_symbol_id_base - offset)
+
+        loader = self.loader
+        basic_call_graph = self.basic_call_graph
+        recorder = LoaderSaveRecorder(loader)
+        self.loader = recorder
+        self.basic_call_graph = BasicCallGraph()
+        try:
+            self.analyze_unit(unit_id, import_analysis)
+            call_edges = list(self.basic_call_graph.graph.edges(data = "weight"))
+        finally:
+            self.loader = loader
+            self.basic_call_graph = basic_call_graph
+
+        return (
+            recorder.saved_items,
+            call_edges,
+            common_structs.global_state_id - state_id_base - offset,
+            negative_symbol_id_base - offset - loader.get_last_negative_symbol_id(),
+        )
+
+    def analyze_units(self, unit_list, import_analysis):
+        """
+        分析各unit的方法，单进程与多进程的结果完全一致：
+        1. 第i个unit使用[base + i * block, base + (i + 1) * block)的状态ID和负符号ID，与核数和调度顺序无关
+        2. 多核时由子进程分析，单核时在本进程中逐个分析；保存操作都先记录下来，再按unit顺序重放，并合并调用边
+        3. ID用量超过区间大小的unit会被丢弃结果，最后在父进程中重新分析
+        """
+        global _parallel_p1_context
+
+        block_size = config.PARALLEL_P1_ID_BLOCK_SIZE
+        state_id_base = common_structs.global_state_id
+        negative_symbol_id_base = self.loader.get_last_negative_symbol_id()
+        self.parallel_id_bases = (state_id_base, negative_symbol_id_base)
+        _parallel_p1_context = (self, unit_list, import_analysis)
+
+        next_state_id = state_id_base
+        last_negative_symbol_id = negative_symbol_id_base
+        overflowed_units = []
+        cores = min(self.options.cores, len(unit_list))
+        pool = None
+        # the workers share the id maps instead of copying them page by page;
+        # frozen maps are sorted, so they are frozen for any number of cores to keep the same output order
+        self.loader.freeze()
+        try:
+            if cores > 1:
+                pool = multiprocessing.get_context("fork").Pool(cores)
+                results = pool.imap(
+                    _analyze_unit_in_worker, range(len(unit_list)), chunksize = config.PARALLEL_P1_CHUNK_SIZE
+                )
+            else:
+                results = map(_analyze_unit_in_worker, range(len(unit_list)))
+
+            for unit_index, (unit_id, result) in enumerate(zip(unit_list, results)):
+                saved_items, call_edges, used_state_ids, used_negative_symbol_ids = result
+                if used_state_ids > block_size or used_negative_symbol_ids > block_size:
+                    overflowed_units.append(unit_id)
+                    continue
+
+                self.loader.replay_saved_items(saved_items)
+                for caller_id, callee_id, call_stmt_id in call_edges:
+                    self.basic_call_graph.add_edge(caller_id, callee_id, call_stmt_id)
+
+                offset = unit_index * block_size
+                next_state_id = max(next_state_id, state_id_base + offset + used_state_ids)
+                last_negative_symbol_id = min(
+                    last_negative_symbol_id, negative_symbol_id_base - offset - used_negative_symbol_ids
+                )
+        except RuntimeError as e:
+            util.error_and_quit(e)
+        finally:
+            if pool is not None:
+                pool.terminate()
+            _parallel_p1_context = None
+            self.parallel_id_bases = None
+
+        common_structs.global_state_id = next_state_id
+        self.loader.set_last_negative_symbol_id(last_negative_symbol_id)
+        for unit_id in overflowed_units:
+            self.analyze_unit(unit_id, import_analysis)
+
     def is_cookiecutter_file(self, unit_path):
         if "{{" in unit_path:
             return True
@@ -208,18 +327,9 @@ class P1BasicSemanticAnalysis:
             if util.is_empty(unit_gir):
                 continue
 
-            unit_scope = None
-            unit_is_analyzed = False
-            if self.options.incremental:
-                # if self.options.debug:
-                #     util.debug("Scope incremental:")
-                previous_scope_analysis_pack = self.incremental_checker.previous_scope_hierarchy_analysis_results(unit_info)
-                if previous_scope_analysis_pack:
-                    unit_is_analyzed = True
-                    unit_scope = UnitScopeHierarchyAnalysis(self.lian, self.loader, unit_id, unit_info, unit_gir).reuse_analysis(previous_scope_analysis_pack)
-
-            if not unit_is_analyzed:
-                unit_scope = UnitScopeHierarchyAnalysis(self.lian, self.loader, unit_id, unit_info, unit_gir).analyze()
+            # the scope hierarchy is rebuilt from the (reused) GIR even in the incremental mode:
+            # it is a single pass over the unit, and the later phases need all of its indexes
+            unit_scope = UnitScopeHierarchyAnalysis(self.lian, self.loader, unit_id, unit_info, unit_gir).analyze()
             self.entry_points.collect_entry_points_from_unit_scope(unit_info, unit_scope)
             if not self.options.nomock:
                 self.extern_system.install_mock_code_file(unit_info, unit_scope)
@@ -238,20 +348,7 @@ class P1BasicSemanticAnalysis:
         # reversed() is to improve cache hit rates
         #print("=== Analyzing def_use ===")
         unit_list.reverse()
-        for unit_id in unit_list:
-            external_symbol_id_collection = {}
-            all_unit_methods = self.loader.convert_unit_id_to_method_ids(unit_id)
-            if self.options.incremental:
-                unit_is_analyzed = (self.incremental_checker.check_unit_id_analyzed(unit_id) is not None)
-            else:
-                unit_is_analyzed = False
-            for method_id in all_unit_methods:
-                if self.options.strict_parse_mode:
-                    external_symbol_id_collection = {}
-                    self.analyze_method(method_id, import_analysis, external_symbol_id_collection, unit_is_analyzed)
-                    self.loader.save_method_external_symbol_id_collection(method_id, external_symbol_id_collection)
-                else:
-                    self.analyze_method(method_id, import_analysis, external_symbol_id_collection, unit_is_analyzed)
+        self.analyze_units(unit_list, import_analysis)
         self.loader.save_classified_method_call(self.basic_call_graph)
         self.group_methods_by_callee_types()
 
@@ -512,16 +512,6 @@ class UnitScopeHierarchyAnalysis:
             stmt_list.extend(self.unit_gir.get_block_stmt_ids(stmt.body))
             self.method_id_to_stmt_ids[method_id] = stmt_list
 
-    def reuse_analysis(self, previous_scope_analysis_results_pack):
-        pack = previous_scope_analysis_results_pack # alias
-        for key, value in pack.items():
-            if hasattr(self, key):
-                setattr(self, key, value)
-            else:
-                if key == "unit_symbol_decl_summary":
-                    self.loader.save_unit_symbol_decl_summary(self.unit_id, value)
-        return self.save_necessary_info()
-
     def save_necessary_info(self):
         self.loader.save_unit_id_to_stmt_ids(self.unit_id, self.unit_gir.get_all_stmt_ids())
         self.loader.save_unit_id_to_method_ids(self.unit_id, self.method_stmt_ids)
@@ -11,7 +11,7 @@ import copy
 import heapq
 from collections import Counter
 from itertools import count
-from collections import defaultdict
+from collections import defaultdict, deque
 from lian.util import readable_gir
 from lian.util.gir_block import GIRBlockViewer
 
@@ -257,13 +257,17 @@ class ImportStmtInfo:
 
 
 class SimpleWorkList:
+    """
+    工作队列：
+    1. 有CFG时按逆后序（reverse postorder）出队，底层是堆，入队/出队都是O(log n)
+    2. 没有CFG时是先进先出队列
+    3. all_data是队列中待处理的元素，用于去重；被移除的元素在出队时惰性删除
+    """
     def __init__(self, init_data = [], graph = None, entry_node = None):
         self.work_list = []
         self.all_data = set()
         self.graph = graph
         self.priority_dict = {}
-        if init_data:
-            self.add(init_data)
 
         if self.graph:
             if not entry_node:
@@ -282,6 +286,12 @@ class SimpleWorkList:
                     node: idx for idx, node in enumerate(cfg_order)
                 }
 
+        if not self.priority_dict:
+            self.work_list = deque()
+
+        if init_data:
+            self.add(init_data)
+
     def _add_with_priority(self, item):
         if item not in self.all_data:
             if self.priority_dict:
@@ -290,6 +300,32 @@ class SimpleWorkList:
                 self.work_list.append(item)
             self.all_data.add(item)
 
+    def _drop_removed_items(self):
+        # the entries of removed items are skipped lazily
+        while self.work_list:
+            item = self.work_list[0]
+            if self.priority_dict:
+                item = item[1]
+            if item in self.all_data:
+                return item
+            if self.priority_dict:
+                heapq.heappop(self.work_list)
+            else:
+                self.work_list.popleft()
+        return None
+
+    def _ordered_items(self):
+        if self.priority_dict:
+            rows = (item for _, item in sorted(self.work_list))
+        else:
+            rows = iter(self.work_list)
+
+        visited = set()
+        for item in rows:
+            if item in self.all_data and item not in visited:
+                visited.add(item)
+                yield item
+
     def fast_add(self, item):
         if item not in self.all_data:
             self._add_with_priority(item)
@@ -309,52 +345,48 @@ class SimpleWorkList:
         return self
 
     def pop(self):
-        if len(self.work_list) <= 0:
+        result = self._drop_removed_items()
+        if result is None:
             return None
 
-        result = self.work_list.pop(0)
-        if isinstance(result, tuple):
-            result = result[1]
-        if result in self.all_data:
-            self.all_data.remove(result)
+        if self.priority_dict:
+            heapq.heappop(self.work_list)
+        else:
+            self.work_list.popleft()
+        self.all_data.remove(result)
         return result
 
+    def remove(self, item):
+        self.all_data.discard(item)
+
     def insert_to_first(self, stmt_id):
+        self.all_data.discard(stmt_id)
         if self.priority_dict:
-            heapq.heappush(self.work_list, (0, stmt_id))
+            heapq.heappush(self.work_list, (-1, stmt_id))
         else:
-            self.work_list.insert(0, stmt_id)
+            self.work_list.appendleft(stmt_id)
         self.all_data.add(stmt_id)
 
     def peek(self):
-        if len(self.work_list) <= 0:
-            return None
-
-        result = self.work_list[0]
-        if isinstance(result, tuple):
-            result = result[1]
-
-        return result
+        return self._drop_removed_items()
 
     def __len__(self):
-        return len(self.work_list)
+        return len(self.all_data)
 
     def is_available(self):
-        return len(self.work_list) != 0
+        return len(self.all_data) != 0
 
     def __iter__(self):
-        for row in self.work_list:
-            yield row
+        return self._ordered_items()
 
     def __repr__(self):
-        return f"{self.work_list}"
+        return f"{list(self._ordered_items())}"
 
     def __getitem__(self, index):
-        if index >= 0 and index < len(self.work_list):
-            result = self.work_list[index]
-            if isinstance(result, tuple):
-                result = result[1]
-            return result
+        if index >= 0 and index < len(self.all_data):
+            for pos, item in enumerate(self._ordered_items()):
+                if pos == index:
+                    return item
         return None
 
     def __contains__(self, index):
@@ -1070,6 +1102,9 @@ class StateDefNode:
             "stmt_id": int(self.stmt_id)
         }
 
+    def to_tuple(self):
+        return (self.index, self.state_id, self.stmt_id,)
+
 @dataclasses.dataclass
 class SymbolDefNode:
     index: int = -1
@@ -1101,6 +1136,24 @@ class SymbolDefNode:
             "stmt_id": int(self.stmt_id)
         }
 
+def encode_def_nodes(def_nodes):
+    """
+    Pack a set of SymbolDefNode/StateDefNode as little-endian int64 triples (index, symbol_id/state_id, stmt_id)
+    """
+    if not def_nodes:
+        return b""
+    return numpy.array([node.to_tuple() for node in def_nodes], dtype = "<i8").tobytes()
+
+def decode_def_nodes(data, def_node_class):
+    """
+    Restore the set packed by encode_def_nodes; the triples are decoded in one shot with numpy
+    """
+    if isinstance(data, str):
+        # stmt status saved by older versions stores the def nodes as json
+        return {def_node_class(*item.values()) for item in json.loads(data)}
+    triples = numpy.frombuffer(data, dtype = "<i8").reshape(-1, 3).tolist()
+    return {def_node_class(index, node_id, stmt_id) for index, node_id, stmt_id in triples}
+
 @dataclasses.dataclass
 class StmtStatus:
     stmt_id: int = -1
@@ -1109,12 +1162,14 @@ class StmtStatus:
     used_symbols: list[int] = dataclasses.field(default_factory=list)
     implicitly_defined_symbols: list[int] = dataclasses.field(default_factory=list)
     implicitly_used_symbols: list[int] = dataclasses.field(default_factory=list)
-    in_symbol_bits: set[SymbolDefNode]   = dataclasses.field(default_factory=set)
-    out_symbol_bits: set[SymbolDefNode] = dataclasses.field(default_factory=set)
+    # in/out bits are bit vectors over the positions of the frame's BitVectorManager;
+    # they are sets of def nodes only when the status is saved or loaded
+    in_symbol_bits: int  = 0
+    out_symbol_bits: int = 0
 
     defined_states: set[int]= dataclasses.field(default_factory=set)
-    in_state_bits: set[StateDefNode]  = dataclasses.field(default_factory=set)
-    out_state_bits: set[StateDefNode] = dataclasses.field(default_factory=set)
+    in_state_bits: int  = 0
+    out_state_bits: int = 0
 
     field_name: str = ""
 
@@ -1133,23 +1188,22 @@ class StmtStatus:
             field_name = self.field_name,
         )
 
-    def to_dict(self, method_id):
-        new_in_symbol_bits = []
-        for each_bit in self.in_symbol_bits:
-            new_in_symbol_bits.append(each_bit.to_simple_dict())
-
-        new_out_symbol_bits = []
-        for each_bit in self.out_symbol_bits:
-            new_out_symbol_bits.append(each_bit.to_simple_dict())
-
-        new_in_state_bits = []
-        for each_bit in self.in_state_bits:
-            new_in_state_bits.append(each_bit.to_simple_dict())
+    def load_bits(self, symbol_bit_vector_manager, state_bit_vector_manager):
+        self.in_symbol_bits = symbol_bit_vector_manager.to_bit_vector(self.in_symbol_bits)
+        self.out_symbol_bits = symbol_bit_vector_manager.to_bit_vector(self.out_symbol_bits)
+        self.in_state_bits = state_bit_vector_manager.to_bit_vector(self.in_state_bits)
+        self.out_state_bits = state_bit_vector_manager.to_bit_vector(self.out_state_bits)
+        return self
 
-        new_out_state_bits = []
-        for each_bit in self.out_state_bits:
-            new_out_state_bits.append(each_bit.to_simple_dict())
+    def explain_bits(self, symbol_bit_vector_manager, state_bit_vector_manager):
+        status = self.copy()
+        status.in_symbol_bits = symbol_bit_vector_manager.explain(self.in_symbol_bits)
+        status.out_symbol_bits = symbol_bit_vector_manager.explain(self.out_symbol_bits)
+        status.in_state_bits = state_bit_vector_manager.explain(self.in_state_bits)
+        status.out_state_bits = state_bit_vector_manager.explain(self.out_state_bits)
+        return status
 
+    def to_dict(self, method_id):
         return {
             "method_id"                 : method_id,
             "stmt_id"                   : self.stmt_id,
@@ -1157,11 +1211,11 @@ class StmtStatus:
             "used_symbols"              : json.dumps(self.used_symbols),
             "implicitly_defined_symbols": json.dumps(self.implicitly_defined_symbols),
             "implicitly_used_symbols"   : json.dumps(self.implicitly_used_symbols),
-            "in_symbol_bits"            : json.dumps(new_in_symbol_bits),
-            "out_symbol_bits"           : json.dumps(new_out_symbol_bits),
+            "in_symbol_bits"            : encode_def_nodes(self.in_symbol_bits),
+            "out_symbol_bits"           : encode_def_nodes(self.out_symbol_bits),
             "defined_states"            : json.dumps(list(self.defined_states)),
-            "in_state_bits"             : json.dumps(new_in_state_bits),
-            "out_state_bits"            : json.dumps(new_out_state_bits),
+            "in_state_bits"             : encode_def_nodes(self.in_state_bits),
+            "out_state_bits"            : encode_def_nodes(self.out_state_bits),
             "field"                     : self.field_name,
         }
 
@@ -1238,7 +1292,8 @@ class SFGNode:
 
         if stmt is not None:
             self.stmt = stmt
-            self.line_no = stmt.start_row
+            if not util.isna(stmt.start_row):
+                self.line_no = stmt.start_row
             if len(name) == 0:
                 self.name = stmt.operation
 
@@ -1443,28 +1498,42 @@ class BitVectorManager:
     def find_bit_pos_by_id(self, bit_id):
         return self.id_to_bit_pos.get(bit_id, -1)
 
+    def reindex(self):
+        # bit ids may be modified in place (e.g., their indexes are shifted in the global phase)
+        self.id_to_bit_pos = {bit_id: bit_pos for bit_pos, bit_id in self.bit_pos_to_id.items()}
+
+    def to_bit_vector(self, id_list):
+        bit_vector = 0
+        for bit_id in id_list:
+            bit_pos = self.id_to_bit_pos.get(bit_id)
+            if bit_pos is None:
+                self.add_bit_id(bit_id)
+                bit_pos = self.counter - 1
+            bit_vector |= 1 << bit_pos
+        return bit_vector
+
     # find all 1s -> bit_id
     def explain(self, bit_vector):
-        return bit_vector
+        result = set()
+        if not bit_vector:
+            return result
+        bits = bin(bit_vector)[:1:-1]
+        bit_pos = bits.find("1")
+        while bit_pos != -1:
+            result.add(self.bit_pos_to_id[bit_pos])
+            bit_pos = bits.find("1", bit_pos + 1)
+        return result
 
     def kill_bit_ids(self, bit_vector, id_list):
-
+        mask = 0
         for bit_id in id_list:
-            if not isinstance(bit_id, (SymbolDefNode, StateDefNode)):
-                raise ValueError(f"bit_id {bit_id} is not a SymbolDefNode or StateDefNode")
-            
-            if bit_id in bit_vector:
-                bit_vector.discard(bit_id)
-        return bit_vector
+            bit_pos = self.id_to_bit_pos.get(bit_id)
+            if bit_pos is not None:
+                mask |= 1 << bit_pos
+        return bit_vector & ~mask
 
     def gen_bit_ids(self, bit_vector, id_list):
-        for bit_id in id_list:
-
-            if not isinstance(bit_id, (SymbolDefNode, StateDefNode)):
-                raise ValueError(f"bit_id {bit_id} is not a SymbolDefNode or StateDefNode")
-            
-            bit_vector.add(bit_id)
-        return bit_vector
+        return bit_vector | self.to_bit_vector(id_list)
 
     def is_bit_id_available(self, bit_vector, bit_id):
         bit_pos = self.id_to_bit_pos.get(bit_id)
@@ -1473,8 +1542,6 @@ class BitVectorManager:
                 return True
         return False
 
-
-
     def copy(self):
         bit_vector_manager = BitVectorManager()
         bit_vector_manager.bit_vector_id = self.bit_vector_id
@@ -13,6 +13,14 @@ BUILTIN_SYMBOL_START_ID                                      = -120
 RULE_START_ID                                                = 10
 MAX_ROWS                                                     = 40 * 10000
 MAX_BENCHMARK_FILES                                          = 1000
+PARALLEL_PARSING_CHUNK_SIZE                                  = 8
+PARALLEL_P1_CHUNK_SIZE                                       = 4
+PARALLEL_P1_ID_BLOCK_SIZE                                    = 1 << 20
+PARALLEL_P2_STATE_ID_BLOCK_SIZE                              = 1 << 24
+PARALLEL_P3_STATE_ID_BLOCK_SIZE                              = 1 << 24
+FILE_HASH_THREAD_COUNT                                       = 8
+FILE_HASH_CACHE_RACY_NS                                      = 2 * 10 ** 9
+FILE_HASH_CHUNK_SIZE                                         = 1 << 20
 MAX_ANALYSIS_ROUND_FOR_PRELIM_ANALYSIS                       = 2
 MAX_ANALYSIS_ROUND_FOR_GLOBAL_ANALYSIS                       = 3
 MAX_ANALYSIS_ROUND_FOR_CALL_SITE                             = 2
@@ -47,6 +55,7 @@ DEFAULT_SETTINGS                                             = os.path.join(ROOT
 DEFAULT_SETTINGS_PATH                                        = os.path.join(ROOT_DIR, DEFAULT_SETTINGS)
 
 BUNDLE_CACHE_CAPACITY                                        = 2
+BUNDLE_RECORD_BATCH_ROWS                                     = 16 * 1024
 LRU_CACHE_CAPACITY                                           = 20
 MIN_CACHE_CAPACITY                                           = 1
 MEDIUM_CACHE_CAPACITY                                        = 4
@@ -79,6 +88,8 @@ TAINT_SINK_FROM_CODE                                         = os.path.join(DEFA
 
 NO_TAINT                                                     = 0
 MAX_STMT_TAINT_ANALYSIS_COUNT                                = 3
+# 每条污点流输出的最短路径条数
+TAINT_WITNESS_COUNT                                          = 1
 ANY_LANG                                                     = "%"
 
 
@@ -89,8 +100,19 @@ SINK_FILE                                                    = "sink.yaml"
 INDIRECT_CALL_FILE                                           = "icall.yaml"
 
 MODULE_SYMBOLS_PATH                                          = "module_symbols"
+FILE_HASH_CACHE_PATH                                         = "file_hash_cache"
+PREPROCESS_CACHE_DIR                                         = "preprocess_cache"
+WORKSPACE_MANIFEST_PATH                                      = "manifest.json"
+C_LIKE_HEADER_EXTENSIONS                                     = (".h", ".hh", ".hpp", ".hxx", ".inc", ".inl")
 LOADER_INDEXING_PATH                                         = "indexing"
 GIR_BUNDLE_PATH                                              = "gir"
+GIR_SCHEMA_VERSION                                           = 1
+GIR_SCHEMA_VERSION_KEY                                       = b"lian.gir.schema_version"
+NULLABLE_INT_COLUMNS_KEY                                     = b"lian.nullable_int_columns"
+BATCH_OFFSETS_KEY                                            = b"lian.batch_offsets"
+BUNDLE_OFFSETS_SUFFIX                                        = "offsets"
+ID_MAP_SUFFIX                                                = "idmap"
+ID_ARRAY_NAMES_KEY                                           = b"lian.id_array_names"
 CFG_BUNDLE_PATH                                              = "cfg"
 SCOPE_HIERARCHY_BUNDLE_PATH                                  = "scope_hierarchy"
 METHOD_INTERNAL_CALLEES_PATH                                 = "method_internal_callees"
@@ -101,6 +123,7 @@ SCOPE_ID_TO_AVAILABLE_SCOPE_IDS_PATH                         = "scope_to_availab
 
 EXTERNAL_SYMBOL_ID_COLLECTION_PATH                           = "external_symbol_id_collection"
 UNIQUE_SYMBOL_IDS_PATH                                       = "unique_symbol_ids"
+UNIT_STMT_ID_RANGES_PATH                                     = "unit_stmt_id_ranges"
 
 CALL_STMT_ID_TO_INFO_PATH                                    = "call_stmt_id_to_info"
 CALL_STMT_ID_TO_CALL_FORMAT_INFO_PATH                        = "call_stmt_format"
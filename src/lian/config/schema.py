@@ -2,6 +2,7 @@
 
 import os,sys
 import numpy as np
+import pyarrow as pa
 
 scope_space_schema = [
     "unit_id",
@@ -37,6 +38,12 @@ unit_id_to_stmt_id_schema = [
     "max_stmt_id"
 ]
 
+unit_stmt_id_range_schema = [
+    "unit_path",
+    "start_stmt_id",
+    "end_stmt_id"
+]
+
 one_to_many_schema = [
     "one",
     "many"
@@ -220,6 +227,20 @@ call_graph_schema = [
     "call_site" # at which stmt_id caller calls callee
 ]
 
+# declared arrow types of the GIR bundle columns; the other (language-specific) columns are inferred
+gir_column_types = {
+    "operation"         : pa.dictionary(pa.int16(), pa.string()),
+    "parent_stmt_id"    : pa.int64(),
+    "stmt_id"           : pa.int64(),
+    "unit_id"           : pa.int64(),
+    "data_type"         : pa.string(),
+    "name"              : pa.string(),
+    "start_row"         : pa.int32(),
+    "start_col"         : pa.int32(),
+    "end_row"           : pa.int32(),
+    "end_col"           : pa.int32(),
+}
+
 loader_indexing_schema = [
     "item_id",
     "bundle_id"
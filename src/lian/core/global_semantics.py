@@ -3,9 +3,11 @@
 import os,sys
 import pprint
 import copy
+import multiprocessing
 from os.path import commonprefix
 
 import networkx as nx
+from lian import common_structs
 from lian.core.prelim_semantics import P2PrelimSemanticAnalysis
 from lian.util import util
 from lian.config import config
@@ -48,11 +50,33 @@ from lian.basics.stmt_def_use_analysis import StmtDefUseAnalysis
 from lian.core.stmt_states import StmtStates
 from lian.core.prelim_semantics import P2PrelimSemanticAnalysis
 from lian.util.gir_block import GIRBlockViewer
-from lian.util.loader import Loader
+from lian.util.loader import Loader, LoaderSaveRecorder
 from lian.core.resolver import Resolver
 from lian.core.global_stmt_states import GlobalStmtStates
 from networkx.generators.classic import complete_graph
 
+# 分析各入口时由父进程设置，子进程通过fork继承
+_parallel_p3_context = None
+
+# 分析一个入口时会读回的本入口结果，它们只在P3中产生
+_P3_READ_BACK_ITEMS = ("method_summary_instance", "parameter_mapping_p3")
+# 分析一个入口时写入的类成员指向本入口的状态空间，只对本入口可见
+_P3_ENTRY_LOCAL_ITEMS = ("class_id_to_members",)
+
+def _analyze_entry_point_in_worker(task):
+    """
+    入口分析入口（子进程中或单核时在本进程中执行）：
+    1. 在该入口独占的状态ID区间内、以独立的路径集合分析该入口
+    2. 返回记录下的保存操作、调用路径以及状态ID用量
+    """
+    p3 = _parallel_p3_context
+    state_id_base, entry_point = task
+    try:
+        return p3.analyze_entry_point_in_id_block(state_id_base, entry_point)
+    except SystemExit:
+        # error_and_quit在子进程中只会结束该worker，需要交给父进程处理
+        raise RuntimeError(f"Failed to analyze entry point {entry_point}")
+
 
 class P3GlobalSemanticAnalysis(P2PrelimSemanticAnalysis):
     def __init__(self, lian, analyzed_method_list):
@@ -85,6 +109,9 @@ class P3GlobalSemanticAnalysis(P2PrelimSemanticAnalysis):
 
         for state_def_nodes in state_bit_vector.bit_pos_to_id.values():
             state_def_nodes.index += baseline_index
+        # the in/out bits of the status stay valid since the bit positions are unchanged
+        symbol_bit_vector.reindex()
+        state_bit_vector.reindex()
         # for symbol_def_nodes in defined_symbols.values():
         #     for node in symbol_def_nodes:
         #         node.index += baseline_index
@@ -98,49 +125,6 @@ class P3GlobalSemanticAnalysis(P2PrelimSemanticAnalysis):
             for each_id, value in enumerate(stmt_status.implicitly_defined_symbols):
                 stmt_status.implicitly_defined_symbols[each_id] = value + baseline_index
 
-            new_in_symbol_bits = set()
-            new_out_symbol_bits = set()
-            new_in_state_bits = set()
-            new_out_state_bits = set()
-
-            for symbol_def_node in stmt_status.in_symbol_bits:
-                new_node = SymbolDefNode(
-                    index=symbol_def_node.index + baseline_index,
-                    symbol_id=symbol_def_node.symbol_id,
-                    stmt_id=symbol_def_node.stmt_id
-                )
-                new_in_symbol_bits.add(new_node)
-
-            for symbol_def_node in stmt_status.out_symbol_bits:
-                new_node = SymbolDefNode(
-                    index=symbol_def_node.index + baseline_index,
-                    symbol_id=symbol_def_node.symbol_id,
-                    stmt_id=symbol_def_node.stmt_id
-                )
-                new_out_symbol_bits.add(new_node)
-
-            for state_def_node in stmt_status.in_state_bits:
-                new_node = StateDefNode(
-                    index=state_def_node.index + baseline_index,
-                    state_id=state_def_node.state_id,
-                    stmt_id=state_def_node.stmt_id
-                )
-                new_in_state_bits.add(new_node)
-
-            for state_def_node in stmt_status.out_state_bits:
-                new_node = StateDefNode(
-                    index=state_def_node.index + baseline_index,
-                    state_id=state_def_node.state_id,
-                    stmt_id=state_def_node.stmt_id
-                )
-                new_out_state_bits.add(new_node)
-
-
-            stmt_status.in_symbol_bits = new_in_symbol_bits
-            stmt_status.out_symbol_bits = new_out_symbol_bits
-            stmt_status.in_state_bits = new_in_state_bits
-            stmt_status.out_state_bits = new_out_state_bits
-
             stmt_status.defined_symbol += baseline_index
 
         for each_item in space:
@@ -260,7 +244,13 @@ class P3GlobalSemanticAnalysis(P2PrelimSemanticAnalysis):
         state_bit_vector_manager = self.loader.get_state_bit_vector_p2(method_id)
         frame.symbol_bit_vector_manager = symbol_bit_vector_manager
         frame.state_bit_vector_manager = state_bit_vector_manager
+        if symbol_bit_vector_manager and state_bit_vector_manager:
+            for status in stmt_id_to_status.values():
+                status.load_bits(symbol_bit_vector_manager, state_bit_vector_manager)
         method_summary_template = self.loader.get_method_summary_template(method_id)
+        if method_summary_template:
+            # the indexes are shifted into the global space below
+            method_summary_template = method_summary_template.copy()
         frame.method_summary_template = method_summary_template
         self.adjust_index_of_status_space(len(global_space), frame, stmt_id_to_status, symbol_state_space, defined_symbols, symbol_bit_vector_manager, state_bit_vector_manager, method_summary_template)
         frame.stmt_id_to_status = stmt_id_to_status
@@ -417,7 +407,7 @@ class P3GlobalSemanticAnalysis(P2PrelimSemanticAnalysis):
             summary = self.generate_and_save_analysis_summary(frame, frame.method_summary_instance)
             # TODO: if there is already a summary for this context, we need to merge the two summaries
             self.loader.save_method_summary_instance(context_id, summary)
-            self.loader.save_stmt_status_p3(context_id, frame.stmt_id_to_status)
+            self.loader.save_stmt_status_p3(context_id, self.explain_stmt_status(frame))
             self.loader.save_method_defined_symbols_p3(context_id, frame.defined_symbols)
             # self.loader.save_symbol_bit_vector_p3(context_id, frame.symbol_bit_vector_manager)
             # self.loader.save_state_bit_vector_p3(context_id, frame.state_bit_vector_manager)
@@ -443,22 +433,115 @@ class P3GlobalSemanticAnalysis(P2PrelimSemanticAnalysis):
         frame_stack.add(entry_frame)
         return frame_stack
 
+    def analyze_entry_point(self, entry_point):
+        global_space = SymbolStateSpace()
+        self.call_site_analyze_counter = {}
+        sfg = StateFlowGraph(entry_point)
+        frame_stack = self.init_frame_stack(entry_point, global_space, sfg)
+        self.analyze_frame_stack(frame_stack, global_space, sfg)
+        self.loader.save_global_sfg_by_entry_point(entry_point, sfg)
+        self.save_graph_to_dot(sfg.graph, entry_point, self.analysis_phase_id, global_space)
+        self.loader.save_symbol_state_space_p3(entry_point, global_space)
+
+    def analyze_entry_point_in_id_block(self, state_id_base, entry_point):
+        common_structs.global_state_id = state_id_base
+
+        loader = self.loader
+        path_manager = self.path_manager
+        caller_unknown_callee_edge = self.caller_unknown_callee_edge
+        # an entry point only reads back its own summary instances, never those of the other entry points
+        recorder = LoaderSaveRecorder(
+            loader, readable_items = _P3_READ_BACK_ITEMS, own_results_only = True, local_items = _P3_ENTRY_LOCAL_ITEMS
+        )
+        self.loader = recorder
+        # the call paths of an entry point all start from it, so each entry point gets its own path set
+        self.path_manager = PathManager()
+        self.caller_unknown_callee_edge = {}
+        try:
+            self.analyze_entry_point(entry_point)
+            call_paths = sorted(self.path_manager.paths, key = lambda call_path: call_path.path)
+            entry_unknown_callee_edge = self.caller_unknown_callee_edge
+        finally:
+            self.loader = loader
+            self.path_manager = path_manager
+            self.caller_unknown_callee_edge = caller_unknown_callee_edge
+
+        return (
+            recorder.saved_items,
+            call_paths,
+            entry_unknown_callee_edge,
+            common_structs.global_state_id - state_id_base,
+        )
+
+    def analyze_entry_points(self, entry_points):
+        """
+        分析各入口，单进程与多进程的结果完全一致：
+        1. 第i个入口使用[base + i * block, base + (i + 1) * block)的状态ID，与核数和调度顺序无关
+        2. 多核时由子进程分析，单核时在本进程中逐个分析；各入口只读P1/P2的结果与自身的结果，
+           保存操作都先记录下来，再按入口顺序重放，并合并调用路径
+        3. 状态ID用量超过区间大小的入口会被丢弃结果，最后在父进程中依次重新分析
+        """
+        global _parallel_p3_context
+
+        block_size = config.PARALLEL_P3_STATE_ID_BLOCK_SIZE
+        state_id_base = common_structs.global_state_id
+        tasks = [
+            (state_id_base + entry_index * block_size, entry_point)
+            for entry_index, entry_point in enumerate(entry_points)
+        ]
+        _parallel_p3_context = self
+
+        next_state_id = state_id_base
+        overflowed_entry_points = []
+        cores = min(self.options.cores, len(entry_points))
+        pool = None
+        try:
+            if cores > 1:
+                pool = multiprocessing.get_context("fork").Pool(cores)
+                results = pool.imap(_analyze_entry_point_in_worker, tasks)
+            else:
+                results = map(_analyze_entry_point_in_worker, tasks)
+
+            for entry_index, result in enumerate(results):
+                used_state_ids = result[-1]
+                if used_state_ids > block_size:
+                    overflowed_entry_points.append(entry_points[entry_index])
+                    continue
+
+                self.apply_saved_entry_point(result)
+                next_state_id = max(next_state_id, state_id_base + entry_index * block_size + used_state_ids)
+
+            common_structs.global_state_id = next_state_id
+            for entry_point in overflowed_entry_points:
+                result = _analyze_entry_point_in_worker((common_structs.global_state_id, entry_point))
+                self.apply_saved_entry_point(result)
+                common_structs.global_state_id += result[-1]
+        except RuntimeError as e:
+            util.error_and_quit(e)
+        finally:
+            if pool is not None:
+                pool.terminate()
+            _parallel_p3_context = None
+
+    def apply_saved_entry_point(self, result):
+        saved_items, call_paths, caller_unknown_callee_edge, _ = result
+        self.loader.replay_saved_items(saved_items)
+        for call_path in call_paths:
+            self.path_manager.add_path(call_path)
+        for caller_id, unknown_callee_set in caller_unknown_callee_edge.items():
+            self.caller_unknown_callee_edge.setdefault(caller_id, set()).update(unknown_callee_set)
+
     def run(self):
         if not self.options.quiet:
             print("\n########### # Phase III: Global (Top-down) Semantic Analysis ##########")
 
-        if not self.options.enable_p2:
-            config.MAX_ANALYSIS_ROUND_FOR_GLOBAL_ANALYSIS = config.MAX_ANALYSIS_ROUND_FOR_PRELIM_ANALYSIS
-        
-        for entry_point in self.loader.get_entry_points():
-            global_space = SymbolStateSpace()
-            self.call_site_analyze_counter = {}
-            sfg = StateFlowGraph(entry_point)
-            frame_stack = self.init_frame_stack(entry_point, global_space, sfg)
-            self.analyze_frame_stack(frame_stack, global_space, sfg)
-            self.loader.save_global_sfg_by_entry_point(entry_point, sfg)
-            self.save_graph_to_dot(sfg.graph, entry_point, self.analysis_phase_id, global_space)
-            self.loader.save_symbol_state_space_p3(entry_point, global_space)
+        # max_analysis_round was taken from config in __init__; config itself is not changed here,
+        # otherwise a later analysis in the same process would run with a different number of rounds
+        entry_points = list(self.loader.get_entry_points())
+        # the workers share the id maps instead of copying them page by page;
+        # frozen maps are sorted, so they are frozen for any number of cores to keep the same results
+        self.loader.freeze()
+        self.analyze_entry_points(entry_points)
 
         self.loader.save_call_paths_p3(self.path_manager.paths)
 
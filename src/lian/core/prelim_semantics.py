@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 import copy
+import math
+import multiprocessing
+import pickle
 import pprint, os
 import sys
+import tempfile
 import traceback
 import numpy
 import networkx as nx
 
+from lian import common_structs
 from lian.config import type_table
 from lian.core.sfg_dumper import SFGDumper
 from lian.util import util
@@ -49,7 +54,8 @@ from lian.common_structs import (
     SFGEdge
 )
 from lian.util.gir_block import GIRBlockViewer
-from lian.util.loader import Loader
+from lian.util.loader import Loader, LoaderSaveRecorder
+from lian.incremental.unit_level_incremental_checker import UnitLevelIncrementalChecker
 from lian.core.resolver import Resolver
 from lian.core.stmt_states import StmtStates
 from networkx.generators.classic import complete_graph
@@ -58,11 +64,38 @@ from networkx.generators.classic import complete_graph
 
 stmt_counts = 0
 
+# 并行分析时由父进程设置，子进程通过fork继承
+_parallel_p2_context = None
+
+# 分析一组方法时会读回的本组结果，每一波结束后也只需把它们发布给子进程
+_P2_READ_BACK_ITEMS = (
+    "method_summary_template", "symbol_state_space_summary_p2", "parameter_mapping_p2", "method_def_use_summary",
+    "class_id_to_members"
+)
+
+def _analyze_method_group_in_worker(task):
+    """
+    子进程分析入口：
+    1. 先应用之前各波发布的结果，使子进程与父进程读到同样的方法摘要
+    2. 在该组独占的状态ID区间内分析组内方法
+    """
+    p2, published_dir = _parallel_p2_context
+    wave_index, state_id_base, method_ids = task
+    # the results are kept in memory: a worker never writes bundles that the parent also writes
+    config.MAX_ROWS = math.inf
+    try:
+        p2.apply_published_waves(published_dir, wave_index)
+        return p2.analyze_method_group(state_id_base, method_ids)
+    except SystemExit:
+        # error_and_quit在子进程中只会结束该worker，需要交给父进程处理
+        raise RuntimeError(f"Failed to analyze methods {method_ids}")
+
 class P2PrelimSemanticAnalysis:
     def __init__(self, lian):
         self.options = lian.options
         self.complete_graph = self.options.complete_graph
         self.event_manager = lian.event_manager
+        self.extern_system = lian.extern_system
         self.loader:Loader = lian.loader
         self.resolver: Resolver = lian.resolver
         self.call_graph = CallGraph()
@@ -77,12 +110,21 @@ class P2PrelimSemanticAnalysis:
         # progress info for phase II
         self._p2_total_methods_set: set[int] = set()
 
+        # the number of published waves a worker process has applied
+        self.applied_wave_count = 0
+
     def get_stmt_id_to_callee_info(self, callees):
         results = {}
         for each_callee in callees:
             results[each_callee.stmt_id] = each_callee
         return results
 
+    def explain_stmt_status(self, frame: ComputeFrame):
+        results = {}
+        for stmt_id, status in frame.stmt_id_to_status.items():
+            results[stmt_id] = status.explain_bits(frame.symbol_bit_vector_manager, frame.state_bit_vector_manager)
+        return results
+
     def adjust_defined_symbols_and_init_bit_vector(self, frame: ComputeFrame, method_id):
         raw_data = self.loader.get_method_defined_symbols_raw_p1(method_id)
         if util.is_empty(raw_data):
@@ -170,6 +212,8 @@ class P2PrelimSemanticAnalysis:
 
         self.adjust_defined_symbols_and_init_bit_vector(frame, method_id)
         self.adjust_defined_states_and_init_bit_vector(frame, method_id)
+        for status in frame.stmt_id_to_status.values():
+            status.load_bits(frame.symbol_bit_vector_manager, frame.state_bit_vector_manager)
 
         return frame
 
@@ -233,7 +277,8 @@ class P2PrelimSemanticAnalysis:
             state_id = defined_state.state_id
             state_node = StateDefNode(index=defined_state_index, state_id=state_id, stmt_id=stmt_id)
             state_current_bits = self.update_current_state_bit(state_node, frame, state_current_bits, new_defined_state_set)
-        status.out_state_bits = state_current_bits
+        # in_state_bits keeps following out_state_bits after the update
+        status.in_state_bits = status.out_state_bits = state_current_bits
 
         # 若本句语句的defined_symbol没有被解析出任何状态，生成一个UNSOLVED状态给它。并不加入到out_state_bits
         if defined_symbol := frame.symbol_state_space[status.defined_symbol]:
@@ -265,7 +310,7 @@ class P2PrelimSemanticAnalysis:
         status = frame.stmt_id_to_status[stmt_id]
         old_out_symbol_bits = status.out_symbol_bits
         old_in_symbol_bits = status.in_symbol_bits
-        status.in_symbol_bits = set()
+        status.in_symbol_bits = 0
 
         # collect parent stmts
         parent_stmt_ids = util.graph_predecessors(frame.cfg, stmt_id)
@@ -290,7 +335,7 @@ class P2PrelimSemanticAnalysis:
             if not frame.is_first_round[stmt_id] and status.in_symbol_bits == old_in_symbol_bits:
                 return
 
-        current_bits = status.in_symbol_bits.copy()
+        current_bits = status.in_symbol_bits
         all_defined_symbols = [status.defined_symbol] + status.implicitly_defined_symbols
         for tmp_counter, defined_symbol_index in enumerate(all_defined_symbols):
             defined_symbol = frame.symbol_state_space[defined_symbol_index]
@@ -299,7 +344,7 @@ class P2PrelimSemanticAnalysis:
             # pprint.pprint(defined_symbol)
             symbol_id = defined_symbol.symbol_id
             key = SymbolDefNode(index = defined_symbol_index, symbol_id = symbol_id, stmt_id = stmt_id)
-            if key in current_bits:
+            if frame.symbol_bit_vector_manager.is_bit_id_available(current_bits, key):
                 continue
             current_bits = self.update_current_symbol_bit(key, frame, current_bits)
 
@@ -350,7 +395,6 @@ class P2PrelimSemanticAnalysis:
 
     def rerun_analyze_reachable_symbols(self, stmt_id, stmt, frame: ComputeFrame, result_flag: P2ResultFlag):
         status = frame.stmt_id_to_status[stmt_id]
-        old_out_symbol_bits = status.out_symbol_bits
         current_bits = status.out_symbol_bits
         all_defined_symbols = status.implicitly_defined_symbols
         for defined_symbol_index in all_defined_symbols:
@@ -359,7 +403,7 @@ class P2PrelimSemanticAnalysis:
                 continue
             symbol_id = defined_symbol.symbol_id
             key = SymbolDefNode(index=defined_symbol_index, symbol_id=symbol_id, stmt_id=stmt_id)
-            if key in current_bits:
+            if frame.symbol_bit_vector_manager.is_bit_id_available(current_bits, key):
                 continue
             current_bits = self.update_current_symbol_bit(key, frame, current_bits)
             frame.symbol_graph.add_edge(stmt_id, key, SYMBOL_DEPENDENCY_GRAPH_EDGE_KIND.IMPLICITLY_DEFINED)
@@ -392,9 +436,9 @@ class P2PrelimSemanticAnalysis:
         # print("rerun_new_out_bits")
         # print(frame.symbol_bit_vector_manager.explain(current_bits))
 
-        # check if the out bits are changed
+        # only the result flags decide whether the successors are revisited
         self.update_symbols_if_changed(
-            stmt_id, stmt, frame, status, status.in_symbol_bits, old_out_symbol_bits, result_flag.symbol_def_changed, result_flag.symbol_use_changed
+            stmt_id, stmt, frame, status, status.in_symbol_bits, status.out_symbol_bits, result_flag.symbol_def_changed, result_flag.symbol_use_changed
         )
 
     def check_reachable_symbol_defs(self, stmt_id, frame: ComputeFrame, status, used_symbol_index, used_symbol: Symbol, available_symbol_defs):
@@ -531,7 +575,7 @@ class P2PrelimSemanticAnalysis:
         return result
 
     def collect_in_state_bits(self, stmt_id, stmt, frame: ComputeFrame):
-        in_state_bits = set()
+        in_state_bits = 0
         parent_stmt_ids = util.graph_predecessors(frame.cfg, stmt_id)
         if stmt.operation in LOOP_OPERATIONS:
             new_parent_stmt_ids = []
@@ -1197,16 +1241,12 @@ class P2PrelimSemanticAnalysis:
             stmt = frame.unit_gir.get_stmt_by_id(stmt_id)
             if stmt_id in frame.loop_total_rounds:
                 if frame.stmt_counters[stmt_id] <= frame.loop_total_rounds[stmt_id]:
-                    frame.stmt_worklist.add(util.graph_successors(frame.cfg, stmt_id))
                     frame.stmts_with_symbol_update.add(stmt_id)
                 else:
                     frame.stmt_worklist.pop()
                     continue
             else:
-                if frame.stmt_counters[stmt_id] < self.max_analysis_round:
-                    frame.stmt_worklist.add(util.graph_successors(frame.cfg, stmt_id))
-                    # print("添加cfg后继",list(util.graph_successors(frame.cfg, stmt_id)))
-                else:
+                if frame.stmt_counters[stmt_id] >= self.max_analysis_round:
                     frame.stmt_worklist.pop()
                     continue
 
@@ -1239,7 +1279,10 @@ class P2PrelimSemanticAnalysis:
                 # print(f"第{stmt_counts/2000}轮打印stmt_states情况")
                 # self.print_count_stmt_def_states()
 
-            frame.stmt_worklist.pop()
+            # the successors are added after the statement is done, so that peek() keeps returning
+            # the current statement while it is analyzed (e.g., for the resolver)
+            frame.stmt_worklist.add(util.graph_successors(frame.cfg, stmt_id))
+            frame.stmt_worklist.remove(stmt_id)
             frame.stmt_counters[stmt_id] += 1
             frame.is_first_round[stmt_id] = False
 
@@ -1314,7 +1357,7 @@ class P2PrelimSemanticAnalysis:
             self.analyzed_method_list.add(frame.method_id)
 
             self.generate_and_save_analysis_summary(frame, frame.method_summary_template)
-            self.loader.save_stmt_status_p2(frame.method_id, frame.stmt_id_to_status)
+            self.loader.save_stmt_status_p2(frame.method_id, self.explain_stmt_status(frame))
             self.loader.save_symbol_bit_vector_p2(frame.method_id, frame.symbol_bit_vector_manager)
             self.loader.save_state_bit_vector_p2(frame.method_id, frame.state_bit_vector_manager)
             self.loader.save_symbol_state_space_p2(frame.method_id, frame.symbol_state_space)
@@ -1330,6 +1373,177 @@ class P2PrelimSemanticAnalysis:
 
             frame_stack.pop()
 
+    def build_method_dependency_graph(self, method_ids):
+        graph = nx.DiGraph()
+        graph.add_nodes_from(method_ids)
+        basic_call_graph = self.loader.get_classified_method_call()
+        if util.is_available(basic_call_graph):
+            for caller_id, callee_id in basic_call_graph.graph.edges():
+                if caller_id in graph and callee_id in graph:
+                    graph.add_edge(caller_id, callee_id)
+        return graph
+
+    def analyze_method_group(self, state_id_base, method_ids):
+        """
+        方法组分析入口（子进程中或单核时在本进程中执行）：
+        1. 使用从state_id_base开始的状态ID
+        2. 保存操作只被记录下来，读回的结果只对本组可见，因此结果与同一波中其他组的调度无关
+        3. 遇到尚未分析的被调用者（如动态解析出的调用）时，与单个方法的分析一样先深度优先分析它
+        4. 返回记录下的保存操作、调用边、本组分析的方法以及状态ID用量
+        """
+        common_structs.global_state_id = state_id_base
+
+        loader = self.loader
+        call_graph = self.call_graph
+        previous_method_ids = set(self.analyzed_method_list)
+        recorder = LoaderSaveRecorder(loader, readable_items = _P2_READ_BACK_ITEMS)
+        self.loader = recorder
+        self.call_graph = CallGraph()
+        try:
+            for method_id in method_ids:
+                if method_id not in self.analyzed_method_list:
+                    self.analyze_method(method_id)
+            call_edges = list(self.call_graph.graph.edges(data = "weight"))
+            analyzed_method_ids = sorted(self.analyzed_method_list - previous_method_ids)
+        finally:
+            self.loader = loader
+            self.call_graph = call_graph
+            # the methods only count as analyzed once the parent has replayed the whole wave
+            self.analyzed_method_list.intersection_update(previous_method_ids)
+
+        return (
+            recorder.saved_items,
+            call_edges,
+            analyzed_method_ids,
+            common_structs.global_state_id - state_id_base,
+        )
+
+    def apply_saved_method_group(self, result):
+        saved_items, call_edges, analyzed_method_ids, _ = result
+        self.loader.replay_saved_items(saved_items)
+        for caller_id, callee_id, call_stmt_id in call_edges:
+            self.call_graph.add_edge(caller_id, callee_id, call_stmt_id)
+        return [item for item in saved_items if item[0][len("save_"):] in _P2_READ_BACK_ITEMS], analyzed_method_ids
+
+    def publish_wave(self, published_dir, wave_index, read_back_items, analyzed_method_ids):
+        with open(os.path.join(published_dir, f"wave{wave_index}"), "wb") as f:
+            pickle.dump((read_back_items, analyzed_method_ids), f, protocol = pickle.HIGHEST_PROTOCOL)
+
+    def apply_published_waves(self, published_dir, wave_count):
+        while self.applied_wave_count < wave_count:
+            with open(os.path.join(published_dir, f"wave{self.applied_wave_count}"), "rb") as f:
+                read_back_items, analyzed_method_ids = pickle.load(f)
+            self.loader.replay_saved_items(read_back_items)
+            self.analyzed_method_list.update(analyzed_method_ids)
+            self.applied_wave_count += 1
+
+    def analyze_method_group_wave(self, pool, published_dir, wave_index, method_groups):
+        """
+        分析一波方法组：
+        1. 第i组使用[base + i * block, base + (i + 1) * block)的状态ID，与调度顺序无关
+        2. 各组都分析完之后，父进程按组的顺序重放保存操作，并合并调用边
+        3. 状态ID用量超过区间大小的组会被丢弃结果，随后在父进程中依次重新分析
+        4. 多核时把本波读回的结果发布给子进程
+        """
+        block_size = config.PARALLEL_P2_STATE_ID_BLOCK_SIZE
+        state_id_base = common_structs.global_state_id
+        tasks = [
+            (wave_index, state_id_base + group_index * block_size, method_ids)
+            for group_index, method_ids in enumerate(method_groups)
+        ]
+        if pool is None:
+            # every group is analyzed before any of them is replayed, as in the worker processes
+            results = [self.analyze_method_group(*task[1:]) for task in tasks]
+        else:
+            results = pool.imap(_analyze_method_group_in_worker, tasks)
+
+        next_state_id = state_id_base
+        overflowed_groups = []
+        wave_read_back_items = []
+        wave_analyzed_method_ids = []
+        for group_index, result in enumerate(results):
+            used_state_ids = result[-1]
+            if used_state_ids > block_size:
+                overflowed_groups.append(method_groups[group_index])
+                continue
+
+            read_back_items, analyzed_method_ids = self.apply_saved_method_group(result)
+            wave_read_back_items.extend(read_back_items)
+            wave_analyzed_method_ids.extend(analyzed_method_ids)
+            next_state_id = max(next_state_id, state_id_base + group_index * block_size + used_state_ids)
+        self.analyzed_method_list.update(wave_analyzed_method_ids)
+        common_structs.global_state_id = next_state_id
+
+        for method_ids in overflowed_groups:
+            result = self.analyze_method_group(common_structs.global_state_id, method_ids)
+            read_back_items, analyzed_method_ids = self.apply_saved_method_group(result)
+            wave_read_back_items.extend(read_back_items)
+            wave_analyzed_method_ids.extend(analyzed_method_ids)
+            self.analyzed_method_list.update(analyzed_method_ids)
+            common_structs.global_state_id += result[-1]
+
+        if pool is not None:
+            self.publish_wave(published_dir, wave_index, wave_read_back_items, wave_analyzed_method_ids)
+
+    def analyze_methods_bottom_up(self, method_id_lists):
+        """
+        依次对每批方法，沿调用图的强连通分量DAG自底向上逐波分析，单核与多核的结果完全一致：
+        1. 每批方法的基础调用图只压缩一次，每个分量记录尚未分析完的被调用分量数，减为0时进入下一波
+        2. 一波中的每个分量是一组，组内方法按给定的顺序分析
+        3. 多核时整个过程只使用一个进程池，子进程在分析下一波之前应用之前各波发布的结果
+        """
+        global _parallel_p2_context
+
+        pool = None
+        temp_dir = None
+        published_dir = None
+        wave_index = 0
+        try:
+            if self.options.cores > 1:
+                temp_dir = tempfile.TemporaryDirectory()
+                published_dir = temp_dir.name
+                _parallel_p2_context = (self, published_dir)
+                self.applied_wave_count = 0
+                pool = multiprocessing.get_context("fork").Pool(self.options.cores)
+
+            for method_ids in method_id_lists:
+                method_order = {}
+                for method_id in method_ids:
+                    method_order.setdefault(method_id, len(method_order))
+                condensed_graph = nx.condensation(self.build_method_dependency_graph(method_order))
+                remaining_callees = {scc_id: condensed_graph.out_degree(scc_id) for scc_id in condensed_graph.nodes}
+                ready_scc_ids = [scc_id for scc_id, count in remaining_callees.items() if count == 0]
+
+                while len(ready_scc_ids) != 0:
+                    method_groups = []
+                    for scc_id in ready_scc_ids:
+                        members = condensed_graph.nodes[scc_id]["members"]
+                        # a member may have been analyzed as a dynamic callee of an earlier group
+                        pending_members = [method_id for method_id in members if method_id not in self.analyzed_method_list]
+                        if len(pending_members) != 0:
+                            method_groups.append(sorted(pending_members, key = method_order.get))
+                    method_groups.sort(key = lambda group: method_order[group[0]])
+
+                    if len(method_groups) != 0:
+                        self.analyze_method_group_wave(pool, published_dir, wave_index, method_groups)
+                        wave_index += 1
+
+                    next_ready_scc_ids = []
+                    for scc_id in ready_scc_ids:
+                        for caller_scc_id in condensed_graph.predecessors(scc_id):
+                            remaining_callees[caller_scc_id] -= 1
+                            if remaining_callees[caller_scc_id] == 0:
+                                next_ready_scc_ids.append(caller_scc_id)
+                    ready_scc_ids = next_ready_scc_ids
+        except RuntimeError as e:
+            util.error_and_quit(e)
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if temp_dir is not None:
+                temp_dir.cleanup()
+            _parallel_p2_context = None
+
     def sort_methods_by_unit_id(self, methods):
         return sorted(list(methods), key=lambda method: self.loader.convert_method_id_to_unit_id(method))
 
@@ -1366,6 +1580,14 @@ class P2PrelimSemanticAnalysis:
             counter+=1
             # print(each_op)
 
+    def reuse_previous_results(self, method_ids):
+        incremental_checker = UnitLevelIncrementalChecker.unit_level_incremental_checker()
+        reused_method_ids = incremental_checker.collect_reusable_methods_p2(method_ids, self.loader.get_import_deps())
+        incremental_checker.reuse_method_results_p2(sorted(reused_method_ids), self.call_graph)
+        self.analyzed_method_list.update(reused_method_ids)
+        if not self.options.quiet:
+            print(f"Reuse the previous results of {len(reused_method_ids)}/{len(method_ids)} methods")
+
     def run(self):
         if not self.options.quiet:
             print("\n############ # Phase II: Preliminary (Bottom-up) Analysis # ##########")
@@ -1374,14 +1596,18 @@ class P2PrelimSemanticAnalysis:
         grouped_methods:SimplyGroupedMethodTypes = self.loader.get_grouped_methods()
         # initialize total method set for progress printing
         self._p2_total_methods_set = set(grouped_methods.get_methods_with_direct_call()) | set(grouped_methods.get_methods_with_dynamic_call())
-        for method_id in grouped_methods.get_methods_with_direct_call():
-            if method_id not in self.analyzed_method_list:
-                self.analyze_method(method_id)
-
-        # in every round only analyze the stmts once
-        for method_id in grouped_methods.get_methods_with_dynamic_call():
-            if method_id not in self.analyzed_method_list:
-                self.analyze_method(method_id)
+        if self.options.incremental:
+            self.reuse_previous_results(self._p2_total_methods_set)
+        # the workers share the id maps instead of copying them page by page;
+        # frozen maps are sorted, so they are frozen for any number of cores to keep the same results
+        self.loader.freeze()
+        method_ids = grouped_methods.get_methods_with_direct_call() + grouped_methods.get_methods_with_dynamic_call()
+        # the extern rules only apply mock code that has been analyzed, and calling it leaves no call graph edge
+        mock_method_ids = self.extern_system.get_mock_method_ids()
+        self.analyze_methods_bottom_up([
+            [method_id for method_id in method_ids if method_id in mock_method_ids],
+            method_ids
+        ])
 
         # save all results here
         self.loader.save_call_graph_p2(self.call_graph)
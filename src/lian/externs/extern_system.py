@@ -288,6 +288,15 @@ class ExternSystem:
     def exec_model_method(self, rule, data):
         return rule.model_method(data)
 
+    def get_mock_method_ids(self):
+        mock_method_ids = set()
+        for method_name_to_externs in self.lang_to_externs.values():
+            for rules in method_name_to_externs.values():
+                for each_rule in rules:
+                    if each_rule.kind == RULE_KIND.CODE:
+                        mock_method_ids.add(each_rule.mock_id)
+        return mock_method_ids
+
     def is_method_analyzed(self, data, method_id):
         return method_id in data.in_data.state_analysis.analyzed_method_list
 
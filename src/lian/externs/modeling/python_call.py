@@ -10,6 +10,7 @@ from lian.common_structs import (
     P2ResultFlag,
 )
 from lian.config.constants import LIAN_INTERNAL
+from lian.util import util
 import lian.events.event_return as er
 
 def dispatch(data: EventData):
@@ -148,7 +149,7 @@ def init(data: EventData):
     method_ids = set()
     for method_id in real_method_ids:
         stmt = loader.get_stmt_gir(method_id)
-        if stmt.start_row == 167:
+        if util.is_available(stmt.start_row) and stmt.start_row == 167:
             method_ids.add(method_id)
             break
 
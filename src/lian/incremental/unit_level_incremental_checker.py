@@ -1,9 +1,12 @@
 from lian.util.loader import Loader
 import os
+import networkx as nx
 from lian.config import config
+from lian.config.constants import SYMBOL_OR_STATE
 from lian.util import util
 import copy
-from lian.common_structs import Scope
+from lian import common_structs
+from lian.common_structs import CallSite
 
 
 class UnitLevelIncrementalChecker:
@@ -17,12 +20,19 @@ class UnitLevelIncrementalChecker:
         self.bak_path = os.path.join(workspace_path, config.BACKUP_DIR)
         self.options.workspace = self.bak_path
         self.event_manager = event_manager
-        self.bak_loader = Loader(self.options, self.event_manager)
+        self.bak_loader = Loader(self.options)
 
-        self.bak_loader.restore()
+        # the previous results are only read
+        self.bak_loader.restore(read_only = True)
         self.module_symbol_backup = self.bak_loader.get_module_symbol_table()
 
-        self.max_stmt_id = -1
+        # states created in this run must not collide with the reused ones
+        common_structs.global_state_id = max(common_structs.global_state_id, self.bak_loader.get_next_state_id())
+        self.unit_id_to_unchanged_flag = {}
+        self.method_id_to_unchanged_flag = {}
+        self.reused_method_ids_p2 = set()
+        self.previous_method_symbols_p1 = {}
+        self.current_method_symbols_p1 = {}
 
     # singleton pattern
     @classmethod
@@ -48,6 +58,8 @@ class UnitLevelIncrementalChecker:
 
     def check_unit_id_analyzed(self, unit_id):
         unit_info = self.current_loader.convert_module_id_to_module_info(unit_id)
+        if unit_info is None:
+            return None
         return self.check_unit_analyzed(unit_info)
 
     def check_unit_analyzed(self, unit_info):
@@ -57,76 +69,114 @@ class UnitLevelIncrementalChecker:
         unit_hash = unit_info.hash
         bak_unit_entry = self.module_symbol_backup.query_index_column_value_first("hash", unit_hash)
         # util.debug(unit_hash)
-        if len(bak_unit_entry) == 0:
+        if bak_unit_entry is None:
             return None
-        previous_uid = bak_unit_entry.access(0, column_name="module_id")
+        previous_uid = bak_unit_entry.module_id
         # util.warn(unit_info.module_id, previous_uid)
         return previous_uid
 
-    def fetch_gir(self, previous_uid, current_node_id):
+    def fetch_gir(self, previous_uid):
         unit_gir_df = self.bak_loader.get_unit_gir(previous_uid)
         if not unit_gir_df:
-            return current_node_id, None
+            return None
         if len(unit_gir_df) == 0:
-            return current_node_id, None
+            return None
         unit_gir_df.modify_column("unit_id", None)
-        unit_gir_list = unit_gir_df.convert_to_dict_list()
-        for stmt in unit_gir_list:
-            self.max_stmt_id = max(self.max_stmt_id, stmt["stmt_id"])
-        return self.max_stmt_id + 1, unit_gir_list
-
-    def fetch_scope(self, previous_uid):
-        scope_pack = {}
-        # scope_pack["stmt_ids"] = self.bak_loader.convert_unit_id_to_stmt_ids(previous_uid)
-        scope_pack["method_stmt_ids"] = self.bak_loader.convert_unit_id_to_method_ids(previous_uid)
-        scope_pack["class_stmt_ids"] = self.bak_loader.convert_unit_id_to_class_ids(previous_uid)
-        scope_pack["namespace_stmt_ids"] = self.bak_loader.convert_unit_id_to_namespace_ids(previous_uid)
-        scope_pack["variable_ids"] = self.bak_loader.find_variable_ids_by_unit_id(previous_uid)
-        scope_pack["import_stmt_ids"] = self.bak_loader.convert_unit_id_to_import_stmt_ids(previous_uid)
-
-        method_id_to_method_name = {}
-        method_id_to_parameter_ids = {}
-        method_stmt_ids = scope_pack["method_stmt_ids"]
-        for stmt_id in method_stmt_ids:
-            method_id_to_method_name[stmt_id] = self.bak_loader.convert_method_id_to_method_name(stmt_id)
-            method_id_to_parameter_ids[stmt_id] = self.bak_loader.convert_method_id_to_parameter_ids(stmt_id)
-
-        class_id_to_class_name = {}
-        class_id_to_class_method_ids = {}
-        class_id_to_class_field_ids = {}
-        class_stmt_ids = scope_pack["class_stmt_ids"]
-        for stmt_id in class_stmt_ids:
-            class_id_to_class_name[stmt_id] = self.bak_loader.convert_class_id_to_class_name(stmt_id)
-            class_id_to_class_method_ids[stmt_id] = self.bak_loader.convert_class_id_to_method_ids(stmt_id)
-            class_id_to_class_field_ids[stmt_id] = self.bak_loader.convert_class_id_to_field_ids(stmt_id)
-
-        scope_pack["method_id_to_method_name"] = method_id_to_method_name
-        scope_pack["method_id_to_parameter_ids"] = method_id_to_parameter_ids
-        scope_pack["class_id_to_class_name"] = class_id_to_class_name
-        scope_pack["class_id_to_class_method_ids"] = class_id_to_class_method_ids
-        scope_pack["class_id_to_class_field_ids"] = class_id_to_class_field_ids
-
-        scope_space_df = self.bak_loader.get_unit_scope_hierarchy(previous_uid)
-        scope_space_list = scope_space_df.convert_to_dict_list()
-        scope_pack["scope_space"] = self.revive_data_from_dict_list(scope_space_list, Scope)
-
-        scope_pack["unit_symbol_decl_summary"] = self.bak_loader.get_unit_symbol_decl_summary(previous_uid)
-        return scope_pack
+        return unit_gir_df.convert_to_dict_list()
 
     def fetch_cfg(self, method_id):
         return self.bak_loader.get_method_cfg(method_id)
 
-    def previous_lang_analysis_results(self, unit_info, current_node_id):
+    def previous_lang_analysis_results(self, unit_info):
         # util.debug("inc:", unit_info.module_id)
-        previous_uid = self.check_unit_analyzed(unit_info)
-        if not previous_uid:
-            return current_node_id, None
-        else:
-            return self.fetch_gir(previous_uid, current_node_id)
-
-    def previous_scope_hierarchy_analysis_results(self, unit_info):
         previous_uid = self.check_unit_analyzed(unit_info)
         if not previous_uid:
             return None
         else:
-            return self.fetch_scope(previous_uid)
+            return self.fetch_gir(previous_uid)
+
+    def previous_unit_stmt_id_ranges(self):
+        return self.bak_loader.get_all_unit_stmt_id_ranges()
+
+    def is_unit_id_unchanged(self, unit_id):
+        if unit_id not in self.unit_id_to_unchanged_flag:
+            self.unit_id_to_unchanged_flag[unit_id] = (self.check_unit_id_analyzed(unit_id) is not None)
+        return self.unit_id_to_unchanged_flag[unit_id]
+
+    def obtain_method_symbols_p1(self, loader):
+        method_id_to_symbols = {}
+        columns = ["symbol_or_state", "stmt_id", "symbol_id", "name"]
+        for method_id, rows in loader.group_symbol_state_space_rows_by_method_id_p1(columns).items():
+            method_id_to_symbols[method_id] = [row[1:] for row in rows if row[0] == SYMBOL_OR_STATE.SYMBOL]
+        return method_id_to_symbols
+
+    def is_method_unchanged(self, method_id, import_deps):
+        """
+        方法的P2结果可以复用的条件：
+        1. 方法所在的unit，以及该unit（间接）导入的unit都没有改变
+        2. P1中的符号与上一轮一致（新分配的负数symbol_id可能因为其他unit的改变而偏移）
+        """
+        if method_id in self.method_id_to_unchanged_flag:
+            return self.method_id_to_unchanged_flag[method_id]
+
+        flag = False
+        unit_id = self.current_loader.convert_method_id_to_unit_id(method_id)
+        if unit_id is not None and self.is_unit_id_unchanged(unit_id):
+            previous_uid = self.check_unit_id_analyzed(unit_id)
+            flag = (self.bak_loader.convert_method_id_to_unit_id(method_id) == previous_uid)
+            if flag and import_deps is not None and unit_id in import_deps:
+                flag = all(self.is_unit_id_unchanged(each_id) for each_id in nx.descendants(import_deps, unit_id))
+            if flag:
+                # methods without any symbol are not grouped
+                flag = (self.previous_method_symbols_p1.get(method_id, []) == self.current_method_symbols_p1.get(method_id, []))
+
+        self.method_id_to_unchanged_flag[method_id] = flag
+        return flag
+
+    def collect_reusable_methods_p2(self, method_ids, import_deps):
+        """
+        只有方法本身及其在上一轮P2调用图中（间接）调用的方法都没有改变时，才能复用该方法的P2结果
+        """
+        self.reused_method_ids_p2 = set()
+        previous_call_graph = self.bak_loader.get_call_graph_p2()
+        if previous_call_graph is None:
+            return self.reused_method_ids_p2
+
+        self.previous_method_symbols_p1 = self.obtain_method_symbols_p1(self.bak_loader)
+        self.current_method_symbols_p1 = self.obtain_method_symbols_p1(self.current_loader)
+        graph = previous_call_graph.graph
+        affected_method_ids = set()
+        for method_id in set(method_ids) | set(graph.nodes):
+            if not self.is_method_unchanged(method_id, import_deps):
+                affected_method_ids.add(method_id)
+
+        # the callers of the changed methods are affected as well
+        worklist = [method_id for method_id in affected_method_ids if method_id in graph]
+        while worklist:
+            method_id = worklist.pop()
+            for caller_id in graph.predecessors(method_id):
+                if caller_id not in affected_method_ids:
+                    affected_method_ids.add(caller_id)
+                    worklist.append(caller_id)
+
+        self.reused_method_ids_p2 = set(method_ids) - affected_method_ids
+        return self.reused_method_ids_p2
+
+    def reuse_method_results_p2(self, method_ids, call_graph):
+        # 上一轮的unit GIR被复用时stmt_id保持不变，因此P2结果不需要重新映射
+        self.current_loader.copy_method_results_p2(self.bak_loader, method_ids)
+
+        graph = self.bak_loader.get_call_graph_p2().graph
+        for method_id in method_ids:
+            # P2 only adds the implicitly used external symbols to the def-use summary of P1
+            def_use_summary = self.current_loader.get_method_def_use_summary(method_id)
+            previous_summary = self.bak_loader.get_method_def_use_summary(method_id)
+            if util.is_available(previous_summary.used_external_symbol_ids):
+                def_use_summary.used_external_symbol_ids.update(int(symbol_id) for symbol_id in previous_summary.used_external_symbol_ids)
+            self.current_loader.save_method_def_use_summary(method_id, def_use_summary)
+
+            if method_id not in graph:
+                continue
+            for _, callee_id, call_stmt_id in graph.out_edges(method_id, data = "weight"):
+                call_graph.add_edge(method_id, callee_id, call_stmt_id)
+                self.current_loader.copy_parameter_mapping_p2(self.bak_loader, CallSite(method_id, call_stmt_id, callee_id))
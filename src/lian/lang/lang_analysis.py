@@ -6,6 +6,11 @@ import pprint
 from ctypes import c_void_p, cdll
 import tree_sitter
 import importlib
+import multiprocessing
+import collections
+import hashlib
+import io
+import time
 from lian.events.event_manager import EventManager
 from lian.util import util
 from lian.config import lang_config
@@ -18,6 +23,30 @@ from lian.incremental.unit_level_incremental_checker import UnitLevelIncremental
 
 EXTENSIONS_LANG = lang_config.EXTENSIONS_LANG
 
+# 并行解析时由父进程设置，子进程通过fork继承
+_parallel_parsing_context = None
+
+def _parse_units_in_worker(tasks):
+    """
+    子进程解析入口：
+    1. tasks是父进程刚读取并预处理好的一批单元：(单元下标, 源码)
+    2. 仅执行AST解析和GIR生成，不触发任何事件
+    3. 返回各单元的GIR，连同本批解析的耗时统计
+    """
+    gir_parser, lang_table, units, unit_paths, lang_options = _parallel_parsing_context
+    gir_statement_lists = []
+    for index, code in tasks:
+        try:
+            gir_statements = None
+            if lang_options[index] is not None and not util.is_empty(code):
+                lang = gir_parser.obtain_lang(lang_options[index], lang_table)
+                gir_statements = gir_parser.generate_gir(units[index], unit_paths[index], lang, code)
+            gir_statement_lists.append(gir_statements)
+        except SystemExit:
+            # error_and_quit在子进程中只会结束该worker，需要交给父进程处理
+            raise RuntimeError(f"Failed to parse {unit_paths[index]}")
+    return (gir_statement_lists, ast_parser_registry.pop_stats())
+
 def determine_lang_by_path(file_path):
     ext = os.path.splitext(file_path)[1]
     return EXTENSIONS_LANG.get(ext, None)
@@ -70,6 +99,18 @@ def is_empty(node):
     return False
 
 
+def adjust_node_id(node_id):
+    """
+    调整节点ID间距：
+    1. 按配置的最小ID间隔调整数值
+    保证ID连续性和可读性
+    """
+    node_id += config.MIN_ID_INTERVAL
+    remainder = node_id % 10
+    if remainder != 0:
+        node_id += (10 - remainder)
+    return node_id
+
 class GIRProcessing:
     def __init__(self, node_id):
         self.node_id = node_id
@@ -208,18 +249,24 @@ class GIRProcessing:
         flattened_nodes = self.flatten_gir(stmts)
         return (self.node_id, flattened_nodes)
 
-class GIRParser:
-    def __init__(self, options, event_manager, loader, output_path):
-        self.options = options
-        self.event_manager = event_manager
-        self.loader = loader
+class ASTParserRegistry:
+    """
+    按语言缓存tree-sitter解析器：
+    1. 每个进程内每种语言的.so只加载一次
+    2. 复用同一个Parser对象
+    3. 统计每种语言的加载耗时与解析耗时
+    """
+    def __init__(self):
+        self.parsers = {}
+        self.stats = {}
 
-        self.accumulated_rows = []
-        self.output_path = output_path
-        self.max_rows = config.MAX_ROWS
-        self.count = 0
+    def obtain_stats(self, lang_name):
+        if lang_name not in self.stats:
+            # [load_time, ast_time, gir_time, unit_count]
+            self.stats[lang_name] = [0.0, 0.0, 0.0, 0]
+        return self.stats[lang_name]
 
-    def obtain_ast_parser(self, lang: lang_config.LangConfig):
+    def load_parser(self, lang: lang_config.LangConfig):
         try:
             lib = cdll.LoadLibrary(lang.so_path)
             function_name = lang.name if lang.name != "csharp" else "c_sharp"
@@ -242,33 +289,101 @@ class GIRParser:
         except Exception as e:
             util.error_and_quit(f"Failed to load AST parser for language '{lang.name}': {e}")
 
-    def parse(self, unit_info, file_path, lang_option, lang_table):
+    def get_parser(self, lang: lang_config.LangConfig):
+        key = (lang.name, lang.so_path)
+        tree_sitter_parser = self.parsers.get(key)
+        if tree_sitter_parser is None:
+            start = time.perf_counter()
+            tree_sitter_parser = self.load_parser(lang)
+            self.obtain_stats(lang.name)[0] += time.perf_counter() - start
+            self.parsers[key] = tree_sitter_parser
+        return tree_sitter_parser
+
+    def record_parse(self, lang_name, ast_time, gir_time):
+        lang_stats = self.obtain_stats(lang_name)
+        lang_stats[1] += ast_time
+        lang_stats[2] += gir_time
+        lang_stats[3] += 1
+
+    def pop_stats(self):
+        stats = self.stats
+        self.stats = {}
+        return stats
+
+    def merge_stats(self, stats):
+        for lang_name, other in stats.items():
+            lang_stats = self.obtain_stats(lang_name)
+            for index, value in enumerate(other):
+                lang_stats[index] += value
+
+    def report(self):
+        for lang_name, (load_time, ast_time, gir_time, count) in sorted(self.stats.items()):
+            print(
+                f"[{lang_name}] units: {count}, load: {load_time:.3f}s, "
+                f"ast: {ast_time:.3f}s, gir: {gir_time:.3f}s"
+            )
+
+# 进程级别的解析器缓存；fork出的子进程会继承父进程已加载的解析器
+ast_parser_registry = ASTParserRegistry()
+
+class GIRParser:
+    def __init__(self, options, event_manager, loader, output_path):
+        self.options = options
+        self.event_manager = event_manager
+        self.loader = loader
+
+        self.accumulated_rows = []
+        self.output_path = output_path
+        self.max_rows = config.MAX_ROWS
+        self.count = 0
+        self.lang_table_key = None
+        self.lang_configs = {}
+        # 原地分析时由读取源码的同一次IO计算出的单元哈希，随后写回模块符号表
+        self.unit_hashes = {}
+
+    def obtain_ast_parser(self, lang: lang_config.LangConfig):
+        return ast_parser_registry.get_parser(lang)
+
+    def find_lang_config(self, lang_option, lang_table):
+        key = (id(lang_table), len(lang_table))
+        if self.lang_table_key != key:
+            self.lang_table_key = key
+            self.lang_configs = {}
+            for language in lang_table:
+                self.lang_configs.setdefault(language.name, language)
+        return self.lang_configs.get(lang_option)
+
+    def read_source_code(self, unit_info, file_path):
         """
-        解析源代码生成GIR：
-        1. 动态加载语言解析库
-        2. 调用Tree-sitter生成AST
-        3. 通过语言特定parser生成GIR语句
+        读取源码文件：
+        1. 模块符号表中缺少哈希时（原地分析），对读到的字节顺便计算sha256，避免再单独读一遍文件
+        2. 按照文本模式的默认编码和换行规则解码
         """
-        if lang_option is None:
-            return
+        if not util.is_empty(unit_info.hash) or not self.options.in_place:
+            with open(file_path, 'r') as f:
+                return f.read()
+
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        self.unit_hashes[unit_info.module_id] = hashlib.sha256(data).hexdigest()
+        return io.TextIOWrapper(io.BytesIO(data)).read()
 
-        lang = None
-        for language in lang_table:
-            if language.name == lang_option:
-                lang = language
-                break
+    def obtain_lang(self, lang_option, lang_table):
+        lang = self.find_lang_config(lang_option, lang_table)
         if not lang:
             util.error_and_quit("Unsupported language: " + self.options.lang)
+        return lang
 
-        ast_parser = self.obtain_ast_parser(lang)
-        if not ast_parser:
-            util.error_and_quit("Failed to obtain AST parser for language: " + lang_option)
-
+    def prepare_source_code(self, unit_info, file_path, lang_option):
+        """
+        读取并预处理源码：
+        1. 读取源码文件
+        2. 发送MOCK_SOURCE_CODE_READY和ORIGINAL_SOURCE_CODE_READY事件
+        事件处理函数可能带有副作用，该步骤只在父进程中执行
+        """
         code = None
-        tree = None
         try:
-            with open(file_path, 'r') as f:
-                code = f.read()
+            code = self.read_source_code(unit_info, file_path)
         except:
             util.error("Failed to read file:", file_path)
             return
@@ -277,7 +392,7 @@ class GIRParser:
             return
 
         if not self.options.strict_parse_mode:
-            if f"{config.DEFAULT_WORKSPACE}/{config.EXTERNS_DIR}" in file_path:
+            if unit_info.is_extern or f"{config.DEFAULT_WORKSPACE}/{config.EXTERNS_DIR}" in file_path:
                 event = EventData(lang_option, EVENT_KIND.MOCK_SOURCE_CODE_READY, code)
                 self.event_manager.notify(event)
                 code = event.out_data
@@ -286,48 +401,114 @@ class GIRParser:
             self.event_manager.notify(event)
             code = event.out_data
 
+        return code
+
+    def generate_gir(self, unit_info, file_path, lang, code):
+        """
+        由预处理后的源码生成GIR：
+        1. 调用Tree-sitter生成AST
+        2. 通过语言特定parser生成GIR语句
+        不触发任何事件，可以在子进程中独立执行
+        """
+        ast_parser = self.obtain_ast_parser(lang)
+        if not ast_parser:
+            util.error_and_quit("Failed to obtain AST parser for language: " + lang.name)
+
+        start = time.perf_counter()
         try:
             tree = ast_parser.parse(bytes(code, 'utf8'))
         except:
             util.error("Failed to parse AST:", file_path)
             return
+        ast_time = time.perf_counter() - start
 
+        start = time.perf_counter()
         gir_statements = []
         parser = lang.parser(self.options, unit_info)
         parser.parse_gir(tree.root_node, gir_statements)
+        ast_parser_registry.record_parse(lang.name, ast_time, time.perf_counter() - start)
         return gir_statements
 
-    def deal_with_file_unit(self, current_node_id, unit_info, file_unit, lang_table):
+    def parse(self, unit_info, file_path, lang_option, lang_table):
         """
-        处理单个文件单元：
-        1. 确定文件语言类型
-        2. 解析生成GIR语句
-        3. 执行扁平化转换
-        4. 发送事件通知处理结果
+        解析源代码生成GIR：
+        1. 动态加载语言解析库
+        2. 读取并预处理源码
+        3. 调用Tree-sitter生成AST，并通过语言特定parser生成GIR语句
         """
-        lang_option = determine_lang_by_path(file_unit)
+        if lang_option is None:
+            return
 
-        if not self.options.quiet:
-            print("GIR-Parsing:", file_unit)
+        lang = self.obtain_lang(lang_option, lang_table)
+        code = self.prepare_source_code(unit_info, file_path, lang_option)
+        if util.is_empty(code):
+            return
 
-        gir_statements = self.parse(unit_info, file_unit, lang_option, lang_table = lang_table)
+        return self.generate_gir(unit_info, file_path, lang, code)
+
+    def notify_unflattened_gir(self, lang_option, gir_statements):
+        """
+        发送UNFLATTENED_GIR_LIST_GENERATED事件，返回处理后的GIR语句
+        """
         if not gir_statements:
-            return (current_node_id, None)
+            return None
         if self.options.debug and self.options.print_stmts:
             pprint.pprint(gir_statements, compact=True, sort_dicts=False)
 
         event = EventData(lang_option, EVENT_KIND.UNFLATTENED_GIR_LIST_GENERATED, gir_statements)
         self.event_manager.notify(event)
-        current_node_id, flatten_nodes = GIRProcessing(current_node_id).flatten(event.out_data)
+        return event.out_data
+
+    def parse_file_unit(self, unit_info, file_unit, lang_table):
+        """
+        解析单个文件单元（不涉及语句ID）：
+        1. 确定文件语言类型
+        2. 解析生成GIR语句
+        3. 发送UNFLATTENED_GIR_LIST_GENERATED事件
+        """
+        lang_option = determine_lang_by_path(file_unit)
+        gir_statements = self.parse(unit_info, file_unit, lang_option, lang_table = lang_table)
+        return (lang_option, self.notify_unflattened_gir(lang_option, gir_statements))
+
+    def flatten_file_unit(self, unit_info, lang_option, gir_statements):
+        """
+        扁平化已解析的文件单元：
+        1. 从该unit的语句ID区间开始分配语句ID，原区间放不下时重新分配区间
+        2. 发送GIR_LIST_GENERATED事件
+        """
+        unit_path = unit_info.unit_path
+        start_stmt_id = self.loader.obtain_unit_start_stmt_id(unit_path)
+        end_stmt_id, flatten_nodes = start_stmt_id, None
+        if gir_statements:
+            end_stmt_id, flatten_nodes = GIRProcessing(start_stmt_id).flatten(gir_statements)
+        if not self.loader.save_unit_stmt_id_range(unit_path, start_stmt_id, end_stmt_id, adjust_node_id(end_stmt_id)):
+            start_stmt_id = self.loader.obtain_unit_start_stmt_id(unit_path)
+            end_stmt_id, flatten_nodes = GIRProcessing(start_stmt_id).flatten(gir_statements)
+            self.loader.save_unit_stmt_id_range(unit_path, start_stmt_id, end_stmt_id, adjust_node_id(end_stmt_id))
+
         if not flatten_nodes:
-            return (current_node_id, flatten_nodes)
+            return flatten_nodes
 
         event = EventData(lang_option, EVENT_KIND.GIR_LIST_GENERATED, flatten_nodes)
         self.event_manager.notify(event)
         if self.options.debug and self.options.print_stmts:
             pprint.pprint(event.out_data, compact=True, sort_dicts=False)
 
-        return (current_node_id, event.out_data)
+        return event.out_data
+
+    def deal_with_file_unit(self, unit_info, file_unit, lang_table):
+        """
+        处理单个文件单元：
+        1. 确定文件语言类型
+        2. 解析生成GIR语句
+        3. 执行扁平化转换
+        4. 发送事件通知处理结果
+        """
+        if not self.options.quiet:
+            print("GIR-Parsing:", file_unit)
+
+        lang_option, gir_statements = self.parse_file_unit(unit_info, file_unit, lang_table)
+        return self.flatten_file_unit(unit_info, lang_option, gir_statements)
 
     def add_unit_gir(self, unit_info, flatten_nodes):
         """
@@ -355,25 +536,78 @@ class LangAnalysis:
         初始化语句ID计数器：
         1. 根据符号表长度计算初始偏移
         2. 保证ID起始值对齐到10的倍数
+        3. 增量分析时沿用上一轮各unit的语句ID区间
         """
         symbol_table = self.loader.get_module_symbol_table()
-        result = max(symbol_table.module_id)
-        return self.adjust_node_id(result)
-
-    def adjust_node_id(self, node_id):
+        result = adjust_node_id(max(symbol_table.module_id))
+        previous_unit_path_to_range = {}
+        if self.options.incremental:
+            unit_level_checker = UnitLevelIncrementalChecker.unit_level_incremental_checker()
+            previous_unit_path_to_range = unit_level_checker.previous_unit_stmt_id_ranges()
+        self.loader.init_unit_stmt_id_ranges(result, previous_unit_path_to_range)
+        return result
+
+    def obtain_unit_path(self, unit_info):
+        if self.options.strict_parse_mode:
+            return unit_info.original_path
+        if self.options.in_place and util.is_available(unit_info.original_path):
+            return unit_info.original_path
+        return unit_info.unit_path
+
+    def parse_units_in_parallel(self, gir_parser, units_to_analyze):
         """
-        调整节点ID间距：
-        1. 按配置的最小ID间隔调整数值
-        保证ID连续性和可读性
+        多进程解析代码单元：
+        1. 父进程每次读取一批单元的源码并执行源码预处理事件，随即交给子进程池
+        2. 子进程并行完成AST解析和GIR生成，同时父进程继续读取后面的单元
+        3. 在途的批次达到上限时，父进程按照单元顺序取回最早一批的GIR，执行GIR事件、扁平化并分配语句ID区间
+        所有事件处理函数都在父进程中按单元顺序执行，结果与串行解析完全一致；
+        父进程最多只持有在途批次的源码，每个单元的源码和GIR在保存后即被释放
         """
-        # remainder = node_id % 10
-        # if remainder != 0:
-        #     node_id += (10 - remainder)
-        node_id += config.MIN_ID_INTERVAL
-        remainder = node_id % 10
-        if remainder != 0:
-            node_id += (10 - remainder)
-        return node_id
+        global _parallel_parsing_context
+
+        units = list(units_to_analyze)
+        unit_paths = [self.obtain_unit_path(unit_info) for unit_info in units]
+        lang_options = [determine_lang_by_path(unit_path) for unit_path in unit_paths]
+        _parallel_parsing_context = (gir_parser, self.lang_table, units, unit_paths, lang_options)
+
+        chunk_size = config.PARALLEL_PARSING_CHUNK_SIZE
+        cores = min(self.options.cores, len(units))
+        # enough batches to keep every worker busy while the parent reads the next one
+        max_pending_chunks = 2 * cores
+        pending_chunks = collections.deque()
+        try:
+            with multiprocessing.get_context("fork").Pool(cores) as pool:
+                for chunk_start in range(0, len(units), chunk_size):
+                    tasks = []
+                    for index in range(chunk_start, min(chunk_start + chunk_size, len(units))):
+                        code = None
+                        if lang_options[index] is not None:
+                            gir_parser.obtain_lang(lang_options[index], self.lang_table)
+                            code = gir_parser.prepare_source_code(units[index], unit_paths[index], lang_options[index])
+                        tasks.append((index, code))
+                    pending_chunks.append((chunk_start, pool.apply_async(_parse_units_in_worker, (tasks,))))
+
+                    if len(pending_chunks) >= max_pending_chunks:
+                        self.add_parsed_chunk(gir_parser, units, unit_paths, lang_options, *pending_chunks.popleft())
+                while pending_chunks:
+                    self.add_parsed_chunk(gir_parser, units, unit_paths, lang_options, *pending_chunks.popleft())
+        except RuntimeError as e:
+            util.error_and_quit(e)
+        finally:
+            _parallel_parsing_context = None
+
+    def add_parsed_chunk(self, gir_parser, units, unit_paths, lang_options, chunk_start, async_result):
+        """
+        取回一批单元的GIR，按单元顺序执行UNFLATTENED_GIR_LIST_GENERATED事件、扁平化并保存
+        """
+        gir_statement_lists, stats = async_result.get()
+        ast_parser_registry.merge_stats(stats)
+        for index, gir_statements in enumerate(gir_statement_lists, chunk_start):
+            if not self.options.quiet:
+                print("GIR-Parsing:", unit_paths[index])
+            gir_statements = gir_parser.notify_unflattened_gir(lang_options[index], gir_statements)
+            gir = gir_parser.flatten_file_unit(units[index], lang_options[index], gir_statements)
+            gir_parser.add_unit_gir(units[index], gir)
 
     def run(self):
         """
@@ -397,31 +631,34 @@ class LangAnalysis:
             util.error_and_quit("No files found for analysis.")
 
         #print("all_units:", all_units)
-        current_node_id = self.init_start_stmt_id()
+        ast_parser_registry.pop_stats()
+        self.init_start_stmt_id()
 
         units_to_analyze = all_units
         if self.options.incremental:
             unit_level_checker = UnitLevelIncrementalChecker.unit_level_incremental_checker()
             units_to_analyze = []
             for unit_info in all_units:
-                current_node_id, previous_results = unit_level_checker.previous_lang_analysis_results(unit_info, current_node_id)#
-                if previous_results:
+                previous_results = unit_level_checker.previous_lang_analysis_results(unit_info)
+                # the previous GIR keeps its stmt ids, which must be in the previous range of the same unit
+                if previous_results and self.loader.is_in_previous_unit_stmt_id_range(
+                    unit_info.unit_path,
+                    min(stmt["stmt_id"] for stmt in previous_results),
+                    max(stmt["stmt_id"] for stmt in previous_results)
+                ):
+                    self.loader.keep_previous_unit_stmt_id_range(unit_info.unit_path)
                     gir_parser.add_unit_gir(unit_info, previous_results)
-                    current_node_id = self.adjust_node_id(current_node_id)
-
                 else:
                     units_to_analyze.append(unit_info)
 
-        for unit_info in units_to_analyze:
-            unit_path = ""
-            if self.options.strict_parse_mode:
-                unit_path = unit_info.original_path
-            else:
-                unit_path = unit_info.unit_path
-            current_node_id, gir = gir_parser.deal_with_file_unit(
-                current_node_id, unit_info, unit_path, lang_table = self.lang_table
-            )
-            gir_parser.add_unit_gir(unit_info, gir)
-            current_node_id = self.adjust_node_id(current_node_id)
+        if self.options.cores > 1 and len(units_to_analyze) > 1:
+            self.parse_units_in_parallel(gir_parser, units_to_analyze)
+        else:
+            for unit_info in units_to_analyze:
+                gir = gir_parser.deal_with_file_unit(unit_info, self.obtain_unit_path(unit_info), lang_table = self.lang_table)
+                gir_parser.add_unit_gir(unit_info, gir)
 
-        self.loader.save_max_gir_id(current_node_id)
+        if not self.options.quiet:
+            ast_parser_registry.report()
+        self.loader.update_unit_hashes(gir_parser.unit_hashes)
+        self.loader.save_max_gir_id(self.loader.get_next_unit_stmt_id())
@@ -7,6 +7,9 @@ import shutil
 import tempfile
 import subprocess
 import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from lian.util import util
 from lian.config import constants, config, lang_config
 import lian.util.data_model as dm
@@ -21,12 +24,15 @@ class WorkspaceBuilder:
         self.options = options
         self.clang_installed = False
         self.c_like_extensions = LANG_EXTENSIONS.get('c', []) + LANG_EXTENSIONS.get('cpp', [])
+        self.materialize_files = self.should_materialize_files()
         self.required_subdirs = [
             config.SOURCE_CODE_DIR, config.EXTERNS_DIR, config.FRONTEND_DIR,
             config.SEMANTIC_P1_DIR, config.SEMANTIC_P2_DIR, config.SEMANTIC_P3_DIR,
             config.STATE_FLOW_GRAPH_P2_DIR, config.STATE_FLOW_GRAPH_P3_DIR,
             config.TAINT_OUTPUT_DIR,
         ]
+        # 这两个目录由copytree_with_extension逐个文件同步，其余目录在每次分析时都会重新生成
+        self.synced_subdirs = {config.SOURCE_CODE_DIR, config.EXTERNS_DIR}
         self.header_keywords = [
             "stdio.h", "stdlib.h", "string.h", "math.h", "ctype.h", "time.h",
             "assert.h", "errno.h", "limits.h", "locale.h", "setjmp.h", "signal.h",
@@ -48,6 +54,11 @@ class WorkspaceBuilder:
             "memory_resource", "version", "concepts", "ranges", "span", "stop_token",
             "syncstream", "any", "optional", "variant"
         ]
+        self.system_include_pattern = re.compile(r'^\s*#include\s*<')
+        # 与逐个关键字执行 re.search(fr'\b{keyword}\b') 等价
+        self.header_keyword_pattern = re.compile(r'\b(?:' + '|'.join(self.header_keywords) + r')\b')
+        self.header_fingerprint = ""
+        self.preprocess_cache_dir = os.path.join(self.options.workspace, config.PREPROCESS_CACHE_DIR)
 
     def cleanup_directory(self, path):
         if not os.path.exists(path):
@@ -98,7 +109,31 @@ class WorkspaceBuilder:
     def obtain_file_extension(self, file_path):
         return os.path.splitext(file_path)[1].lower()
 
-    def preprocess_c_like_file(self, file_path):
+    def obtain_header_fingerprint(self, src_dir_path):
+        # 本地头文件的变化也会影响预处理结果，任何头文件变化都会让所有缓存失效
+        sha256 = hashlib.sha256()
+        header_dirs = [src_dir_path]
+        if self.options.included_headers:
+            header_dirs.append(self.options.included_headers)
+        for header_dir in header_dirs:
+            for root, dirs, files in os.walk(header_dir):
+                dirs.sort()
+                for file in sorted(files):
+                    file_name, extension = os.path.splitext(file)
+                    # *_processed files are rewritten by every run
+                    if extension.lower() not in config.C_LIKE_HEADER_EXTENSIONS or file_name.endswith("_processed"):
+                        continue
+                    file_path = os.path.join(root, file)
+                    file_stat = os.stat(file_path)
+                    sha256.update(f"{file_path}:{file_stat.st_size}:{file_stat.st_mtime_ns}\n".encode())
+        return sha256.hexdigest()
+
+    def prepare_c_like_file(self, file_path):
+        """
+        预处理的第一步，去掉系统头文件：
+        1. 生成 *_processed 文件
+        2. 返回需要执行的clang命令、输出文件和缓存key
+        """
         # check if the file exists
         if not os.path.isfile(file_path):
             util.error(f"Error: The file does not exist or the path is invalid: {file_path}")
@@ -112,17 +147,23 @@ class WorkspaceBuilder:
         new_file_path = f"{file_path_name}_processed{extension}"
 
         # Create a new file to store the modified content
-        with open(new_file_path, 'w') as new_file:
-            with open(file_path, 'r') as f:
-                for line in f:
-                    # skip the #include <
-                    if re.match(r'^\s*#include\s*<', line):
-                        continue
-                    # skip the keywords
-                    if any(re.search(fr'\b{keyword}\b', line) for keyword in self.header_keywords):
-                        continue
+        new_lines = []
+        with open(file_path, 'r') as f:
+            for line in f:
+                # skip the #include <
+                if self.system_include_pattern.match(line):
+                    continue
+                # skip the keywords
+                if self.header_keyword_pattern.search(line):
+                    continue
 
-                    new_file.write(line)
+                new_lines.append(line)
+        new_content = "".join(new_lines)
+        # do not write through a hardlink shared with the backup
+        if os.path.exists(new_file_path):
+            os.unlink(new_file_path)
+        with open(new_file_path, 'w') as new_file:
+            new_file.write(new_content)
 
         # Prepare the include headers if provided
         include_flags = []
@@ -131,28 +172,101 @@ class WorkspaceBuilder:
             include_flags.append(self.options.included_headers)
 
         # Depending on the language type, choose the right Clang command
+        if extension in LANG_EXTENSIONS.get('c', []) :
+            preprocessed_file = f"{file_path_name}.i"
+            command = ['clang', '-P', '-E', new_file_path, '-o', preprocessed_file] + include_flags
+        elif extension in LANG_EXTENSIONS.get('cpp', []):
+            preprocessed_file = f"{file_path_name}.ii"
+            command = ['clang++', '-P', '-E', new_file_path, '-o', preprocessed_file] + include_flags
+        else:
+            return
+
+        # 引号形式的 #include 相对于文件自身的目录查找，__FILE__ 也随路径变化，所以路径也是 key 的一部分
+        sha256 = hashlib.sha256()
+        sha256.update(f"{command[0]}\0{include_flags}\0{self.header_fingerprint}\0{os.path.abspath(new_file_path)}\0".encode())
+        sha256.update(new_content.encode("utf-8", errors = "surrogatepass"))
+        cache_key = sha256.hexdigest() + os.path.splitext(preprocessed_file)[1]
+        return (command, preprocessed_file, cache_key)
+
+    def run_c_like_preprocessing(self, preprocessing_task):
+        command, preprocessed_file, cache_key = preprocessing_task
+        cache_path = os.path.join(self.preprocess_cache_dir, cache_key)
+        if os.path.isfile(cache_path):
+            if os.path.exists(preprocessed_file):
+                os.unlink(preprocessed_file)
+            shutil.copyfile(cache_path, preprocessed_file)
+            return
+
         try:
-            if extension in LANG_EXTENSIONS.get('c', []) :
-                preprocessed_file = f"{file_path_name}.i"
-                subprocess.run(['clang', '-P', '-E', new_file_path, '-o', preprocessed_file] + include_flags, check=True)
-            elif extension in LANG_EXTENSIONS.get('cpp', []):
-                preprocessed_file = f"{file_path_name}.ii"
-                subprocess.run(['clang++', '-P', '-E', new_file_path, '-o', preprocessed_file] + include_flags, check=True)
+            subprocess.run(command, check=True)
         except subprocess.CalledProcessError:
             return
+        shutil.copyfile(preprocessed_file, cache_path)
+
+    def run_c_like_preprocessing_tasks(self, preprocessing_tasks):
+        os.makedirs(self.preprocess_cache_dir, exist_ok = True)
+        if self.options.cores > 1 and len(preprocessing_tasks) > 1:
+            # 线程只负责等待clang子进程，并发数即子进程数
+            with ThreadPoolExecutor(max_workers = self.options.cores) as pool:
+                list(pool.map(self.run_c_like_preprocessing, preprocessing_tasks))
+        else:
+            for preprocessing_task in preprocessing_tasks:
+                self.run_c_like_preprocessing(preprocessing_task)
 
-    def rescan_c_like_files(self, target_path):
+    def remove_unused_preprocessing_cache(self, preprocessing_tasks):
+        # 只保留本次扫描用到的缓存，旧的头文件指纹和改过的单元留下的条目都会被删除
+        used_cache_keys = {cache_key for _, _, cache_key in preprocessing_tasks}
+        for cache_key in os.listdir(self.preprocess_cache_dir):
+            if cache_key not in used_cache_keys:
+                os.unlink(os.path.join(self.preprocess_cache_dir, cache_key))
+
+    def preprocess_c_like_file(self, file_path):
+        preprocessing_task = self.prepare_c_like_file(file_path)
+        if preprocessing_task:
+            self.run_c_like_preprocessing_tasks([preprocessing_task])
+
+    def collect_c_like_files(self, target_path):
         if os.path.isdir(target_path):
+            file_paths = []
             for root, dirs, files in os.walk(target_path):
                 for file in files:
                     file_path = os.path.join(root, file)
-                    if os.path.isdir(file_path):
-                        self.rescan_c_like_files(file_path)
-                    elif os.path.isfile(file_path):
-                        self.preprocess_c_like_file(file_path)
+                    if os.path.isfile(file_path):
+                        file_paths.append(file_path)
+            return file_paths
+
+        if os.path.isfile(target_path):
+            return [target_path]
+        return []
+
+    def is_preprocessing_output(self, file_path, source_path_names):
+        # *_processed files and the .i/.ii files generated from a source in the same directory are left by the
+        # previous runs of the incremental mode
+        file_path_name, extension = os.path.splitext(file_path)
+        if file_path_name.endswith("_processed"):
+            return True
+        return extension.lower() in (".i", ".ii") and file_path_name in source_path_names
 
-        elif os.path.isfile(target_path):
-            self.preprocess_c_like_file(target_path)
+    def rescan_c_like_files(self, target_path):
+        file_paths = self.collect_c_like_files(target_path)
+        source_path_names = set()
+        for file_path in file_paths:
+            file_path_name, extension = os.path.splitext(file_path)
+            if extension.lower() not in (".i", ".ii"):
+                source_path_names.add(file_path_name)
+
+        # several files may be preprocessed into the same output file; as before, the last one wins
+        output_to_task = {}
+        for file_path in file_paths:
+            if self.is_preprocessing_output(file_path, source_path_names):
+                continue
+            preprocessing_task = self.prepare_c_like_file(file_path)
+            if preprocessing_task:
+                output_to_task.pop(preprocessing_task[1], None)
+                output_to_task[preprocessing_task[1]] = preprocessing_task
+        preprocessing_tasks = list(output_to_task.values())
+        self.run_c_like_preprocessing_tasks(preprocessing_tasks)
+        self.remove_unused_preprocessing_cache(preprocessing_tasks)
 
     def change_c_like_files(self, src_dir_path):
         if "c" in self.options.lang or "cpp" in self.options.lang:
@@ -160,11 +274,41 @@ class WorkspaceBuilder:
                 if not self.clang_installed:
                     self.clang_installed = shutil.which('clang') is not None and shutil.which('clang++') is not None
                 if self.clang_installed:
+                    self.header_fingerprint = self.obtain_header_fingerprint(src_dir_path)
                     self.rescan_c_like_files(src_dir_path)
 
                     LANG_EXTENSIONS["c"] = [".i"]
                     LANG_EXTENSIONS["cpp"] = [".ii"]
 
+    def should_materialize_files(self):
+        # C/C++ header preprocessing writes the processed files next to the sources, so the in-place mode still needs
+        # real files inside the workspace
+        if not self.options.in_place:
+            return True
+        if not self.options.enable_header_preprocess:
+            return False
+        return "c" in self.options.lang or "cpp" in self.options.lang
+
+    def link_or_copy_file(self, src_file, dst_file):
+        try:
+            if os.path.exists(dst_file):
+                os.unlink(dst_file)
+            os.link(src_file, dst_file)
+        except OSError:
+            # hardlinks do not work across devices
+            shutil.copy2(src_file, dst_file)
+
+    def sync_file(self, src_file, dst_file):
+        if os.path.exists(dst_file):
+            src_stat = os.stat(src_file)
+            dst_stat = os.stat(dst_file)
+            # copy2 keeps the mtime of the source, so an unchanged file is left as it is
+            if src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+                return
+            # the old file may be shared with the backup by a hardlink
+            os.unlink(dst_file)
+        shutil.copy2(src_file, dst_file)
+
     def copytree_with_extension(self, src, dst_path):
         if os.path.islink(src):
             return
@@ -178,7 +322,8 @@ class WorkspaceBuilder:
                 new_dst_path = os.path.join(dst_path, rel_path)
 
                 # Create directories in the destination path
-                os.makedirs(new_dst_path, exist_ok=True)
+                if self.materialize_files:
+                    os.makedirs(new_dst_path, exist_ok=True)
 
                 # Recursively call the function for each file with the specified extension
                 for file in files:
@@ -191,28 +336,67 @@ class WorkspaceBuilder:
             if ext in self.options.lang_extensions:
                 dst_file = os.path.realpath(os.path.join(dst_path, os.path.basename(src)))
                 src_file = os.path.realpath(src)
-                if not self.options.strict_parse_mode:
-                    shutil.copy2(src_file, dst_file)
+                if self.options.in_place:
+                    # only record where the file would be; the module symbols point to the original file
+                    if self.materialize_files:
+                        self.link_or_copy_file(src_file, dst_file)
+                elif not self.options.strict_parse_mode:
+                    self.sync_file(src_file, dst_file)
                 self.dst_file_to_src_file[dst_file] = src_file
 
+    def read_workspace_manifest(self, path):
+        manifest_path = os.path.join(path, config.WORKSPACE_MANIFEST_PATH)
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            util.warn(f"Failed to read the workspace manifest {manifest_path}: {e}")
+            return {}
+
+    def write_workspace_manifest(self, path, generation, subdirs):
+        manifest = {
+            "generation": generation,
+            "created_at": time.time(),
+            "subdirs": subdirs,
+        }
+        with open(os.path.join(path, config.WORKSPACE_MANIFEST_PATH), "w") as f:
+            json.dump(manifest, f, indent = 2)
+
     def backup_workspace(self):
+        """
+        将上一次的分析结果保存为bak代：
+        1. 分析结果目录会被本次分析完整重建，直接rename到bak中，不复制任何数据
+        2. src和externs会被本次同步更新，用硬链接做快照；内容变化的文件在同步时先解除链接再复制
+        3. 为bak和本次的workspace分别写入manifest，记录代数和包含的目录
+        """
         workspace_path = self.options.workspace
         if not os.path.exists(workspace_path):
             return
         bak_subdir = os.path.join(workspace_path, config.BACKUP_DIR)
+        generation = self.read_workspace_manifest(workspace_path).get("generation", 0)
 
         self.cleanup_directory(bak_subdir)
         os.makedirs(bak_subdir, exist_ok = True)
+        backup_subdirs = []
         for subdir in self.required_subdirs:
             subdir_path = os.path.join(workspace_path, subdir)
             if not os.path.exists(subdir_path):
                 continue
             subdir_bak_path = os.path.join(bak_subdir, subdir)
-            shutil.copytree(subdir_path, subdir_bak_path)
+            if subdir in self.synced_subdirs:
+                shutil.copytree(subdir_path, subdir_bak_path, copy_function = self.link_or_copy_file)
+            else:
+                os.rename(subdir_path, subdir_bak_path)
+            backup_subdirs.append(subdir)
         module_symbol_path = os.path.join(workspace_path, config.MODULE_SYMBOLS_PATH)
         module_symbol_bak_path = os.path.join(bak_subdir, config.MODULE_SYMBOLS_PATH)
         if os.path.exists(module_symbol_path):
-            shutil.copy2(module_symbol_path, module_symbol_bak_path)
+            self.link_or_copy_file(module_symbol_path, module_symbol_bak_path)
+
+        self.write_workspace_manifest(bak_subdir, generation, backup_subdirs)
+        self.write_workspace_manifest(workspace_path, generation + 1, self.required_subdirs)
 
     def run(self):
         workspace_path = self.options.workspace
@@ -248,6 +432,52 @@ class WorkspaceBuilder:
 
         return self.dst_file_to_src_file
 
+class FileHashCache:
+    """
+    持久化在workspace中的文件哈希缓存：
+    1. 记录每个文件的(path, size, mtime_ns, inode) -> hash
+    2. 文件状态没有变化时，不需要重新读取文件计算哈希
+    """
+    def __init__(self, path):
+        self.path = path
+        self.path_to_entry = {}
+        self.current_entries = {}
+        # 与本次扫描同一时刻被修改的文件，mtime可能无法反映之后的修改，不写入缓存
+        self.scan_start_ns = time.time_ns() - config.FILE_HASH_CACHE_RACY_NS
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        try:
+            for row in dm.DataModel().load(self.path):
+                self.path_to_entry[row.path] = (row.size, row.mtime_ns, row.inode, row.hash)
+        except Exception as e:
+            util.warn(f"Failed to load the file hash cache {self.path}: {e}")
+            self.path_to_entry = {}
+        return self
+
+    def lookup(self, file_path, file_stat):
+        entry = self.path_to_entry.get(file_path)
+        if entry is None:
+            return None
+        size, mtime_ns, inode, unit_hash = entry
+        if size != file_stat.st_size or mtime_ns != file_stat.st_mtime_ns or inode != file_stat.st_ino:
+            return None
+        self.current_entries[file_path] = entry
+        return unit_hash
+
+    def update(self, file_path, file_stat, unit_hash):
+        if file_stat.st_mtime_ns >= self.scan_start_ns:
+            return
+        self.current_entries[file_path] = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, unit_hash)
+
+    def save(self):
+        # 只保留本次扫描到的文件
+        rows = []
+        for file_path, (size, mtime_ns, inode, unit_hash) in self.current_entries.items():
+            rows.append({"path": file_path, "size": size, "mtime_ns": mtime_ns, "inode": inode, "hash": unit_hash})
+        dm.DataModel(rows, columns = ["path", "size", "mtime_ns", "inode", "hash"]).save(self.path)
+
 class ModuleSymbolsBuilder:
     def __init__(self, options, loader, dst_file_to_src_file = {}):
         self.global_module_id = config.START_INDEX
@@ -256,6 +486,7 @@ class ModuleSymbolsBuilder:
         self.loader = loader
         self.file_counter = 0
         self.dst_file_to_src_file = dst_file_to_src_file
+        self.units_to_hash = []
 
         self.target_src_path = os.path.join(self.options.workspace, config.SOURCE_CODE_DIR)
 
@@ -265,11 +496,45 @@ class ModuleSymbolsBuilder:
         return result
 
     def file_hash(self, file_path):
-        sha256 = hashlib.sha256()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            if hasattr(hashlib, "file_digest"):
+                return hashlib.file_digest(f, "sha256").hexdigest()
+
+            # hashlib.file_digest only exists since Python 3.11
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: f.read(config.FILE_HASH_CHUNK_SIZE), b""):
                 sha256.update(chunk)
-        return sha256.hexdigest()
+            return sha256.hexdigest()
+
+    def hash_units(self):
+        """
+        计算所有单元文件的哈希：
+        1. 文件的(size, mtime_ns, inode)与缓存一致时直接复用上次的哈希
+        2. 其余文件交给线程池计算（hashlib在计算时会释放GIL）
+        3. 将本次所有文件的状态写回缓存
+        """
+        hash_cache = FileHashCache(os.path.join(self.options.workspace, config.FILE_HASH_CACHE_PATH)).load()
+        files_to_hash = []
+        for unit_symbol, file_path in self.units_to_hash:
+            file_stat = os.stat(file_path)
+            unit_hash = hash_cache.lookup(file_path, file_stat)
+            if unit_hash is None:
+                files_to_hash.append((unit_symbol, file_path, file_stat))
+            else:
+                unit_symbol["hash"] = unit_hash
+
+        file_paths = [file_path for _, file_path, _ in files_to_hash]
+        if len(file_paths) > 1:
+            with ThreadPoolExecutor(max_workers = config.FILE_HASH_THREAD_COUNT) as pool:
+                unit_hashes = list(pool.map(self.file_hash, file_paths))
+        else:
+            unit_hashes = [self.file_hash(file_path) for file_path in file_paths]
+
+        for (unit_symbol, file_path, file_stat), unit_hash in zip(files_to_hash, unit_hashes):
+            unit_symbol["hash"] = unit_hash
+            hash_cache.update(file_path, file_stat, unit_hash)
+        hash_cache.save()
+        self.units_to_hash = []
 
     def scan_modules_by_scanning_workspace_dir(self, module_path, prefix_path,  parent_module_id = 0, is_extern = False):
         if util.is_empty(module_path):
@@ -300,9 +565,7 @@ class ModuleSymbolsBuilder:
                 exported_name = os.path.splitext(exported_name)[0]
                 exported_name = exported_name.replace(os.path.sep, ".")
 
-                unit_hash = self.file_hash(entry.path)
-
-                self.module_symbol_results.append({
+                unit_symbol = {
                     "module_id": unit_id,
                     "unit_id": unit_id,
                     "symbol_name": unit_name,
@@ -314,64 +577,89 @@ class ModuleSymbolsBuilder:
                     "original_path": self.dst_file_to_src_file.get(entry.path, ""),
                     "is_extern": is_extern,
                     "exported_name": exported_name,
-                    "hash": unit_hash
+                    "hash": None
+                }
+                self.module_symbol_results.append(unit_symbol)
+                self.units_to_hash.append((unit_symbol, entry.path))
+
+    def add_module_symbols_by_file_path(self, dst_file, prefix_path, is_extern = False):
+        remaining_path = dst_file.replace(prefix_path + "/", "")
+        path_list = remaining_path.split(os.sep)
+        counter = 0
+        while counter < len(path_list):
+            parent_path = os.path.join(prefix_path, os.sep.join(path_list[:counter]))
+            #print("parent_path: ", parent_path, path_list, remaining_path)
+            parent_module_id = self.file_path_to_id.get(parent_path, 0)
+            real_path = os.path.join(parent_path, path_list[counter])
+            if real_path in self.file_path_to_id:
+                counter += 1
+                continue
+
+            module_id = self.generate_module_id()
+            self.file_path_to_id[real_path] = module_id
+
+            if counter != len(path_list) - 1:
+                # this is directory
+                self.module_symbol_results.append({
+                    "module_id": module_id,
+                    "symbol_name": path_list[counter],
+                    "unit_path": real_path,
+                    "parent_module_id": parent_module_id,
+                    "symbol_type": SymbolKind.MODULE_SYMBOL,
+                    "is_extern": is_extern
                 })
+            else:
+                # this is unit file
+                self.file_counter += 1
+                unit_id = module_id
+                unit_name, unit_ext = os.path.splitext(path_list[counter])
+
+                exported_name = path_list[:-1]
+                exported_name.append(unit_name)
+                exported_name = ".".join(exported_name)
+
+                unit_symbol = {
+                    "module_id": unit_id,
+                    "unit_id": unit_id,
+                    "symbol_name": unit_name,
+                    "unit_ext": unit_ext,
+                    "lang": EXTENSIONS_LANG.get(unit_ext, "unknown"),
+                    "parent_module_id": parent_module_id,
+                    "symbol_type": SymbolKind.UNIT_SYMBOL,
+                    "unit_path": dst_file,
+                    "original_path": self.dst_file_to_src_file.get(dst_file, ""),
+                    "is_extern": is_extern,
+                    "exported_name": exported_name,
+                }
+                if self.options.in_place:
+                    # the incremental checker needs the hash before parsing; otherwise the parser fills it in from
+                    # the same read that feeds tree-sitter
+                    unit_symbol["hash"] = None
+                    if self.options.incremental:
+                        self.units_to_hash.append((unit_symbol, unit_symbol["original_path"]))
+                self.module_symbol_results.append(unit_symbol)
+
+            counter += 1
 
     def scan_modules_by_scanning_module_symbol_table(self):
         self.file_path_to_id = {}
         for dst_file in self.dst_file_to_src_file:
-            remaining_path = dst_file.replace(self.target_src_path + "/", "")
-            path_list = remaining_path.split(os.sep)
-            counter = 0
-            while counter < len(path_list):
-                parent_path = os.path.join(self.target_src_path, os.sep.join(path_list[:counter]))
-                #print("parent_path: ", parent_path, path_list, remaining_path)
-                parent_module_id = self.file_path_to_id.get(parent_path, 0)
-                real_path = os.path.join(parent_path, path_list[counter])
-                if real_path in self.file_path_to_id:
-                    counter += 1
-                    continue
-
-                module_id = self.generate_module_id()
-                self.file_path_to_id[real_path] = module_id
-
-                if counter != len(path_list) - 1:
-                    # this is directory
-                    self.module_symbol_results.append({
-                        "module_id": module_id,
-                        "symbol_name": path_list[counter],
-                        "unit_path": real_path,
-                        "parent_module_id": parent_module_id,
-                        "symbol_type": SymbolKind.MODULE_SYMBOL,
-                        "is_extern": False
-                    })
-                else:
-                    # this is unit file
-                    self.file_counter += 1
-                    unit_id = module_id
-                    unit_name, unit_ext = os.path.splitext(path_list[counter])
-
-                    exported_name = path_list[:-1]
-                    exported_name.append(unit_name)
-                    exported_name = ".".join(exported_name)
-
-                    self.module_symbol_results.append({
-                        "module_id": unit_id,
-                        "unit_id": unit_id,
-                        "symbol_name": unit_name,
-                        "unit_ext": unit_ext,
-                        "lang": EXTENSIONS_LANG.get(unit_ext, "unknown"),
-                        "parent_module_id": parent_module_id,
-                        "symbol_type": SymbolKind.UNIT_SYMBOL,
-                        "unit_path": dst_file,
-                        "original_path": self.dst_file_to_src_file.get(dst_file, ""),
-                        "is_extern": False,
-                        "exported_name": exported_name,
-                    })
-
-                counter += 1
+            self.add_module_symbols_by_file_path(dst_file, self.target_src_path)
+
+    def scan_modules_in_place(self, module_path, is_extern = False):
+        """
+        不复制源码时，直接根据WorkspaceBuilder记录的路径构建模块符号：
+        1. unit_path仍然是该文件在workspace中对应的路径，保证模块层级和exported_name不变
+        2. original_path指向原始文件，解析时直接读取原始文件
+        """
+        self.file_path_to_id = {}
+        prefix_path = os.path.realpath(module_path)
+        for dst_file in self.dst_file_to_src_file:
+            if dst_file.startswith(prefix_path + os.sep):
+                self.add_module_symbols_by_file_path(dst_file, prefix_path, is_extern)
 
-    def run(self):
+    def run(self, materialize_files = True):
+        self.materialize_files = materialize_files
         if self.options.strict_parse_mode:
             self.scan_modules_by_scanning_module_symbol_table()
             if len(self.module_symbol_results) == 0:
@@ -379,16 +667,27 @@ class ModuleSymbolsBuilder:
             self.loader.save_module_symbols(self.module_symbol_results)
             return
 
+        if self.options.in_place and not self.materialize_files:
+            self.scan_modules_in_place(os.path.join(self.options.workspace, config.SOURCE_CODE_DIR))
+            if len(self.module_symbol_results) == 0:
+                util.error_and_quit("No target file found.")
+            self.scan_modules_in_place(os.path.join(self.options.workspace, config.EXTERNS_DIR), is_extern = True)
+            self.hash_units()
+            self.loader.save_module_symbols(self.module_symbol_results)
+            return
+
         target_path = os.path.join(self.options.workspace, config.SOURCE_CODE_DIR + "/")
         self.scan_modules_by_scanning_workspace_dir(module_path = target_path, prefix_path = target_path)
         if len(self.module_symbol_results) == 0:
             util.error_and_quit("No target file found.")
         target_path = os.path.join(self.options.workspace, config.EXTERNS_DIR + "/")
         self.scan_modules_by_scanning_workspace_dir(module_path = target_path, prefix_path = target_path, is_extern = True)
+        self.hash_units()
         self.loader.save_module_symbols(self.module_symbol_results)
 
 def run(options, loader):
-    dst_file_to_src_file = WorkspaceBuilder(options).run()
+    workspace_builder = WorkspaceBuilder(options)
+    dst_file_to_src_file = workspace_builder.run()
     #print("dst_file_to_src_file", dst_file_to_src_file)
-    ModuleSymbolsBuilder(options, loader, dst_file_to_src_file).run()
+    ModuleSymbolsBuilder(options, loader, dst_file_to_src_file).run(workspace_builder.materialize_files)
     loader.export()
@@ -11,6 +11,7 @@ import os
 
 import yaml
 from lian.config import config
+from lian.config.constants import TAG_KEYWORD
 from lian.util import util
 
 class Source:
@@ -96,6 +97,118 @@ class SourceCodeRule:
     lang: str = config.ANY_LANG
 
 
+def split_rule_name(rule_name):
+    """
+    把 class_name.method_name 形式的规则名预先拆分，并从最后一段开始排列；
+    TAG_KEYWORD.ANYNAME 匹配任意一段，记为 None
+    """
+    if not isinstance(rule_name, str):
+        return None
+    return tuple(
+        None if part == TAG_KEYWORD.ANYNAME else part
+        for part in reversed(rule_name.split('.'))
+    )
+
+def match_access_path(reversed_parts, access_path):
+    """判断 access_path 的最后几段是否与预先拆分的规则名一致"""
+    if reversed_parts is None or len(access_path) < len(reversed_parts):
+        return False
+    for i, part in enumerate(reversed_parts):
+        if part is not None and part != access_path[-i - 1].key:
+            return False
+    return True
+
+class IndexedRules:
+    """
+    一类规则（source/sink/propagation）编译后的索引，所有查询都按规则原来的顺序返回：
+    1. by_operation: operation -> rules
+    2. by_name: name -> rules（不区分 operation）
+    3. by_last_segment: (operation, 规则名最后一段) -> rules；最后一段为通配符的规则放在 (operation, None) 中
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.rule_positions = {}
+        self.reversed_name_parts = {}
+        self.by_operation = {}
+        self.by_name = {}
+        self.by_last_segment = {}
+        for position, rule in enumerate(rules):
+            self.rule_positions[id(rule)] = position
+            self.by_operation.setdefault(rule.operation, []).append(rule)
+            if rule.name is None or isinstance(rule.name, str):
+                self.by_name.setdefault(rule.name, []).append(rule)
+            reversed_parts = split_rule_name(rule.name)
+            self.reversed_name_parts[id(rule)] = reversed_parts
+            if reversed_parts:
+                self.by_last_segment.setdefault((rule.operation, reversed_parts[0]), []).append(rule)
+
+    def sort(self, rules):
+        return sorted(rules, key = lambda rule: self.rule_positions[id(rule)])
+
+    def with_operation(self, operation):
+        return self.by_operation.get(operation, [])
+
+    def with_name(self, name):
+        return self.by_name.get(name, [])
+
+    def with_names(self, names):
+        """名字在 names 中的规则，每条只出现一次"""
+        matched = {}
+        for name in names:
+            for rule in self.by_name.get(name, []):
+                matched[id(rule)] = rule
+        return self.sort(matched.values())
+
+    def match_method_name(self, rule, access_path):
+        return match_access_path(self.reversed_name_parts[id(rule)], access_path)
+
+    def with_method_name(self, operation, access_path):
+        """operation 相同、且规则名与 access_path 的最后几段匹配的规则"""
+        if len(access_path) == 0:
+            return []
+        candidates = self.by_last_segment.get((operation, access_path[-1].key), [])
+        wildcards = self.by_last_segment.get((operation, None), [])
+        if wildcards:
+            candidates = self.sort(candidates + wildcards)
+        return [rule for rule in candidates if self.match_method_name(rule, access_path)]
+
+class CodeRuleIndex:
+    """
+    从代码中导出的规则（如 CodeQL 结果）按 line_num -> unit_path -> [symbol_name] 索引。
+    unit_path 仍按子串匹配，但只需检查同一行上的规则
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.line_to_unit_paths = {}
+        for rule in rules:
+            unit_paths = self.line_to_unit_paths.setdefault(rule.line_num, {})
+            unit_paths.setdefault(rule.unit_path, []).append(rule.symbol_name)
+
+    def has_line(self, line_num):
+        return line_num in self.line_to_unit_paths
+
+    def match(self, line_num, operation, unit_path = None):
+        """unit_path 为 None 时不检查文件"""
+        unit_paths = self.line_to_unit_paths.get(line_num)
+        if not unit_paths:
+            return False
+        for rule_unit_path, symbol_names in unit_paths.items():
+            if unit_path is not None and rule_unit_path not in unit_path:
+                continue
+            for symbol_name in symbol_names:
+                if symbol_name in operation:
+                    return True
+        return False
+
+class CompiledRules:
+    """某一种语言可用的全部规则的索引"""
+    def __init__(self, sources, sinks, propagations, sources_from_code, sinks_from_code):
+        self.sources = IndexedRules(sources)
+        self.sinks = IndexedRules(sinks)
+        self.propagations = IndexedRules(propagations)
+        self.sources_from_code = CodeRuleIndex(sources_from_code)
+        self.sinks_from_code = CodeRuleIndex(sinks_from_code)
+
 class RuleManager:
     def __init__(self, default_settings = None):
         self.all_sources = []
@@ -109,6 +222,8 @@ class RuleManager:
         self.taint_source_from_code = config.TAINT_SOURCE_FROM_CODE
         self.taint_sink_from_code = config.TAINT_SINK_FROM_CODE
         self.default_settings = default_settings
+        # lang -> CompiledRules
+        self.lang_to_compiled_rules = {}
         if default_settings:
             self.taint_source = os.path.join(default_settings, "source.yaml")
             self.taint_sink = os.path.join(default_settings, "sink.yaml")
@@ -232,6 +347,45 @@ class RuleManager:
                     )
                     self.all_sinks_from_code.append(new_rule)
 
+        self.compile()
+
+    def compile(self):
+        """
+        规则加载后编译索引；lang 为 None 时包含所有语言的规则
+        """
+        self.lang_to_compiled_rules = {}
+        langs = set()
+        for rules in (self.all_sources, self.all_sinks, self.all_propagations,
+                      self.all_sources_from_code, self.all_sinks_from_code):
+            for rule in rules:
+                langs.add(rule.lang)
+        for lang in langs:
+            self.get_compiled_rules(lang)
+        self.get_compiled_rules(None)
+
+    def get_compiled_rules(self, lang = None):
+        """
+        lang 语言的规则以及适用于任意语言的规则，保持原来的顺序
+        """
+        compiled_rules = self.lang_to_compiled_rules.get(lang)
+        if compiled_rules is not None:
+            return compiled_rules
+
+        def select(rules):
+            if lang is None:
+                return rules
+            return [rule for rule in rules if rule.lang in (lang, config.ANY_LANG)]
+
+        compiled_rules = CompiledRules(
+            select(self.all_sources),
+            select(self.all_sinks),
+            select(self.all_propagations),
+            select(self.all_sources_from_code),
+            select(self.all_sinks_from_code),
+        )
+        self.lang_to_compiled_rules[lang] = compiled_rules
+        return compiled_rules
+
     def add_rule(self, rule_type, rule):
         pass
 
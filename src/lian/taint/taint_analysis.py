@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 import json
 import os, sys
+import time
 from collections import deque
 
 import lian.config.config as config
@@ -9,7 +10,7 @@ import networkx as nx
 from lian.events.default_event_handlers.this_field_write import access_path_formatter
 from lian.util import util
 from lian.util.readable_gir import get_gir_str
-from lian.taint.rule_manager import RuleManager, Rule
+from lian.taint.rule_manager import RuleManager, Rule, match_access_path, split_rule_name
 from lian.core.sfg_dumper import SFGDumper
 from lian.config.constants import (
     ANALYSIS_PHASE_ID,
@@ -20,22 +21,37 @@ from lian.config.constants import (
 from lian.taint.taint_structs import (
     TaintEnv,
     Flow,
+    CompactSFG,
+    edge_mask,
 )
 import traceback
 
+SYMBOL_STATE_MASK = edge_mask(SFG_EDGE_KIND.SYMBOL_STATE)
+SYMBOL_IS_USED_MASK = edge_mask(SFG_EDGE_KIND.SYMBOL_IS_USED)
+SYMBOL_IS_DEFINED_MASK = edge_mask(SFG_EDGE_KIND.SYMBOL_IS_DEFINED)
+SYMBOL_FLOW_MASK = edge_mask(SFG_EDGE_KIND.SYMBOL_FLOW, SFG_EDGE_KIND.INDIRECT_SYMBOL_FLOW)
+STATE_INCLUSION_MASK = edge_mask(SFG_EDGE_KIND.STATE_INCLUSION, SFG_EDGE_KIND.INDIRECT_STATE_INCLUSION)
+STATE_COPY_MASK = edge_mask(SFG_EDGE_KIND.STATE_COPY)
+
 class PathFinder:
     """
     负责污点传播与路径重建的辅助类。
     将传播逻辑和路径查找从 TaintAnalysis 中拆分出来，保持主流程简洁。
+    传播和路径查找都在 CompactSFG 的整数节点编号上进行，只在返回结果时取出 SFGNode。
     """
 
     def __init__(self, taint_analysis):
         self.ta = taint_analysis
+        self._stmt_propagates = {}
 
     @property
     def sfg(self):
         return self.ta.sfg
 
+    @property
+    def sfg_view(self):
+        return self.ta.sfg_view
+
     @property
     def taint_manager(self):
         return self.ta.taint_manager
@@ -46,18 +62,16 @@ class PathFinder:
 
     def _get_node_tag(self, u):
         """获取节点的污点标记。对于 STMT 节点，其标记来源于它所使用的 SYMBOL。"""
-        if u.node_type == SFG_NODE_KIND.SYMBOL:
-            return self.taint_manager.get_symbol_tag(u.node_id)
-        elif u.node_type == SFG_NODE_KIND.STATE:
-            return self.taint_manager.get_state_tag(u.node_id)
-        elif u.node_type == SFG_NODE_KIND.STMT:
+        view = self.sfg_view
+        node_type = view.node_types[u]
+        if node_type == SFG_NODE_KIND.SYMBOL:
+            return self.taint_manager.get_symbol_tag(view.node_ids[u])
+        elif node_type == SFG_NODE_KIND.STATE:
+            return self.taint_manager.get_state_tag(view.node_ids[u])
+        elif node_type == SFG_NODE_KIND.STMT:
             u_tag = 0
-            for pred in self.sfg.predecessors(u):
-                edge_data = self.sfg.get_edge_data(pred, u)
-                if edge_data:
-                    for data in edge_data.values():
-                        if data.edge_type == SFG_EDGE_KIND.SYMBOL_IS_USED:
-                            u_tag |= self.taint_manager.get_symbol_tag(pred.node_id)
+            for pred in view.predecessors(u, SYMBOL_IS_USED_MASK):
+                u_tag |= self.taint_manager.get_symbol_tag(view.node_ids[pred])
             return u_tag
         return 0
 
@@ -69,255 +83,345 @@ class PathFinder:
         in_worklist.add(node)
 
     def _init_source_contamination(self, source, tag, worklist, in_worklist):
-        """对初始 source 节点进行污染标记"""
-        if source.node_type == SFG_NODE_KIND.SYMBOL:
-            self.taint_manager.set_symbol_tag(source.node_id, tag)
+        """对初始 source 节点进行污染标记（与已有 tag 按位或，多个 source 可能共享节点）"""
+        view = self.sfg_view
+        node_type = view.node_types[source]
+        source_id = view.node_ids[source]
+        if node_type == SFG_NODE_KIND.SYMBOL:
+            self.taint_manager.set_symbol_tag(source_id, self.taint_manager.get_symbol_tag(source_id) | tag)
             self._enqueue(worklist, in_worklist, source)
             # 污染变量对应的初始状态
-            for v in self.sfg.successors(source):
-                edge_data = self.sfg.get_edge_data(source, v)
-                if edge_data:
-                    for data in edge_data.values():
-                        if data.edge_type == SFG_EDGE_KIND.SYMBOL_STATE:
-                            self.taint_manager.set_states_tag([v.node_id], tag)
-                            self._enqueue(worklist, in_worklist, v)
-        elif source.node_type == SFG_NODE_KIND.STATE:
-            self.taint_manager.set_states_tag([source.node_id], tag)
+            for v in view.successors(source, SYMBOL_STATE_MASK):
+                state_id = view.node_ids[v]
+                self.taint_manager.set_states_tag([state_id], self.taint_manager.get_state_tag(state_id) | tag)
+                self._enqueue(worklist, in_worklist, v)
+        elif node_type == SFG_NODE_KIND.STATE:
+            self.taint_manager.set_states_tag([source_id], self.taint_manager.get_state_tag(source_id) | tag)
             self._enqueue(worklist, in_worklist, source)
-        elif source.node_type == SFG_NODE_KIND.STMT:
+        elif node_type == SFG_NODE_KIND.STMT:
             self._enqueue(worklist, in_worklist, source)
 
     def _propagate_from_symbol(self, u, u_tag, worklist, in_worklist):
         """处理从 SYMBOL 节点向下的传播"""
-        for v in self.sfg.successors(u):
-            edge_data = self.sfg.get_edge_data(u, v)
-            if edge_data:
-                for data in edge_data.values():
-                    etype = data.edge_type
-                    # 传播到状态或使用该变量的语句
-                    if etype == SFG_EDGE_KIND.SYMBOL_STATE:
-                        v_tag = self.taint_manager.get_state_tag(v.node_id)
-                        if (u_tag | v_tag) != v_tag:
-                            self.taint_manager.set_states_tag([v.node_id], u_tag | v_tag)
-                            self._enqueue(worklist, in_worklist, v)
-                    elif etype == SFG_EDGE_KIND.SYMBOL_IS_USED:
-                        # STMT 的 tag 来自其 use 的 SYMBOL；当 SYMBOL 的 tag 发生变化时，重新处理该 STMT。
-                        self._enqueue(worklist, in_worklist, v)
-                    elif etype in (SFG_EDGE_KIND.SYMBOL_FLOW, SFG_EDGE_KIND.INDIRECT_SYMBOL_FLOW):
-                        # SYMBOL -> SYMBOL 的数据流传播
-                        if v.node_type != SFG_NODE_KIND.SYMBOL:
-                            continue
-                        v_tag = self.taint_manager.get_symbol_tag(v.node_id)
-                        if (u_tag | v_tag) != v_tag:
-                            self.taint_manager.set_symbol_tag(v.node_id, u_tag | v_tag)
-                            self._enqueue(worklist, in_worklist, v)
+        view = self.sfg_view
+        for v, edge_bit, _ in view.out_edges(u):
+            # 传播到状态或使用该变量的语句
+            if edge_bit & SYMBOL_STATE_MASK:
+                v_tag = self.taint_manager.get_state_tag(view.node_ids[v])
+                if (u_tag | v_tag) != v_tag:
+                    self.taint_manager.set_states_tag([view.node_ids[v]], u_tag | v_tag)
+                    self._enqueue(worklist, in_worklist, v)
+            elif edge_bit & SYMBOL_IS_USED_MASK:
+                # STMT 的 tag 来自其 use 的 SYMBOL；当 SYMBOL 的 tag 发生变化时，重新处理该 STMT。
+                self._enqueue(worklist, in_worklist, v)
+            elif edge_bit & SYMBOL_FLOW_MASK:
+                # SYMBOL -> SYMBOL 的数据流传播
+                if view.node_types[v] != SFG_NODE_KIND.SYMBOL:
+                    continue
+                v_tag = self.taint_manager.get_symbol_tag(view.node_ids[v])
+                if (u_tag | v_tag) != v_tag:
+                    self.taint_manager.set_symbol_tag(view.node_ids[v], u_tag | v_tag)
+                    self._enqueue(worklist, in_worklist, v)
 
     def _propagate_from_state(self, u, u_tag, worklist, in_worklist):
         """处理从 STATE 节点向下的传播"""
+        view = self.sfg_view
         # 1. 传播到指向该值的变量 (逆向回溯)
-        for v in self.sfg.predecessors(u):
-            edge_data = self.sfg.get_edge_data(v, u)
-            if edge_data:
-                for data in edge_data.values():
-                    if data.edge_type in (SFG_EDGE_KIND.SYMBOL_STATE, SFG_EDGE_KIND.STATE_INCLUSION):
-                        v_tag = self.taint_manager.get_symbol_tag(v.node_id)
-                        if (u_tag | v_tag) != v_tag:
-                            self.taint_manager.set_symbol_tag(v.node_id, u_tag | v_tag)
-                            self._enqueue(worklist, in_worklist, v)
+        for v in view.predecessors(u, SYMBOL_STATE_MASK | STATE_INCLUSION_MASK):
+            v_tag = self.taint_manager.get_symbol_tag(view.node_ids[v])
+            if (u_tag | v_tag) != v_tag:
+                self.taint_manager.set_symbol_tag(view.node_ids[v], u_tag | v_tag)
+                self._enqueue(worklist, in_worklist, v)
 
         # 2. 传播到其包含的子状态 (inclusion)
-        for v in self.sfg.successors(u):
-            if v.node_type == SFG_NODE_KIND.STATE:
-                edge_data = self.sfg.get_edge_data(u, v)
-                if edge_data:
-                    for data in edge_data.values():
-                        if data.edge_type in (SFG_EDGE_KIND.STATE_INCLUSION,
-                                                            SFG_EDGE_KIND.INDIRECT_STATE_INCLUSION):
-                            v_tag = self.taint_manager.get_state_tag(v.node_id)
-                            if (u_tag | v_tag) != v_tag:
-                                self.taint_manager.set_states_tag([v.node_id], u_tag | v_tag)
-                                self._enqueue(worklist, in_worklist, v)
+        for v in view.successors(u, STATE_INCLUSION_MASK):
+            if view.node_types[v] != SFG_NODE_KIND.STATE:
+                continue
+            v_tag = self.taint_manager.get_state_tag(view.node_ids[v])
+            if (u_tag | v_tag) != v_tag:
+                self.taint_manager.set_states_tag([view.node_ids[v]], u_tag | v_tag)
+                self._enqueue(worklist, in_worklist, v)
 
     def _propagate_from_stmt(self, u, u_tag, worklist, in_worklist):
         """处理从 STMT 节点向下的传播"""
-        # 根据规则判断语句是否传播污点
-        if self.rule_applier.apply_propagation_rules(u):
-            for v in self.sfg.successors(u):
-                edge_data = self.sfg.get_edge_data(u, v)
-                if edge_data:
-                    for data in edge_data.values():
-                        # 传播到该语句定义的变量
-                        if data.edge_type == SFG_EDGE_KIND.SYMBOL_IS_DEFINED:
-                            v_tag = self.taint_manager.get_symbol_tag(v.node_id)
-                            if (u_tag | v_tag) != v_tag:
-                                self.taint_manager.set_symbol_tag(v.node_id, u_tag | v_tag)
-                                # 只有当目标 SYMBOL 的 tag 发生变化时才入队，避免环路导致无限传播。
-                                self._enqueue(worklist, in_worklist, v)
-                            else:
-                                # 逻辑补丁：如果该 SYMBOL 已经带着相同 tag，但本轮从未被处理过，
-                                # 仍需入队一次以触发其后继 STMT 的分析（否则可能“永远不入队”）。
-                                if getattr(self, "_processed_nodes", None) is not None and v not in self._processed_nodes:
-                                    self._enqueue(worklist, in_worklist, v)
-            # object_call_stmt: target = receiver.field(args)
-            # 当 args 携带污点时，receiver 也可能被副作用污染（常见于可变对象的 method call）。
-            # 在 SFG 中 receiver_symbol 是该 STMT 的前驱（SYMBOL_IS_USED, pos==0），这里将 u_tag 回写到 receiver。
-            if getattr(u, "name", None) == "object_call_stmt":
-                for pred in self.sfg.predecessors(u):
-                    edge_data = self.sfg.get_edge_data(pred, u)
-                    if not edge_data:
-                        continue
-                    for data in edge_data.values():
-                        weight = data
-                        if not weight:
-                            continue
-                        if weight.edge_type != SFG_EDGE_KIND.SYMBOL_IS_USED:
-                            continue
-                        # object_call 的 receiver 占用 pos==0
-                        if getattr(weight, "pos", -1) != 0:
-                            continue
-                        if pred.node_type != SFG_NODE_KIND.SYMBOL:
-                            continue
-                        pred_tag = self.taint_manager.get_symbol_tag(pred.node_id)
-                        if (u_tag | pred_tag) != pred_tag:
-                            self.taint_manager.set_symbol_tag(pred.node_id, u_tag | pred_tag)
-                            self._enqueue(worklist, in_worklist, pred)
-                        else:
-                            if getattr(self, "_processed_nodes", None) is not None and pred not in self._processed_nodes:
-                                self._enqueue(worklist, in_worklist, pred)
-                        # receiver 只有一个，找到即可
-                        break
+        view = self.sfg_view
+        if not self._stmt_propagates_taint(u):
+            return
 
+        # 传播到该语句定义的变量
+        for v in view.successors(u, SYMBOL_IS_DEFINED_MASK):
+            v_tag = self.taint_manager.get_symbol_tag(view.node_ids[v])
+            if (u_tag | v_tag) != v_tag:
+                self.taint_manager.set_symbol_tag(view.node_ids[v], u_tag | v_tag)
+                # 只有当目标 SYMBOL 的 tag 发生变化时才入队，避免环路导致无限传播。
+                self._enqueue(worklist, in_worklist, v)
+            elif v not in self._processed_nodes:
+                # 逻辑补丁：如果该 SYMBOL 已经带着相同 tag，但本轮从未被处理过，
+                # 仍需入队一次以触发其后继 STMT 的分析（否则可能“永远不入队”）。
+                self._enqueue(worklist, in_worklist, v)
+        # object_call_stmt: target = receiver.field(args)
+        # 当 args 携带污点时，receiver 也可能被副作用污染（常见于可变对象的 method call）。
+        # 在 SFG 中 receiver_symbol 是该 STMT 的前驱（SYMBOL_IS_USED, pos==0），这里将 u_tag 回写到 receiver。
+        if view.nodes[u].name == "object_call_stmt":
+            for pred, edge_bit, pos in view.in_edges(u):
+                # object_call 的 receiver 占用 pos==0
+                if not (edge_bit & SYMBOL_IS_USED_MASK) or pos != 0:
+                    continue
+                if view.node_types[pred] != SFG_NODE_KIND.SYMBOL:
+                    continue
+                pred_tag = self.taint_manager.get_symbol_tag(view.node_ids[pred])
+                if (u_tag | pred_tag) != pred_tag:
+                    self.taint_manager.set_symbol_tag(view.node_ids[pred], u_tag | pred_tag)
+                    self._enqueue(worklist, in_worklist, pred)
+                elif pred not in self._processed_nodes:
+                    self._enqueue(worklist, in_worklist, pred)
 
     def propagate_taint(self, source):
         """
         从给定的 source 开始在 SFG 中传播污点。
         返回为该 source 分配的位标记 (tag)。
         """
-        tag_info = Rule(name=f"Source_{source.def_stmt_id}", operation="source_propagation", rule_id=id(source))
-        tag = self.taint_manager.add_and_update_tag_bv(tag_info, 0)
+        return self.propagate_taints([source])[0]
 
+    def propagate_taints(self, sources):
+        """
+        为每个 source 分配一位 tag，所有 source 在同一个 worklist 中一起传播到不动点。
+        传播只做按位或，因此每一位的结果与单独传播对应 source 的结果相同。
+        返回与 sources 一一对应的 tag。
+        """
+        view = self.sfg_view
         worklist = deque()
         in_worklist = set()
         # 记录本轮传播中“已经实际出队并处理过”的节点。
         # 用于修复：某些节点在进入传播前已带有目标 tag，但从未入队，导致其后继语句永远不被处理。
         self._processed_nodes = set()
-        self._init_source_contamination(source, tag, worklist, in_worklist)
+        self._stmt_propagates = {}
+        tags = []
+        for source in sources:
+            tag_info = Rule(name=f"Source_{source.def_stmt_id}", operation="source_propagation", rule_id=id(source))
+            tag = self.taint_manager.add_and_update_tag_bv(tag_info, 0)
+            tags.append(tag)
+            source_index = view.index_of(source)
+            if source_index >= 0:
+                self._init_source_contamination(source_index, tag, worklist, in_worklist)
 
         # BFS 传播
         while worklist:
             u = worklist.popleft()
             in_worklist.discard(u)
             self._processed_nodes.add(u)
-            # 给每个“实际处理过”的节点打标（用于导出 SFG 时染色）
-            try:
-                self.taint_manager.mark_processed_node(u)
-            except Exception:
-                pass
             u_tag = self._get_node_tag(u)
 
             if u_tag == 0:
                 continue
 
-            if u.node_type == SFG_NODE_KIND.SYMBOL:
+            node_type = view.node_types[u]
+            if node_type == SFG_NODE_KIND.SYMBOL:
                 self._propagate_from_symbol(u, u_tag, worklist, in_worklist)
-            elif u.node_type == SFG_NODE_KIND.STATE:
+            elif node_type == SFG_NODE_KIND.STATE:
                 self._propagate_from_state(u, u_tag, worklist, in_worklist)
-            elif u.node_type == SFG_NODE_KIND.STMT:
+            elif node_type == SFG_NODE_KIND.STMT:
                 self._propagate_from_stmt(u, u_tag, worklist, in_worklist)
-        # 清理本轮状态，避免跨 source 互相影响
+
+        # 给每个“实际处理过”的节点打标（用于导出 SFG 时染色）
+        for u in self._processed_nodes:
+            self.taint_manager.mark_processed_node(view.nodes[u])
+        # 清理本轮状态；语句是否传播的缓存保留给随后的路径查找，下一次传播开始时重置
         self._processed_nodes = set()
-        return tag
+        return tags
+
+    def _stmt_propagates_taint(self, u):
+        """根据规则判断语句是否传播污点；同一语句的判断结果在本轮传播及路径查找中缓存"""
+        propagates = self._stmt_propagates.get(u)
+        if propagates is None:
+            propagates = bool(self.rule_applier.apply_propagation_rules(self.sfg_view.nodes[u]))
+            self._stmt_propagates[u] = propagates
+        return propagates
 
-    def reconstruct_define_use_path(self, source, sink):
+    def _taint_successors(self, u, tag):
         """
-        采用深度优先的方式从 source 开始遍历 SFG 来寻找路径。
-        当遍历到 sink_stmt 时，则找到路径；
-        如果遍历完整个可达子图都没有遇到 sink，则选一条遍历过程中产生的路径，并加上 sink_stmt。
+        沿传播时使用的边（包括 STATE 回写 SYMBOL 等逆向边）给出 u 的后继，
+        只保留带有 tag 中某一位的 SYMBOL/STATE；STMT 的 tag 来自其 use 的 SYMBOL，不再额外检查。
         """
-        visited = set()
-        longest_path = []
-
-        def dfs(u, path_stmts):
-            nonlocal longest_path
-            if u in visited:
-                return None
-            visited.add(u)
-
-            # 如果当前节点是语句，加入路径
-            new_path = list(path_stmts)
-            if u.node_type == SFG_NODE_KIND.STMT:
-                if not new_path or new_path[-1] != u:
-                    new_path.append(u)
-
-            # 记录遍历过程中最长的一条路径作为备选
-            if len(new_path) >= len(longest_path):
-                longest_path = new_path
-
-            # 到达终点
-            if u == sink:
-                return new_path
-
-            # 深度优先遍历继承者
-            for v in self.sfg.successors(u):
-                result = dfs(v, new_path)
-                if result:
-                    return result
+        view = self.sfg_view
+        node_type = view.node_types[u]
+        if node_type == SFG_NODE_KIND.SYMBOL:
+            for v, edge_bit, _ in view.out_edges(u):
+                if edge_bit & SYMBOL_IS_USED_MASK:
+                    yield v
+                elif edge_bit & (SYMBOL_STATE_MASK | SYMBOL_FLOW_MASK) and self._get_node_tag(v) & tag:
+                    yield v
+        elif node_type == SFG_NODE_KIND.STATE:
+            for v in view.predecessors(u, SYMBOL_STATE_MASK | STATE_INCLUSION_MASK):
+                if self._get_node_tag(v) & tag:
+                    yield v
+            for v in view.successors(u, STATE_INCLUSION_MASK):
+                if view.node_types[v] == SFG_NODE_KIND.STATE and self._get_node_tag(v) & tag:
+                    yield v
+        elif node_type == SFG_NODE_KIND.STMT:
+            if not self._stmt_propagates_taint(u):
+                return
+            for v in view.successors(u, SYMBOL_IS_DEFINED_MASK):
+                if self._get_node_tag(v) & tag:
+                    yield v
+            if view.nodes[u].name == "object_call_stmt":
+                for pred, edge_bit, pos in view.in_edges(u):
+                    if edge_bit & SYMBOL_IS_USED_MASK and pos == 0 and self._get_node_tag(pred) & tag:
+                        yield pred
+
+    def _find_witnesses(self, source, sink, successors, k):
+        """
+        0-1 BFS：进入 STMT 节点的代价为 1，其余节点为 0，因此按路径上的语句个数从短到长找到 sink。
+        每条候选路径用 (节点, 父路径) 的链表表示，其语句序列编号为 chain id；
+        每个节点只接受至多 k 个互不相同的语句序列，重复的序列不占名额。k == 1 时即普通的父指针 BFS，复杂度线性。
+        返回至多 k 条语句序列互不相同的路径（节点编号列表）。
+        """
+        node_types = self.sfg_view.node_types
+        # chains[chain_id] = (语句节点, 父 chain id)；0 表示空序列
+        chains = [None]
+        chain_ids = {}
+
+        def extend(chain, v):
+            if node_types[v] != SFG_NODE_KIND.STMT:
+                return chain
+            key = (v, chain)
+            chain_id = chain_ids.get(key)
+            if chain_id is None:
+                chain_id = len(chains)
+                chains.append(key)
+                chain_ids[key] = chain_id
+            return chain_id
+
+        node_chains = {}
+        witnesses = []
+        queue = deque([(source, None, extend(0, source))])
+        while queue:
+            u, path, chain = queue.popleft()
+            seen = node_chains.setdefault(u, set())
+            if chain in seen or len(seen) >= k:
+                continue
+            seen.add(chain)
+            path = (u, path)
 
-            return None
+            if u == sink:
+                stmts = []
+                while chain:
+                    stmt, chain = chains[chain]
+                    stmts.append(stmt)
+                stmts.reverse()
+                witnesses.append(stmts)
+                if len(witnesses) >= k:
+                    break
+                continue
 
-        final_path = dfs(source, [])
+            for v in successors(u):
+                if len(node_chains.get(v, ())) >= k:
+                    continue
+                # k > 1 时只保留简单路径
+                if k > 1 and self._path_contains(path, v):
+                    continue
+                if node_types[v] == SFG_NODE_KIND.STMT:
+                    queue.append((v, path, extend(chain, v)))
+                else:
+                    queue.appendleft((v, path, chain))
+        return witnesses
+
+    def _path_contains(self, path, node):
+        while path is not None:
+            if path[0] == node:
+                return True
+            path = path[1]
+        return False
 
-        if final_path is None:
-            # 如果没找到 sink，选一条遍历到的路径并强行加上 sink
-            if not longest_path or longest_path[-1] != sink:
-                final_path = longest_path + [sink]
-            else:
-                final_path = longest_path
+    def reconstruct_define_use_path(self, source, sink, tag = -1, k = 1):
+        """
+        为 source -> sink 的污点流找出语句个数最少的路径作为证据（witness），k > 1 时给出至多 k 条最短路径。
+        优先沿传播时实际走过的边、在带有该 source 的 tag 的子图中查找；
+        找不到时退回到整个 SFG 的正向边；仍找不到时路径只包含 sink，不再拼接无关的路径。
+        """
+        view = self.sfg_view
+        source_index = view.index_of(source)
+        sink_index = view.index_of(sink)
+        witnesses = []
+        if source_index >= 0 and sink_index >= 0:
+            witnesses = self._find_witnesses(
+                source_index, sink_index, lambda u: self._taint_successors(u, tag), k
+            )
+            if not witnesses:
+                witnesses = self._find_witnesses(source_index, sink_index, view.successors, k)
+
+        paths = []
+        for witness in witnesses:
+            path = [view.nodes[u] for u in witness]
+            if not path or path[-1] != sink:
+                path.append(sink)
+            paths.append(path)
+        if not paths:
+            paths.append([sink])
 
         flow = Flow()
         flow.source_stmt_id = source.def_stmt_id
         flow.sink_stmt_id = sink.def_stmt_id
-        flow.parent_to_sink = final_path
+        flow.parent_to_sink = paths[0]
+        flow.other_paths_to_sink = paths[1:]
         return flow
 
 
 class TaintRuleApplier:
+    """
+    用 RuleManager 编译好的规则索引匹配 SFG 节点，每个节点只检查与其名字、operation 或所在行相关的少量规则。
+    规则按节点所在文件的语言选取。
+    """
     def __init__(self, taint_analysis):
         self.taint_analysis = taint_analysis
         self.loader = taint_analysis.loader
         self.sfg = taint_analysis.sfg
         self.rule_manager = taint_analysis.rule_manager
+        self.unit_id_to_info = {}
+
+    def get_unit_info(self, node):
+        if self.loader is None:
+            return None
+        unit_id = self.loader.convert_stmt_id_to_unit_id(node.def_stmt_id)
+        if unit_id not in self.unit_id_to_info:
+            self.unit_id_to_info[unit_id] = self.loader.convert_module_id_to_module_info(unit_id)
+        return self.unit_id_to_info[unit_id]
+
+    def get_unit_path_and_name(self, node):
+        unit_path = self.get_unit_info(node).original_path
+        return unit_path, os.path.basename(unit_path)
+
+    def get_node_rules(self, node):
+        """节点所在文件的语言对应的规则；无法确定语言时使用全部规则"""
+        unit_info = self.get_unit_info(node)
+        lang = getattr(unit_info, "lang", None) if unit_info is not None else None
+        if not isinstance(lang, str):
+            lang = None
+        return self.rule_manager.get_compiled_rules(lang)
+
+    def match_unit_and_line(self, rule, unit_path, unit_name, line_num, check_unit_path = True):
+        if check_unit_path and rule.unit_path and rule.unit_path != unit_path:
+            return False
+        if rule.unit_name and rule.unit_name != unit_name:
+            return False
+        if rule.line_num and rule.line_num != line_num:
+            return False
+        return True
 
     def apply_parameter_source_rules(self, node):
-        stmt_id = node.def_stmt_id
-        method_id = self.loader.convert_stmt_id_to_method_id(stmt_id)
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
+        view = self.taint_analysis.sfg_view
+        unit_path, unit_name = self.get_unit_path_and_name(node)
         stmt = node.stmt
-        # if not stmt.attrs:
-        #     return False
-        # if not isinstance(stmt.attrs, str):
-        #     return False
-        # attrs = stmt.attrs
-        parameter_symbol = list(util.graph_successors(self.sfg, node))[0]
-        for rule in self.rule_manager.all_sources:
-            # if rule.unit_path and rule.unit_path != unit_path:
-            #     continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(stmt.start_row + 1):
-                continue
-            if not rule.attr and rule.name == parameter_symbol.name:
-                # print(rule.name)
-                return True
-            if rule.operation != "parameter_decl":
+        node_index = view.index_of(node)
+        parameter_index = next(view.successors(node_index), -1) if node_index >= 0 else -1
+        if parameter_index < 0:
+            return False
+        parameter_symbol = view.nodes[parameter_index]
+        line_num = int(stmt.start_row + 1)
+        for rule in self.get_node_rules(node).sources.with_name(parameter_symbol.name):
+            if not self.match_unit_and_line(rule, unit_path, unit_name, line_num, check_unit_path = False):
                 continue
-            # if rule.attr and rule.attr not in attrs:
-            #     continue
-            if rule.name == parameter_symbol.name:
-                # print(rule.name)
+            if not rule.attr or rule.operation == "parameter_decl":
                 return True
         return False
 
@@ -327,53 +431,41 @@ class TaintRuleApplier:
         if not symbol_node or not state_nodes:
             return False
 
-        for rule in self.rule_manager.all_sources:
-            if rule.operation != "field_read":
-                continue
-
-            for state_node in state_nodes:
-                # 格式化访问路径
-                access_path = access_path_formatter(state_node.access_path)
-                if access_path == rule.name:
-                    # print(rule.name)
-                    return True
-
+        # 格式化访问路径
+        access_paths = [access_path_formatter(state_node.access_path) for state_node in state_nodes]
+        for rule in self.get_node_rules(node).sources.with_names(access_paths):
+            if rule.operation == "field_read":
+                return True
         return False
 
     def apply_call_stmt_source_rules(self, node):
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
+        unit_path, unit_name = self.get_unit_path_and_name(node)
         method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
         defined_symbol_node, defined_state_nodes = self.taint_analysis.get_stmt_define_symbol_and_states_node(node)
         if not method_symbol_node or not defined_symbol_node:
             return False
 
+        state_access_paths = []
+        for state_node in method_state_nodes:
+            state_access_path = state_node.access_path
+            if isinstance(state_access_path, str):
+                continue
+            access_path = access_path_formatter(state_access_path)
+            if len(access_path) == 0:
+                access_path = method_symbol_node.name
+            state_access_paths.append(access_path)
+
         tag_space_id = defined_symbol_node.node_id
+        line_num = int(node.line_no + 1)
         apply_rule_flag = False
-        for rule in self.rule_manager.all_sources:
-            if rule.unit_path and rule.unit_path != unit_path:
-                continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(node.line_no + 1):
-                continue
+        for rule in self.get_node_rules(node).sources.with_names(state_access_paths):
             if rule.operation != "call_stmt":
                 continue
+            if not self.match_unit_and_line(rule, unit_path, unit_name, line_num):
+                continue
             tag_info = rule
-            name = tag_info.name
-            for state_node in method_state_nodes:
-                state_access_path = state_node.access_path
-                if isinstance(state_access_path, str):
-                    continue
-                access_path = access_path_formatter(state_access_path)
-
-                if len(access_path) == 0:
-                    access_path = method_symbol_node.name
-                if access_path == name:
-                    # print(rule.name)
+            for access_path in state_access_paths:
+                if access_path == rule.name:
                     apply_rule_flag = True
                     tag = self.taint_analysis.taint_manager.get_symbol_tag(tag_space_id)
                     new_tag = self.taint_analysis.taint_manager.add_and_update_tag_bv(tag_info=tag_info,
@@ -384,62 +476,38 @@ class TaintRuleApplier:
 
         return apply_rule_flag
 
-    def apply_object_call_stmt_source_rules(self, node):
-        if node.node_type != SFG_NODE_KIND.STMT or node.name != "object_call_stmt":
-            return False
+    def get_object_call_names(self, node, method_state_nodes):
         stmt = node.stmt
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
-        method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node, pos = 0)
         names = []
         if method_state_nodes and len(method_state_nodes) > 0:
             for state in method_state_nodes:
                 names.append(util.access_path_formatter(state.access_path) + '.' + stmt.field)
-
         names.append(stmt.receiver_object + '.' + stmt.field)
-        # print(name, stmt.start_row)
-        for rule in self.rule_manager.all_sources:
-            if rule.unit_path and rule.unit_path != unit_path:
-                continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(node.line_no + 1):
-                continue
-            if rule.name in names:
-                # print(rule.name)
+        return names
+
+    def apply_object_call_stmt_source_rules(self, node):
+        if node.node_type != SFG_NODE_KIND.STMT or node.name != "object_call_stmt":
+            return False
+        unit_path, unit_name = self.get_unit_path_and_name(node)
+        method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node, pos = 0)
+        names = self.get_object_call_names(node, method_state_nodes)
+        line_num = int(node.line_no + 1)
+        for rule in self.get_node_rules(node).sources.with_names(names):
+            if self.match_unit_and_line(rule, unit_path, unit_name, line_num):
                 return True
         return False
 
     def should_apply_object_call_stmt_sink_rules(self, node):
         if node.node_type != SFG_NODE_KIND.STMT or node.name != "object_call_stmt":
             return False
-        stmt = node.stmt
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
+        unit_path, unit_name = self.get_unit_path_and_name(node)
         method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
-        names = []
-        if method_state_nodes and len(method_state_nodes) > 0:
-            for state in method_state_nodes:
-                names.append(util.access_path_formatter(state.access_path) + '.' + stmt.field)
-
-        names.append(stmt.receiver_object + '.' + stmt.field)
-        if stmt.field == "__init__":
+        names = self.get_object_call_names(node, method_state_nodes)
+        if node.stmt.field == "__init__":
             names.append("__init__")
-        # print(name, stmt.start_row)
-        for rule in self.rule_manager.all_sinks:
-            if rule.unit_path and rule.unit_path != unit_path:
-                continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(node.line_no + 1):
-                continue
-            if rule.name in names:
+        line_num = int(node.line_no + 1)
+        for rule in self.get_node_rules(node).sinks.with_names(names):
+            if self.match_unit_and_line(rule, unit_path, unit_name, line_num):
                 return True
         return False
 
@@ -447,60 +515,33 @@ class TaintRuleApplier:
         if node.node_type != SFG_NODE_KIND.STMT or node.name != "call_stmt":
             return False
         method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node, pos=0)
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
-        for rule in self.rule_manager.all_sinks:
-            if rule.operation != "call_stmt":
-                continue
-            # if rule.unit_path and rule.unit_path != unit_path:
-            #     continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(node.line_no + 1):
-                continue
-            if not method_state_nodes:
-                continue
-            for state_node in method_state_nodes:
-                # 检查函数名是否符合规则
-                if self.check_method_name(rule.name, state_node):
+        if not method_state_nodes:
+            return False
+        unit_path, unit_name = self.get_unit_path_and_name(node)
+        sinks = self.get_node_rules(node).sinks
+        line_num = int(node.line_no + 1)
+        for state_node in method_state_nodes:
+            # 检查函数名是否符合规则
+            for rule in sinks.with_method_name("call_stmt", state_node.access_path):
+                if self.match_unit_and_line(rule, unit_path, unit_name, line_num, check_unit_path = False):
                     return True
-
-        return False
-    def apply_rules_from_code(self, node, rules):
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-
-        for rule in rules:
-            if rule.unit_path not in unit_path:
-                continue
-            if node.line_no + 1 != rule.line_num:
-                continue
-            if rule.symbol_name in node.operation:
-                return True
         return False
 
+    def apply_rules_from_code(self, node, code_rules):
+        """code_rules 是 CompiledRules 中的 sources_from_code 或 sinks_from_code"""
+        line_num = node.line_no + 1
+        if not code_rules.has_line(line_num):
+            return False
+        unit_path = self.get_unit_info(node).original_path
+        return code_rules.match(line_num, node.operation, unit_path)
+
     def apply_record_write_sink_rules(self, node):
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
         if node.node_type != SFG_NODE_KIND.STMT or node.name != "record_write":
             return False
-
-        for rule in self.rule_manager.all_sinks:
-            if rule.operation != "record_write":
-                continue
-            if rule.unit_path and rule.unit_path != unit_path:
-                continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(node.line_no + 1):
+        unit_path, unit_name = self.get_unit_path_and_name(node)
+        line_num = int(node.line_no + 1)
+        for rule in self.get_node_rules(node).sinks.with_operation("record_write"):
+            if not self.match_unit_and_line(rule, unit_path, unit_name, line_num):
                 continue
             if rule.key and rule.key == node.stmt.key:
                 return True
@@ -508,22 +549,12 @@ class TaintRuleApplier:
         return False
 
     def apply_field_write_sink_rules(self, node):
-        stmt_id = node.def_stmt_id
-        unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-        unit_info = self.loader.convert_module_id_to_module_info(unit_id)
-        unit_path = unit_info.original_path
-        unit_name = os.path.basename(unit_path)
         if node.node_type != SFG_NODE_KIND.STMT or node.name != "field_write":
             return False
-
-        for rule in self.rule_manager.all_sinks:
-            if rule.operation != "field_write":
-                continue
-            if rule.unit_path and rule.unit_path != unit_path:
-                continue
-            if rule.unit_name and rule.unit_name != unit_name:
-                continue
-            if rule.line_num and rule.line_num != int(node.line_no + 1):
+        unit_path, unit_name = self.get_unit_path_and_name(node)
+        line_num = int(node.line_no + 1)
+        for rule in self.get_node_rules(node).sinks.with_operation("field_write"):
+            if not self.match_unit_and_line(rule, unit_path, unit_name, line_num):
                 continue
             if rule.name and rule.name in node.operation:
                 return True
@@ -531,20 +562,9 @@ class TaintRuleApplier:
         return False
 
     def check_method_name(self, rule_name, method_state):
-        state_access_path = method_state.access_path
-        rule_name_parts = rule_name.split('.')
-        if len(state_access_path) < len(rule_name_parts):
-            return False
-        # name匹配上
-        for i, item in enumerate(reversed(rule_name_parts)):
-            if item == TAG_KEYWORD.ANYNAME:
-                continue
-            if item != state_access_path[-i - 1].key:
-                return False
-        return True
+        return match_access_path(split_rule_name(rule_name), method_state.access_path)
 
     def apply_propagation_rules(self, node):
-        stmt_id = node.def_stmt_id
         stmt = node.stmt
         operation = node.name
 
@@ -552,32 +572,33 @@ class TaintRuleApplier:
         if operation in ["assign_stmt", "call_stmt", "object_call_stmt", "new_object", "forin_stmt", "field_read","field_write", "record_write","record_extend", "array_write", "array_extend", "array_append", "array_read"] :
             return True
 
-        for rule in self.rule_manager.all_propagations:
-            if rule.operation != operation:
-                continue
+        propagations = self.get_node_rules(node).propagations
+        rules = propagations.with_operation(operation)
+        if len(rules) == 0:
+            return False
 
-            if operation == "field_read":
+        if operation == "field_read":
+            symbol_node, state_nodes = self.taint_analysis.get_stmt_define_symbol_and_states_node(node)
+            access_paths = [access_path_formatter(state_node.access_path) for state_node in state_nodes or []]
+            for rule in rules:
                 # 1. 检查字段名列表 (field: [split, next, ...])
                 if hasattr(stmt, 'field') and rule.field:
                     if stmt.field in rule.field:
                         return True
                 # 2. 检查特定 target (target: request.query_string)
-                symbol_node, state_nodes = self.taint_analysis.get_stmt_define_symbol_and_states_node(node)
-                if state_nodes:
-                    for state_node in state_nodes:
-                        access_path = access_path_formatter(state_node.access_path)
-                        if access_path == rule.target:
-                            return True
+                if rule.target in access_paths:
+                    return True
                 # 3. 简单的 src/dst 规则 (如 src: receiver)
                 if not rule.field and not rule.target:
                     return True
 
-            elif operation == "call_stmt":
+        elif operation == "call_stmt":
+            method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
+            for rule in rules:
                 # 检查函数名是否符合规则
-                method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
                 if method_state_nodes:
                     for state_node in method_state_nodes:
-                        if self.check_method_name(rule.name, state_node):
+                        if propagations.match_method_name(rule, state_node.access_path):
                             return True
                 # 如果都没有匹配上，但规则确实是 call_stmt 且没有指定 name（较少见），可以返回 True
                 if not rule.name:
@@ -590,26 +611,28 @@ class TaintRuleApplier:
         vuln_type = None
         if node.node_type != SFG_NODE_KIND.STMT:
             return sink_tag,  vuln_type
+        view = self.taint_analysis.sfg_view
+        node_index = view.index_of(node)
+        if node_index < 0:
+            return sink_tag,  vuln_type
 
-        stmt_id = node.def_stmt_id
         stmt = node.stmt
         operation = node.name
+        compiled_rules = self.get_node_rules(node)
+        sinks = compiled_rules.sinks
 
         # 1. 寻找匹配的 sink 规则
         matching_rules = []
         if operation == "call_stmt":
             _, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
-            for rule in self.rule_manager.all_sinks:
-                if rule.operation != "call_stmt":
-                    continue
-                if not method_state_nodes:
-                    if rule.name == stmt.name:
-                        matching_rules.append(rule)
-                    continue
+            if not method_state_nodes:
+                matching_rules = [rule for rule in sinks.with_name(stmt.name) if rule.operation == "call_stmt"]
+            else:
+                matched = {}
                 for state_node in method_state_nodes:
-                    if self.check_method_name(rule.name, state_node):
-                        matching_rules.append(rule)
-                        break
+                    for rule in sinks.with_method_name("call_stmt", state_node.access_path):
+                        matched[id(rule)] = rule
+                matching_rules = sinks.sort(matched.values())
         elif operation == "object_call_stmt":
             method_symbol_node, method_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
             name = None
@@ -617,21 +640,9 @@ class TaintRuleApplier:
                 name = util.access_path_formatter(method_state_nodes[0].access_path) + '.' + stmt.field
 
             name1 = stmt.receiver_object + '.' + stmt.field
-            for rule in self.rule_manager.all_sinks:
-                if rule.name in [name, name1, stmt.field]:
-                    matching_rules.append(rule)
-        elif operation == "field_write":
-            used_symbol_nodes, used_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
-            for rule in self.rule_manager.all_sinks:
-                if rule.operation != "field_write":
-                    continue
-                if rule.name in node.operation:
-                    matching_rules.append(rule)
+            matching_rules = sinks.with_names([name, name1, stmt.field])
         elif operation == "field_write":
-            used_symbol_nodes, used_state_nodes = self.taint_analysis.get_stmt_used_symbol_and_state_by_pos(node)
-            for rule in self.rule_manager.all_sinks:
-                if rule.operation != "field_write":
-                    continue
+            for rule in sinks.with_operation("field_write"):
                 if rule.name in node.operation:
                     matching_rules.append(rule)
 
@@ -654,33 +665,22 @@ class TaintRuleApplier:
                 elif target in [TAG_KEYWORD.RECEIVER, TAG_KEYWORD.TARGET]:
                     target_pos = 0
 
-                for pred in self.sfg.predecessors(node):
-                    edge_data = self.sfg.get_edge_data(pred, node)
-                    if not edge_data: continue
-                    for data in edge_data.values():
-                        weight = data
-                        if weight.edge_type != SFG_EDGE_KIND.SYMBOL_IS_USED:
-                            continue
-
-                        weight_pos = weight.pos
-                        if operation == "object_call_stmt" and target_pos != 0:
-                            weight_pos -= 1
-
-                        # 匹配位置或者目标是通配符
-                        if (target_pos != -1 and weight_pos == target_pos) or \
-                            (target == TAG_KEYWORD.TARGET) or \
-                            (not target):
-                            sink_tag |= self.taint_analysis.get_symbol_with_states_tag(pred)
+                for pred, edge_bit, weight_pos in view.in_edges(node_index):
+                    if not (edge_bit & SYMBOL_IS_USED_MASK):
+                        continue
+
+                    if operation == "object_call_stmt" and target_pos != 0:
+                        weight_pos -= 1
+
+                    # 匹配位置或者目标是通配符
+                    if (target_pos != -1 and weight_pos == target_pos) or \
+                        (target == TAG_KEYWORD.TARGET) or \
+                        (not target):
+                        sink_tag |= self.taint_analysis.get_symbol_with_states_tag(view.nodes[pred])
         # 应用codeql规则
-        is_sink_node = False
-        for rule in self.rule_manager.all_sinks_from_code:
-            if node.line_no + 1 != rule.line_num:
-                continue
-            if rule.symbol_name in node.operation:
-                is_sink_node = True
-        if is_sink_node:
-            for pred in self.sfg.predecessors(node):
-                sink_tag |= self.taint_analysis.get_symbol_with_states_tag(pred)
+        if compiled_rules.sinks_from_code.match(node.line_no + 1, node.operation):
+            for pred in dict.fromkeys(view.predecessors(node_index)):
+                sink_tag |= self.taint_analysis.get_symbol_with_states_tag(view.nodes[pred])
         return sink_tag, vuln_type
 
 
@@ -694,13 +694,19 @@ class TaintAnalysis:
         self.rule_manager = RuleManager(options.default_settings)
         self.current_entry_point = -1
         self.sfg = None
+        self.sfg_view: CompactSFG = None
         self.rule_applier = TaintRuleApplier(self)
         self.path_finder = PathFinder(self)
+        self.loaded_sfg_count = 0
+        self.sfg_load_time = 0.0
 
     def _update_sfg(self, sfg):
         self.sfg = sfg
+        # 每个 entry point 只构建一次数组视图，污点传播和路径查找都在它上面进行
+        self.sfg_view = CompactSFG(sfg) if sfg else None
         self.rule_applier.sfg = sfg
         self.path_finder.ta = self
+        self.path_finder._stmt_propagates = {}
 
     def read_rules(self, operation, source_rules):
         """从src.yaml文件中获取field_read语句类型的规则, 并根据每条规则创建taint_bv"""
@@ -714,40 +720,41 @@ class TaintAnalysis:
     def get_stmt_used_symbol_and_state_by_pos(self, node, pos = -1):
         if node.node_type != SFG_NODE_KIND.STMT:
             return None, None
-        state_nodes = []
-        predecessors = list(util.graph_predecessors(self.sfg, node))
-        name_symbol_node = None
-        if len(predecessors) == 0:
+        view = self.sfg_view
+        u = view.index_of(node)
+        if u < 0 or view.in_offsets[u] == view.in_offsets[u + 1]:
             return None, None
-        for predecessor in predecessors:
-            edge = self.sfg.get_edge_data(predecessor, node)
-
-            if edge and edge['weight'].pos == pos:
-                name_symbol_node = predecessor
-        name_symbol_successors = list(util.graph_successors(self.sfg, name_symbol_node))
-        for successor in name_symbol_successors:
-            if successor.node_type == SFG_NODE_KIND.STATE:
-                state_nodes.append(successor)
-        return name_symbol_node, state_nodes
+        name_symbol = -1
+        for predecessor, _, edge_pos in view.in_edges(u):
+            if edge_pos == pos:
+                name_symbol = predecessor
+        if name_symbol < 0:
+            return None, []
+        state_nodes = []
+        for successor in dict.fromkeys(view.successors(name_symbol)):
+            if view.node_types[successor] == SFG_NODE_KIND.STATE:
+                state_nodes.append(view.nodes[successor])
+        return view.nodes[name_symbol], state_nodes
 
     def get_stmt_define_symbol_and_states_node(self, node):
         if node.node_type != SFG_NODE_KIND.STMT:
             return None, None
-        successors = list(util.graph_successors(self.sfg, node))
-        define_symbol_node = None
-        for successor in successors:
-            if successor.node_id == -1 or successor.name == "":
+        view = self.sfg_view
+        u = view.index_of(node)
+        if u < 0:
+            return None, []
+        define_symbol = -1
+        for successor in view.successors(u, SYMBOL_IS_DEFINED_MASK):
+            if view.node_ids[successor] == -1 or view.nodes[successor].name == "":
                 continue
-            edge = self.sfg.get_edge_data(node, successor)
-            if edge and edge['weight'].edge_type == SFG_EDGE_KIND.SYMBOL_IS_DEFINED:
-                define_symbol_node = successor
-        define_symbol_successors = list(util.graph_successors(self.sfg, define_symbol_node))
-        define_state_list = []
-        for successor in define_symbol_successors:
-            edge = self.sfg.get_edge_data(define_symbol_node, successor)
-            if edge and edge['weight'].edge_type == SFG_EDGE_KIND.SYMBOL_STATE:
-                define_state_list.append(successor)
-        return define_symbol_node, define_state_list
+            define_symbol = successor
+        if define_symbol < 0:
+            return None, []
+        define_state_list = [
+            view.nodes[successor]
+            for successor in dict.fromkeys(view.successors(define_symbol, SYMBOL_STATE_MASK))
+        ]
+        return view.nodes[define_symbol], define_state_list
 
     def find_sources(self):
         node_list = []
@@ -771,7 +778,7 @@ class TaintAnalysis:
                 node_list.append(defined_symbol_node)
             # 为了兼容codeql规则
             else:
-                rules = self.rule_manager.all_sources_from_code
+                rules = self.rule_applier.get_node_rules(node).sources_from_code
                 if self.rule_applier.apply_rules_from_code(node, rules):
                     defined_symbol_node, defined_state_nodes = self.get_stmt_define_symbol_and_states_node(node)
                     node_list.append(defined_symbol_node)
@@ -803,7 +810,7 @@ class TaintAnalysis:
             elif self.rule_applier.apply_field_write_sink_rules(node):
                 node_list.append(node)
             else:
-                rules = self.rule_manager.all_sinks_from_code
+                rules = self.rule_applier.get_node_rules(node).sinks_from_code
                 if self.rule_applier.apply_rules_from_code(node, rules):
                     node_list.append(node)
         return node_list
@@ -828,82 +835,90 @@ class TaintAnalysis:
 
     def get_state_with_inclusion_tag(self, state_node):
         """获取 state 节点及其所有通过 inclusion 关系包含的子 state 节点的污点标记总和"""
+        view = self.sfg_view
+        start = view.index_of(state_node)
+        if start < 0:
+            return self.taint_manager.get_state_tag(state_node.node_id)
+        return self._get_state_with_inclusion_tag(start)
+
+    def _get_state_with_inclusion_tag(self, start):
+        view = self.sfg_view
         tag = 0
-        state_worklist = deque([state_node])
-        state_visited = {state_node}
+        state_worklist = deque([start])
+        state_visited = {start}
         while state_worklist:
             curr_state = state_worklist.popleft()
-            tag |= self.taint_manager.get_state_tag(curr_state.node_id)
-
-            for next_state in self.sfg.successors(curr_state):
-                if next_state.node_type == SFG_NODE_KIND.STATE and next_state not in state_visited:
-                    s_edge_data = self.sfg.get_edge_data(curr_state, next_state)
-                    if s_edge_data:
-                        for s_data in s_edge_data.values():
-                            if s_data.edge_type in (
-                                    SFG_EDGE_KIND.STATE_INCLUSION,
-                                    SFG_EDGE_KIND.INDIRECT_STATE_INCLUSION):
-                                state_visited.add(next_state)
-                                state_worklist.append(next_state)
-                                break
+            tag |= self.taint_manager.get_state_tag(view.node_ids[curr_state])
+
+            for next_state in view.successors(curr_state, STATE_INCLUSION_MASK):
+                if view.node_types[next_state] == SFG_NODE_KIND.STATE and next_state not in state_visited:
+                    state_visited.add(next_state)
+                    state_worklist.append(next_state)
         return tag
 
     def get_symbol_with_states_tag(self, symbol_node):
         """获取 symbol 节点及其指向的所有 state 节点的污点标记总和"""
+        view = self.sfg_view
         tag = self.taint_manager.get_symbol_tag(symbol_node.node_id)
-        for v in self.sfg.successors(symbol_node):
-            v_edge_data = self.sfg.get_edge_data(symbol_node, v)
-            if v_edge_data:
-                for v_data in v_edge_data.values():
-                    if v_data.edge_type == SFG_EDGE_KIND.SYMBOL_STATE:
-                        tag |= self.get_state_with_inclusion_tag(v)
+        u = view.index_of(symbol_node)
+        if u < 0:
+            return tag
+        for v in view.successors(u, SYMBOL_STATE_MASK):
+            tag |= self._get_state_with_inclusion_tag(v)
         return tag
 
     def find_flows(self, sources, sinks):
         # 找到所有的taint flow
-        # 每次处理一个 source 和 一个 sink 的组合
+        # 所有 source 一起传播一次，之后每个 (source, sink) 组合只需一次按位与
         flow_list = []
-        dumped_sources = set()
+        if len(sources) == 0 or len(sinks) == 0:
+            return flow_list
 
-        for source in sources:
-            for sink in sinks:
-                # 1. 污点传播 (针对单一 Source)
-                # 为每一次 (source, sink) 组合使用独立的污点管理器，确保隔离
-                original_manager = self.taint_manager
-                self.taint_manager = TaintEnv()
+        # 传播使用独立的污点管理器，与 find_sources 中按规则打的 tag 隔离
+        original_manager = self.taint_manager
+        self.taint_manager = TaintEnv()
 
-                # 执行污点传播并获取该 source 的 tag
-                tag = self.path_finder.propagate_taint(source)
+        # 执行污点传播并获取每个 source 的 tag
+        tags = self.path_finder.propagate_taints(sources)
 
-                # 传播完成后，taint_manager 已包含污染的 SYMBOL/STATE；
-                # 导出标色后的 SFG（同一个 source 的传播结果不依赖 sink，避免重复导出）。
+        # 传播完成后，taint_manager 已包含污染的 SYMBOL/STATE；
+        # 按 source 导出标色后的 SFG（同一个 source 只导出一次）。
+        if getattr(self.options, "graph", False) or getattr(self.options, "complete_graph", False):
+            dumped_sources = set()
+            for source, tag in zip(sources, tags):
                 source_key = (self.current_entry_point, source.node_type, source.node_id, source.def_stmt_id)
-                if source_key not in dumped_sources:
-                    dumped_sources.add(source_key)
-                    self.save_graph_to_dot(
-                        graph=self.sfg,
-                        entry_point=f"{self.current_entry_point}_taint_{source.def_stmt_id}",
-                        phase_id=ANALYSIS_PHASE_ID.GLOBAL_SEMANTICS,
-                        taint_manager=self.taint_manager
-                    )
-                    self.dump_tainted_sfg_by_method(
-                        source=source,
-                        phase_id=ANALYSIS_PHASE_ID.GLOBAL_SEMANTICS,
-                        taint_manager=self.taint_manager
-                    )
-                # 2. Sink 检查 (针对单一 Sink)
-                sink_tag, vuln_type = self.rule_applier.get_sink_tag_by_rules(sink)
-
+                if source_key in dumped_sources:
+                    continue
+                dumped_sources.add(source_key)
+                source_manager = self.taint_manager.project(tag)
+                self.save_graph_to_dot(
+                    graph=self.sfg,
+                    entry_point=f"{self.current_entry_point}_taint_{source.def_stmt_id}",
+                    phase_id=ANALYSIS_PHASE_ID.GLOBAL_SEMANTICS,
+                    taint_manager=source_manager
+                )
+                self.dump_tainted_sfg_by_method(
+                    source=source,
+                    phase_id=ANALYSIS_PHASE_ID.GLOBAL_SEMANTICS,
+                    taint_manager=source_manager
+                )
+
+        # Sink 检查：每个 sink 的 tag 只计算一次
+        witness_count = max(1, getattr(self.options, "taint_witnesses", config.TAINT_WITNESS_COUNT))
+        sink_tags = [self.rule_applier.get_sink_tag_by_rules(sink) for sink in sinks]
+        for source, tag in zip(sources, tags):
+            for sink, (sink_tag, vuln_type) in zip(sinks, sink_tags):
                 if (sink_tag & tag) != 0:
                     # print("found taint sink")
-                    flow = self.path_finder.reconstruct_define_use_path(source, sink)
+                    flow = self.path_finder.reconstruct_define_use_path(source, sink, tag, witness_count)
                     flow.vuln_type = vuln_type
                     flow_list.append(flow)
 
-                # 恢复管理器
-                self.taint_manager = original_manager
+        # 恢复管理器
+        self.taint_manager = original_manager
 
         return flow_list
+
     def save_graph_to_dot(self, graph, entry_point, phase_id, taint_manager=None):
         # 仅在用户开启 graph 输出时导出
         if not (getattr(self.options, "graph", False) or getattr(self.options, "complete_graph", False)):
@@ -1002,62 +1017,40 @@ class TaintAnalysis:
         - STATE -> SYMBOL (逆向 SYMBOL_STATE), STATE -> STATE (STATE_INCLUSION/COPY)
         - STMT -> SYMBOL (SYMBOL_IS_DEFINED)
         """
-        worklist = deque([source])
-        visited = {source}
+        view = self.sfg_view
+        start = view.index_of(source)
+        if start < 0:
+            return {source}
+        worklist = deque([start])
+        visited = {start}
+
+        def visit(v):
+            if v not in visited:
+                visited.add(v)
+                worklist.append(v)
 
         while worklist:
             u = worklist.popleft()
+            node_type = view.node_types[u]
 
-            if u.node_type == SFG_NODE_KIND.SYMBOL:
+            if node_type == SFG_NODE_KIND.SYMBOL:
                 # 1. 向下传播到 STATE, STMT, 或其他 SYMBOL
-                for v in self.sfg.successors(u):
-                    if v in visited: continue
-                    edge_data = self.sfg.get_edge_data(u, v)
-                    if not edge_data: continue
-                    for data in edge_data.values():
-                        etype = data.edge_type
-                        if etype in (SFG_EDGE_KIND.SYMBOL_STATE, SFG_EDGE_KIND.SYMBOL_IS_USED,
-                                     SFG_EDGE_KIND.SYMBOL_FLOW, SFG_EDGE_KIND.INDIRECT_SYMBOL_FLOW):
-                            visited.add(v)
-                            worklist.append(v)
-                            break
-
-            elif u.node_type == SFG_NODE_KIND.STATE:
+                for v in view.successors(u, SYMBOL_STATE_MASK | SYMBOL_IS_USED_MASK | SYMBOL_FLOW_MASK):
+                    visit(v)
+
+            elif node_type == SFG_NODE_KIND.STATE:
                 # 1. 找到该值所属的所有 SYMBOL (逆着 SYMBOL_STATE 边)
-                for v in self.sfg.predecessors(u):
-                    if v in visited: continue
-                    edge_data = self.sfg.get_edge_data(v, u)
-                    if not edge_data: continue
-                    for data in edge_data.values():
-                        if data.edge_type == SFG_EDGE_KIND.SYMBOL_STATE:
-                            visited.add(v)
-                            worklist.append(v)
-                            break
+                for v in view.predecessors(u, SYMBOL_STATE_MASK):
+                    visit(v)
                 # 2. 向下传播到包含的子状态
-                for v in self.sfg.successors(u):
-                    if v in visited: continue
-                    edge_data = self.sfg.get_edge_data(u, v)
-                    if not edge_data: continue
-                    for data in edge_data.values():
-                        etype = data.edge_type
-                        if etype in (SFG_EDGE_KIND.STATE_INCLUSION, SFG_EDGE_KIND.INDIRECT_STATE_INCLUSION,
-                                     SFG_EDGE_KIND.STATE_COPY):
-                            visited.add(v)
-                            worklist.append(v)
-                            break
-
-            elif u.node_type == SFG_NODE_KIND.STMT:
+                for v in view.successors(u, STATE_INCLUSION_MASK | STATE_COPY_MASK):
+                    visit(v)
+
+            elif node_type == SFG_NODE_KIND.STMT:
                 # 1. 语句定义的变量受到污染
-                for v in self.sfg.successors(u):
-                    if v in visited: continue
-                    edge_data = self.sfg.get_edge_data(u, v)
-                    if not edge_data: continue
-                    for data in edge_data.values():
-                        if data.edge_type == SFG_EDGE_KIND.SYMBOL_IS_DEFINED:
-                            visited.add(v)
-                            worklist.append(v)
-                            break
-        return visited
+                for v in view.successors(u, SYMBOL_IS_DEFINED_MASK):
+                    visit(v)
+        return {view.nodes[u] for u in visited}
 
     def get_all_backward_nodes(self, sink_symbol):
         """
@@ -1066,38 +1059,33 @@ class TaintAnalysis:
         if sink_symbol.node_type != SFG_NODE_KIND.SYMBOL:
             return set()
 
-        worklist = deque([sink_symbol])
-        visited = {sink_symbol}
+        view = self.sfg_view
+        start = view.index_of(sink_symbol)
+        if start < 0:
+            return {sink_symbol}
+        worklist = deque([start])
+        visited = {start}
 
         while worklist:
             u = worklist.popleft()
 
             # 逆着数据流方向查找前驱
-            for v in self.sfg.predecessors(u):
-                if v in visited: continue
-                edge_data = self.sfg.get_edge_data(v, u)
-                if not edge_data: continue
-
-                is_related = False
-                for data in edge_data.values():
-                    etype = data.edge_type
-                    if u.node_type == SFG_NODE_KIND.SYMBOL:
-                        # SYMBOL 是被谁定义的 (STMT -> SYMBOL) 或 从哪个 SYMBOL 流过来的 (SYMBOL -> SYMBOL)
-                        if etype in (SFG_EDGE_KIND.SYMBOL_IS_DEFINED,
-                                     SFG_EDGE_KIND.SYMBOL_FLOW, SFG_EDGE_KIND.INDIRECT_SYMBOL_FLOW):
-                            is_related = True
-                    elif u.node_type == SFG_NODE_KIND.STMT:
-                        # STMT 使用了哪个 SYMBOL (SYMBOL -> STMT)
-                        if etype == SFG_EDGE_KIND.SYMBOL_IS_USED:
-                            is_related = True
-
-                    if is_related:
-                        # 后向遍历仅关注 SYMBOL 和 STMT
-                        if v.node_type in (SFG_NODE_KIND.SYMBOL, SFG_NODE_KIND.STMT):
-                            visited.add(v)
-                            worklist.append(v)
-                        break
-        return visited
+            node_type = view.node_types[u]
+            if node_type == SFG_NODE_KIND.SYMBOL:
+                # SYMBOL 是被谁定义的 (STMT -> SYMBOL) 或 从哪个 SYMBOL 流过来的 (SYMBOL -> SYMBOL)
+                mask = SYMBOL_IS_DEFINED_MASK | SYMBOL_FLOW_MASK
+            elif node_type == SFG_NODE_KIND.STMT:
+                # STMT 使用了哪个 SYMBOL (SYMBOL -> STMT)
+                mask = SYMBOL_IS_USED_MASK
+            else:
+                continue
+
+            for v in view.predecessors(u, mask):
+                # 后向遍历仅关注 SYMBOL 和 STMT
+                if v not in visited and view.node_types[v] in (SFG_NODE_KIND.SYMBOL, SFG_NODE_KIND.STMT):
+                    visited.add(v)
+                    worklist.append(v)
+        return {view.nodes[u] for u in visited}
 
     def print_and_write_flows(self, flows):
         print(f"Found {len(flows)} taint flows.")
@@ -1122,57 +1110,10 @@ class TaintAnalysis:
             print(f"Found a flow to sink {sink_gir} on line {sink_line_no + 1}")
             print("\tSource :", source_gir, f"(in {source_method_name})")
 
-            line_no = -1
-            path_parent_source_node_list = []
-            path_parent_source_file_node_list = []
-            for node in reversed(each_flow.parent_to_source):
-                stmt_id = node.def_stmt_id
-                stmt = self.loader.get_stmt_gir(stmt_id)
-                if stmt.start_row == line_no:
-                    continue
-                line_no = stmt.start_row
-                gir_str = get_gir_str(stmt)
-
-                method_id = self.loader.convert_stmt_id_to_method_id(stmt_id)
-                method_name = self.loader.convert_method_id_to_method_name(method_id)
-                path_node = "(" + gir_str + ")" + " on line " + str(int(line_no) + 1)
-                unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-                file_path = self.loader.convert_unit_id_to_unit_path(unit_id)
-                path_node_in_file = {
-                    "start_line": int(stmt.start_row + 1),
-                    "end_line": int(stmt.end_row + 1),
-                    "file_path": file_path,
-                    "gir": gir_str,
-                    "stmt_id": int(stmt_id),
-                }
-                path_parent_source_node_list.append(path_node)
-                path_parent_source_file_node_list.append(path_node_in_file)
-
-            line_no = -1
-            path_parent_sink_node_list = []
-            path_parent_sink_file_node_list = []
-            for node in each_flow.parent_to_sink:
-                stmt_id = node.def_stmt_id
-                stmt = self.loader.get_stmt_gir(stmt_id)
-                if stmt.start_row == line_no:
-                    continue
-                line_no = stmt.start_row
-                gir_str = get_gir_str(stmt)
-
-                method_id = self.loader.convert_stmt_id_to_method_id(stmt_id)
-                method_name = self.loader.convert_method_id_to_method_name(method_id)
-                path_node = "(" + gir_str + ")" + " on line " + str(int(line_no) + 1)
-                unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
-                file_path = self.loader.convert_unit_id_to_unit_path(unit_id)
-                path_node_in_file = {
-                    "start_line": int(stmt.start_row + 1),
-                    "end_line": int(stmt.end_row + 1),
-                    "file_path": file_path,
-                    "gir": gir_str,
-                    "stmt_id": int(stmt_id),
-                }
-                path_parent_sink_node_list.append(path_node)
-                path_parent_sink_file_node_list.append(path_node_in_file)
+            path_parent_source_node_list, path_parent_source_file_node_list = self.format_flow_path(
+                reversed(each_flow.parent_to_source)
+            )
+            path_parent_sink_node_list, path_parent_sink_file_node_list = self.format_flow_path(each_flow.parent_to_sink)
 
             if not self.is_sublist(path_parent_source_node_list, path_parent_sink_node_list):
                 path_parent_sink_node_list = path_parent_source_node_list + path_parent_sink_node_list
@@ -1180,6 +1121,12 @@ class TaintAnalysis:
                 path_parent_sink_file_node_list = path_parent_source_file_node_list + path_parent_sink_file_node_list
             print("\t\tData Flow:", path_parent_sink_node_list)
 
+            other_data_flows = []
+            for other_path in each_flow.other_paths_to_sink:
+                other_node_list, other_file_node_list = self.format_flow_path(other_path)
+                print("\t\tOther Data Flow:", other_node_list)
+                other_data_flows.append(other_file_node_list)
+
             flow_json.append({
                 "source_stmt_id": int(each_flow.source_stmt_id),
                 "sink_stmt_id": int(each_flow.sink_stmt_id),
@@ -1192,6 +1139,8 @@ class TaintAnalysis:
                 "data_flow": path_parent_sink_file_node_list,
                 "vuln_type": each_flow.vuln_type,
             })
+            if other_data_flows:
+                flow_json[-1]["other_data_flows"] = other_data_flows
 
         output_dir = os.path.join(self.options.workspace, config.TAINT_OUTPUT_DIR)
         os.makedirs(output_dir, exist_ok=True)
@@ -1200,6 +1149,33 @@ class TaintAnalysis:
             json.dump(flow_json, f, ensure_ascii=False, indent=2)
         print(f"Wrote taint data flows to {output_file}")
 
+    def format_flow_path(self, nodes):
+        # 同一行的连续语句只保留第一条
+        line_no = -1
+        path_node_list = []
+        path_file_node_list = []
+        for node in nodes:
+            stmt_id = node.def_stmt_id
+            stmt = self.loader.get_stmt_gir(stmt_id)
+            if stmt.start_row == line_no:
+                continue
+            line_no = stmt.start_row
+            gir_str = get_gir_str(stmt)
+
+            path_node = "(" + gir_str + ")" + " on line " + str(int(line_no) + 1)
+            unit_id = self.loader.convert_stmt_id_to_unit_id(stmt_id)
+            file_path = self.loader.convert_unit_id_to_unit_path(unit_id)
+            path_node_in_file = {
+                "start_line": int(stmt.start_row + 1),
+                "end_line": int(stmt.end_row + 1),
+                "file_path": file_path,
+                "gir": gir_str,
+                "stmt_id": int(stmt_id),
+            }
+            path_node_list.append(path_node)
+            path_file_node_list.append(path_node_in_file)
+        return path_node_list, path_file_node_list
+
     def is_sublist(self, sub, lst):
         return str(sub)[1:-1] in str(lst)[1:-1]
 
@@ -1208,25 +1184,26 @@ class TaintAnalysis:
             print("\n########### # Phase IV: Taint Analysis # ##########")
 
         all_flows = []
-        for method_id in self.loader.get_all_method_ids():
+        # 只遍历 P3 保存了 SFG 的 entry point，并按 bundle 顺序读取，每个 bundle 只打开一次
+        self.loaded_sfg_count = 0
+        self.sfg_load_time = 0.0
+        start = time.perf_counter()
+        for method_id, sfg in self.loader.get_global_sfgs_in_bundle_order():
+            self.sfg_load_time += time.perf_counter() - start
             self.current_entry_point = method_id
-            self.sfg = self.loader.get_global_sfg_by_entry_point(method_id)
-            self._update_sfg(self.sfg)
-            if not self.sfg:
-                continue
-            self.taint_manager = TaintEnv()
-            sources = self.find_sources()
-            sinks = self.find_sinks()
-            # print(sources, sinks)
-            # if len(sources) > 0:
-            #     for source in sources:
-            #         print(source.name)
-            # if len(sinks) > 0:
-            #     for sink in sinks:
-            #         print(sink.line_no)
-            # print("entry:", self.loader.convert_method_id_to_method_name(method_id), method_id)
-            flows = self.find_flows(sources, sinks)
-            all_flows.extend(flows)
+            self._update_sfg(sfg)
+            if sfg:
+                self.loaded_sfg_count += 1
+                self.taint_manager = TaintEnv()
+                sources = self.find_sources()
+                sinks = self.find_sinks()
+                flows = self.find_flows(sources, sinks)
+                all_flows.extend(flows)
+            start = time.perf_counter()
+        self.sfg_load_time += time.perf_counter() - start
+
+        if not self.options.quiet:
+            print(f"Loaded {self.loaded_sfg_count} state flow graphs of entry points in {self.sfg_load_time:.3f}s")
 
         if len(all_flows) == 0:
             print("No taint flows found.")
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import dataclasses
+import numpy
 import lian.config.config as config
+from lian.config.constants import SFG_EDGE_KIND
 from lian.util import util
 class MethodTaintFrame:
     def __init__(self, method_id, frame_stack, env):
@@ -31,6 +33,8 @@ class MethodTaintFrame:
 class Flow:
     parent_to_source:list = dataclasses.field(default_factory=list)
     parent_to_sink:list = dataclasses.field(default_factory=list)
+    # 除 parent_to_sink 外，其余较短的 source -> sink 路径
+    other_paths_to_sink:list = dataclasses.field(default_factory=list)
     source_stmt_id=-1
     sink_stmt_id=-1
     vuln_type: str = ""
@@ -103,6 +107,23 @@ class TaintEnv:
             in self.processed_nodes
         )
 
+    def project(self, tag):
+        """
+        只保留 tag 中的位，用于按 source 导出多 source 传播的结果。
+        processed_nodes 是所有 source 共同的处理记录。
+        """
+        env = TaintEnv()
+        env.bit_vector_manager = self.bit_vector_manager
+        env.tag_info_hash_to_data = self.tag_info_hash_to_data
+        env.processed_nodes = self.processed_nodes
+        for symbol_id, symbol_tag in self.symbols_to_bv.items():
+            if symbol_tag & tag:
+                env.symbols_to_bv[symbol_id] = symbol_tag & tag
+        for state_id, state_tag in self.states_to_bv.items():
+            if state_tag & tag:
+                env.states_to_bv[state_id] = state_tag & tag
+        return env
+
     def add_and_update_tag_bv(self, tag_info, current_taint):
         """添加一位新tag到tag_bv, 并更新当前bv"""
         # 添加新tag_info
@@ -156,6 +177,86 @@ class TaintEnv:
                 self.symbols_to_bv[param_id] = arg_tag
 
 
+def edge_mask(*edge_types):
+    """把若干 SFG_EDGE_KIND 合成一个位掩码，用于 CompactSFG 的邻接查询"""
+    mask = 0
+    for edge_type in edge_types:
+        mask |= 1 << edge_type
+    return mask
+
+ALL_EDGES = -1
+
+class CompactSFG:
+    """
+    一个 entry point 的 SFG 的只读数组视图，供污点分析使用。
+    1. 节点编号为 0..n-1，nodes[i] 是对应的 SFGNode，只在需要报告时取出
+    2. 正向与反向邻接都是 CSR：targets[offsets[u]:offsets[u + 1]] 是 u 的邻居，
+       每条边对应一项（与 networkx 中的顺序一致），边类型存为 1 << edge_type
+    3. 查询只做整数运算，不再对 SFGNode 求哈希
+    """
+    def __init__(self, graph):
+        self.nodes = list(graph.nodes)
+        self.node_to_index = {node: index for index, node in enumerate(self.nodes)}
+        node_types = numpy.array([node.node_type for node in self.nodes], dtype = numpy.int64)
+        node_ids = numpy.array([node.node_id for node in self.nodes], dtype = numpy.int64)
+        forward = self._build_adjacency(graph.out_edges, 1)
+        backward = self._build_adjacency(graph.in_edges, 0)
+
+        self.node_types = memoryview(node_types)
+        self.node_ids = memoryview(node_ids)
+        (self.out_offsets, self.out_targets, self.out_edge_bits, self.out_positions) = (
+            memoryview(array) for array in forward
+        )
+        (self.in_offsets, self.in_targets, self.in_edge_bits, self.in_positions) = (
+            memoryview(array) for array in backward
+        )
+
+    def _build_adjacency(self, get_edges, neighbor_pos):
+        offsets = [0]
+        targets = []
+        edge_bits = []
+        positions = []
+        for node in self.nodes:
+            for edge in get_edges(node, data = "weight"):
+                weight = edge[2]
+                targets.append(self.node_to_index[edge[neighbor_pos]])
+                edge_bits.append(1 << getattr(weight, "edge_type", SFG_EDGE_KIND.REGULAR))
+                positions.append(getattr(weight, "pos", -1))
+            offsets.append(len(targets))
+        return tuple(
+            numpy.array(values, dtype = numpy.int64)
+            for values in (offsets, targets, edge_bits, positions)
+        )
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def index_of(self, node):
+        """SFGNode -> 节点编号；不在图中时返回 -1"""
+        return self.node_to_index.get(node, -1)
+
+    def out_edges(self, u):
+        """逐条返回 u 的出边 (v, edge_bit, pos)"""
+        for i in range(self.out_offsets[u], self.out_offsets[u + 1]):
+            yield self.out_targets[i], self.out_edge_bits[i], self.out_positions[i]
+
+    def in_edges(self, u):
+        """逐条返回 u 的入边 (v, edge_bit, pos)"""
+        for i in range(self.in_offsets[u], self.in_offsets[u + 1]):
+            yield self.in_targets[i], self.in_edge_bits[i], self.in_positions[i]
+
+    def successors(self, u, mask = ALL_EDGES):
+        """边类型落在 mask 中的后继，重边会重复出现"""
+        for i in range(self.out_offsets[u], self.out_offsets[u + 1]):
+            if self.out_edge_bits[i] & mask:
+                yield self.out_targets[i]
+
+    def predecessors(self, u, mask = ALL_EDGES):
+        """边类型落在 mask 中的前驱，重边会重复出现"""
+        for i in range(self.in_offsets[u], self.in_offsets[u + 1]):
+            if self.in_edge_bits[i] & mask:
+                yield self.in_targets[i]
+
 # 应该像taint_env一样，一个函数整体一个taint_state
 # field_read/write时，更新TaintState 本身的path与小弟的path
 
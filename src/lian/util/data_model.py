@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
+import bisect
+import collections.abc
+import json
+import os
+
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 from lian.config import config
 from lian.util import util
@@ -124,9 +130,9 @@ class DataModel:
         self.set_refresh_flag()
         return self
 
-    def save(self, path):
+    def save(self, path, chunksize = None):
         try:
-            self.reset_index()._data.to_feather(path)
+            self.reset_index()._data.to_feather(path, chunksize = chunksize)
             return self
         except Exception as e:
             print(e)
@@ -348,6 +354,374 @@ class DataModel:
         self._data = self._data[self._data[column_name] != value]
         self.set_refresh_flag()
 
+NULLABLE_INT_DTYPES = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
+
+def arrow_to_pandas(table, nullable_int_columns = None):
+    """
+    Convert an arrow table (or record batch) to a DataFrame.
+    The nullable integer columns (by default, the integer columns containing nulls) keep their integer values and
+    use pd.NA for the missing ones, instead of being turned into float64 with NaN
+    """
+    if nullable_int_columns is None:
+        nullable_int_columns = [
+            field.name for field, column in zip(table.schema, table.columns)
+            if pa.types.is_integer(field.type) and column.null_count > 0
+        ]
+    names = table.schema.names
+    positions = sorted(names.index(name) for name in nullable_int_columns if name in names)
+    if not positions:
+        return table.to_pandas()
+
+    data = table.drop_columns([names[pos] for pos in positions]).to_pandas()
+    for pos in positions:
+        column = table.column(pos).to_pandas(types_mapper = NULLABLE_INT_DTYPES.get)
+        data.insert(pos, names[pos], column.array)
+    return data
+
+def compute_value_ranges(values):
+    """
+    Split a column into runs of equal values:
+    returns (run_values, starts, ends) sorted by value, or None if the column is not numeric
+    """
+    values = np.asarray(values)
+    if values.dtype.kind not in "iuf":
+        return None
+
+    boundaries = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], boundaries)).astype(np.int64)
+    ends = np.concatenate((boundaries, [len(values)])).astype(np.int64)
+    if len(values) == 0:
+        starts = ends = np.empty(0, dtype = np.int64)
+    run_values = values[starts]
+    if values.dtype.kind == "f":
+        available = ~np.isnan(run_values)
+        run_values, starts, ends = run_values[available], starts[available], ends[available]
+
+    order = np.argsort(run_values, kind = "stable")
+    return (run_values[order], starts[order], ends[order])
+
+def to_int64_array(values):
+    """
+    Convert the ids to an int64 array; return None if any of them is not an integer
+    """
+    array = np.asarray(values)
+    if len(array) == 0:
+        return np.empty(0, dtype = np.int64)
+    if array.ndim != 1 or array.dtype.kind not in "iu":
+        return None
+    if array.dtype.kind == "u" and array.max() > np.iinfo(np.int64).max:
+        return None
+    return array.astype(np.int64)
+
+def normalize_id_key(key):
+    if isinstance(key, (int, np.integer)):
+        return int(key)
+    # ids read back from pandas columns with missing values are floats
+    if isinstance(key, (float, np.floating)) and float(key).is_integer():
+        return int(key)
+    return None
+
+def save_id_arrays(path, arrays):
+    """
+    Write named int64 arrays to an arrow IPC file, one record batch per array
+    """
+    names = list(arrays)
+    batch_schema = pa.schema([("value", pa.int64())]).with_metadata({config.ID_ARRAY_NAMES_KEY: json.dumps(names)})
+    with pa.ipc.new_file(path, batch_schema) as writer:
+        for name in names:
+            writer.write_batch(pa.record_batch([pa.array(arrays[name], type = pa.int64())], schema = batch_schema))
+
+def load_id_arrays(path):
+    """
+    Memory-map the arrays written by save_id_arrays; the returned numpy arrays share the pages of the file
+    """
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    names = json.loads(reader.schema.metadata[config.ID_ARRAY_NAMES_KEY])
+    arrays = {}
+    for index, name in enumerate(names):
+        column = reader.get_batch(index).column(0)
+        arrays[name] = column.to_numpy() if len(column) > 0 else np.empty(0, dtype = np.int64)
+    return arrays
+
+class IDArrayMap(collections.abc.Mapping):
+    """
+    Read-only id -> id map stored as two int64 arrays sorted by key.
+    Unlike a dict, reading it creates no per-entry objects, so the pages stay shared with forked workers
+    """
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+        self._key_view = memoryview(keys)
+        self._value_view = memoryview(values)
+
+    @classmethod
+    def from_dict(cls, id_to_id):
+        keys = to_int64_array(list(id_to_id.keys()))
+        values = to_int64_array(list(id_to_id.values()))
+        if keys is None or values is None:
+            return None
+        order = np.argsort(keys, kind = "stable")
+        return cls(keys[order], values[order])
+
+    def _find(self, key):
+        key = normalize_id_key(key)
+        if key is None:
+            return -1
+        index = bisect.bisect_left(self._key_view, key)
+        if index < len(self._key_view) and self._key_view[index] == key:
+            return index
+        return -1
+
+    def __getitem__(self, key):
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._value_view[index]
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        return iter(self._keys.tolist())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def to_dict(self):
+        return dict(zip(self._keys.tolist(), self._values.tolist()))
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}_keys": self._keys, f"{prefix}_values": self._values}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[f"{prefix}_keys"], arrays[f"{prefix}_values"])
+
+class IDListArrayMap(IDArrayMap):
+    """
+    Read-only id -> [ids] map: the lists are stored back to back in one int64 array (CSR layout),
+    and values[offsets[i]:offsets[i + 1]] belongs to the i-th key
+    """
+    def __init__(self, keys, offsets, values):
+        super().__init__(keys, values)
+        self._offsets = offsets
+        self._offset_view = memoryview(offsets)
+
+    @classmethod
+    def from_dict(cls, id_to_ids):
+        keys = to_int64_array(list(id_to_ids.keys()))
+        if keys is None:
+            return None
+        order = np.argsort(keys, kind = "stable")
+        id_lists = list(id_to_ids.values())
+        lengths = [0] * len(id_lists)
+        values = []
+        for position, index in enumerate(order.tolist()):
+            each_list = to_int64_array(list(id_lists[index]))
+            if each_list is None:
+                return None
+            lengths[position] = len(each_list)
+            values.append(each_list)
+        offsets = np.zeros(len(keys) + 1, dtype = np.int64)
+        np.cumsum(lengths, out = offsets[1:])
+        values = np.concatenate(values) if values else np.empty(0, dtype = np.int64)
+        return cls(keys[order], offsets, values)
+
+    def __getitem__(self, key):
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._values[self._offset_view[index]:self._offset_view[index + 1]].tolist()
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
+
+    def to_arrays(self, prefix):
+        arrays = super().to_arrays(prefix)
+        arrays[f"{prefix}_offsets"] = self._offsets
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[f"{prefix}_keys"], arrays[f"{prefix}_offsets"], arrays[f"{prefix}_values"])
+
+class BundleReader:
+    """
+    Read-only, memory-mapped view of a bundle file (arrow IPC / feather v2).
+    Nothing is materialized when the bundle is opened: the row ranges of each value of a queried column come from
+    the bundle's offsets sidecar (written by the loader at export time), or are computed from that column alone,
+    and a query only decodes the record batches covering the matched rows.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._offsets_path = f"{path}.{config.BUNDLE_OFFSETS_SUFFIX}"
+        self._reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        self._schema = util.list_to_dict_with_index(self._reader.schema.names)
+        self._batch_offsets = None
+        self._value_ranges = None
+        self._nullable_int_columns = []
+        metadata = self.get_metadata()
+        if config.NULLABLE_INT_COLUMNS_KEY in metadata:
+            self._nullable_int_columns = json.loads(metadata[config.NULLABLE_INT_COLUMNS_KEY])
+
+    def __len__(self):
+        self._init_batch_offsets()
+        return self._batch_offsets[-1]
+
+    def get_metadata(self):
+        return self._reader.schema.metadata or {}
+
+    def _read_columns(self, column_names):
+        options = pa.ipc.IpcReadOptions(included_fields = [self._schema[name] for name in column_names])
+        return pa.ipc.open_file(pa.memory_map(self._path, "r"), options = options).read_all()
+
+    def _init_batch_offsets(self, column = None):
+        if self._batch_offsets is not None:
+            return
+        if column is None:
+            column = self._read_columns([self._reader.schema.names[0]]).column(0)
+        offsets = [0]
+        for chunk in column.chunks:
+            offsets.append(offsets[-1] + len(chunk))
+        self._batch_offsets = offsets
+
+    def _load_offsets(self):
+        self._value_ranges = {}
+        if not os.path.exists(self._offsets_path):
+            return
+
+        offsets = pa.ipc.open_file(pa.memory_map(self._offsets_path, "r")).read_all()
+        self._batch_offsets = json.loads(offsets.schema.metadata[config.BATCH_OFFSETS_KEY])
+        columns = offsets.column("column").to_numpy(zero_copy_only = False)
+        run_values = offsets.column("value").to_numpy()
+        starts = offsets.column("start").to_numpy()
+        ends = offsets.column("end").to_numpy()
+        for column_name in np.unique(columns):
+            selected = columns == column_name
+            self._value_ranges[str(column_name)] = (run_values[selected], starts[selected], ends[selected])
+
+    def _indexing_column(self, column_name):
+        column = self._read_columns([column_name]).column(0)
+        self._init_batch_offsets(column)
+
+        values = column.to_numpy(zero_copy_only = False)
+        value_ranges = compute_value_ranges(values)
+        if value_ranges is None:
+            # non-numeric column: fall back to a dict of value -> ranges
+            value_ranges = {}
+            if len(values) > 0:
+                boundaries = np.flatnonzero(values[1:] != values[:-1]) + 1
+                starts = np.concatenate(([0], boundaries)).tolist()
+                ends = np.concatenate((boundaries, [len(values)])).tolist()
+                for start, end in zip(starts, ends):
+                    value = values[start].item() if isinstance(values[start], np.generic) else values[start]
+                    if util.isna(value):
+                        continue
+                    value_ranges.setdefault(value, []).append((start, end))
+        self._value_ranges[column_name] = value_ranges
+
+    def obtain_value_ranges(self, column_name, value):
+        if self._value_ranges is None:
+            self._load_offsets()
+        if column_name not in self._value_ranges:
+            self._indexing_column(column_name)
+
+        value_ranges = self._value_ranges[column_name]
+        if isinstance(value_ranges, dict):
+            return value_ranges.get(value, [])
+
+        run_values, starts, ends = value_ranges
+        try:
+            left = np.searchsorted(run_values, value, side = "left")
+            right = np.searchsorted(run_values, value, side = "right")
+        except (TypeError, ValueError):
+            return []
+        # searchsorted keeps the order of the runs, i.e., the row order
+        return list(zip(starts[left:right].tolist(), ends[left:right].tolist()))
+
+    def save_offsets(self, column_names):
+        """
+        Write the offsets sidecar of this bundle:
+        the row ranges of each value of the given (numeric) columns, and the row offsets of the record batches
+        """
+        if self._value_ranges is None:
+            self._value_ranges = {}
+
+        names, run_values, starts, ends = [], [], [], []
+        for column_name in column_names:
+            if column_name not in self._schema:
+                continue
+            if column_name not in self._value_ranges:
+                self._indexing_column(column_name)
+            value_ranges = self._value_ranges[column_name]
+            if isinstance(value_ranges, dict):
+                continue
+            values = value_ranges[0]
+            if values.dtype.kind == "f":
+                if not np.all(np.mod(values, 1) == 0):
+                    continue
+                values = values.astype(np.int64)
+            names.extend([column_name] * len(values))
+            run_values.append(values)
+            starts.append(value_ranges[1])
+            ends.append(value_ranges[2])
+
+        self._init_batch_offsets()
+        empty = np.empty(0, dtype = np.int64)
+        table = pa.table({
+            "column": pa.array(names, type = pa.string()),
+            "value": pa.array(np.concatenate(run_values) if run_values else empty, type = pa.int64()),
+            "start": pa.array(np.concatenate(starts) if starts else empty, type = pa.int64()),
+            "end": pa.array(np.concatenate(ends) if ends else empty, type = pa.int64()),
+        }).replace_schema_metadata({config.BATCH_OFFSETS_KEY: json.dumps(self._batch_offsets)})
+        with pa.ipc.new_file(self._offsets_path, table.schema) as writer:
+            writer.write_table(table)
+
+    def read_rows(self, start, end):
+        self._init_batch_offsets()
+        first_batch = bisect.bisect_right(self._batch_offsets, start) - 1
+        batches = []
+        batch_index = first_batch
+        while batch_index < self._reader.num_record_batches and self._batch_offsets[batch_index] < end:
+            batch_start = self._batch_offsets[batch_index]
+            batch = self._reader.get_batch(batch_index)
+            batches.append(batch.slice(max(start - batch_start, 0), end - max(start, batch_start)))
+            batch_index += 1
+        return pa.Table.from_batches(batches, schema = self._reader.schema)
+
+    def to_data_model(self, table, index):
+        # integer columns containing nulls somewhere in the bundle use the pandas nullable integer types
+        data = arrow_to_pandas(table, self._nullable_int_columns)
+        data.index = index
+        return DataModel(data)
+
+    def query_index_column_value(self, column_name, value) -> "DataModel":
+        if util.isna(value):
+            return []
+
+        if column_name not in self._schema:
+            util.error_and_quit(f"Failed to find column \"{column_name}\"")
+
+        ranges = self.obtain_value_ranges(column_name, value)
+        if not ranges:
+            return []
+
+        tables = []
+        index = []
+        for start, end in ranges:
+            tables.append(self.read_rows(start, end))
+            index.extend(range(start, end))
+        table = tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+        return self.to_data_model(table, pd.Index(index))
+
+    def load_all(self):
+        return self.to_data_model(self._reader.read_all(), pd.RangeIndex(len(self)))
+
 class Row:
     def __init__(self, row, schema, index):
         object.__setattr__(self, "_row", row)
@@ -360,6 +734,10 @@ class Row:
         new_index = self._index
         return Row(new_row, new_schema, new_index)
 
+    def __reduce__(self):
+        # __getattr__ cannot run before _schema is set, so do not let pickle restore the attributes one by one
+        return (Row, (self._row, self._schema, self._index))
+
     def __getattr__(self, item):
         pos = self._schema.get(item, -1)
         if pos != -1:
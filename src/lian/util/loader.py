@@ -4,6 +4,7 @@ import json
 import math
 import os
 import ast
+import pickle
 import re
 
 import networkx as nx
@@ -12,9 +13,13 @@ import numpy
 from bisect import insort
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather
 from dataclasses import dataclass
 
-from lian.util.data_model import DataModel
+from lian.util.data_model import (
+    DataModel, BundleReader, IDArrayMap, IDListArrayMap, save_id_arrays, load_id_arrays, arrow_to_pandas
+)
 from lian.config import schema
 from lian.util import util
 from lian.util import readable_gir
@@ -27,6 +32,7 @@ from lian.config.constants import (
     GIR_COLUMNS_TO_BE_ADDED,
     ANALYSIS_PHASE_ID,
 )
+from lian import common_structs
 from lian.common_structs import (
     BasicGraph,
     CallSite,
@@ -55,7 +61,8 @@ from lian.common_structs import (
     StateFlowGraph,
     SFGNode,
     SFGEdge,
-    CallSite
+    CallSite,
+    decode_def_nodes,
 )
 
 def json_dict_value_list_to_set_hook(d):
@@ -139,6 +146,18 @@ class ModuleSymbolsLoader:
 
         self.module_dir_ids = self.all_module_ids - self.module_unit_ids
 
+    def update_unit_hashes(self, unit_id_to_hash):
+        if len(unit_id_to_hash) == 0 or util.is_empty(self.module_symbol_table):
+            return
+        hashes = []
+        for row in self.module_symbol_table:
+            unit_hash = row.hash
+            if util.is_empty(unit_hash):
+                unit_hash = unit_id_to_hash.get(row.module_id, unit_hash)
+            hashes.append(unit_hash)
+        self.module_symbol_table.modify_column("hash", hashes)
+        self._do_cache()
+
     def export(self):
         if util.is_available(self.module_symbol_table):
             self.module_symbol_table.save(self.path)
@@ -220,7 +239,12 @@ class GeneralLoader:
         get: load the item from the storage
         save: save the item to the living bundle
         export: export the items in the living bundle to the storage
+
+    indexed_columns lists the columns that query_flattened_item_when_loading looks items up by; their row ranges are
+    written to the offsets sidecar of each exported bundle
     """
+    indexed_columns = []
+
     def __init__(self, options, item_schema, bundle_path_summary, item_cache_capacity, bundle_cache_capacity):
         # use this to find the path of the corresponding bundle
         self.options = options
@@ -247,6 +271,9 @@ class GeneralLoader:
     def flatten_item_when_saving(self, _id, item_content):
         return None
 
+    def convert_active_item_to_data_model(self, flattened_item):
+        return DataModel(flattened_item, columns=self.item_schema)
+
     def convert_active_bundle_to_dataframe(self):
         accumulated_rows = []
         for key in sorted(self.active_bundle.keys()):
@@ -258,6 +285,9 @@ class GeneralLoader:
     def get_bundle_path(self, bundle_id):
         return f"{self.bundle_path_summary}.bundle{bundle_id}"
 
+    def load_bundle(self, bundle_id):
+        return BundleReader(self.get_bundle_path(bundle_id))
+
     def new_bundle_id(self):
         result = self.bundle_count
         self.bundle_count += 1
@@ -279,7 +309,7 @@ class GeneralLoader:
             result = self.active_bundle.get(_id, None)
             if util.is_available(result):
                 if result.data_model is None:
-                    result.data_model = DataModel(result.flattened_item, columns=self.item_schema)
+                    result.data_model = self.convert_active_item_to_data_model(result.flattened_item)
                 dm = result.data_model
                 self.item_cache.put(_id, dm)
                 return dm
@@ -290,8 +320,7 @@ class GeneralLoader:
         if self.bundle_cache.contain(bundle_id):
             bundle_data = self.bundle_cache.get(bundle_id)
         else:
-            bundle_path = self.get_bundle_path(bundle_id)
-            bundle_data = DataModel().load(bundle_path)
+            bundle_data = self.load_bundle(bundle_id)
             self.bundle_cache.put(bundle_id, bundle_data)
 
         item_df = self.query_flattened_item_when_loading(_id, bundle_data)
@@ -325,24 +354,42 @@ class GeneralLoader:
                 bundle_path = self.get_bundle_path(bundle_id)
                 bundle_data = DataModel().load(bundle_path)
                 bundle_data.remove_rows("unit_id", _id)
-                bundle_data.save(bundle_path)
+                if bundle_data.save(bundle_path, chunksize = config.BUNDLE_RECORD_BATCH_ROWS) is not None:
+                    self.save_bundle_offsets(bundle_path)
 
     def save(self, _id, item_content):
         flattened_item = self.flatten_item_when_saving(_id, item_content)
         #self.item_cache.put(_id, flattened_item)
+        self.save_flattened_item(_id, flattened_item)
+        return item_content
+
+    def save_flattened_item(self, _id, flattened_item):
+        # a saved item replaces the cached one, e.g., when the results of another process are replayed
+        self.item_cache.remove(_id)
         self.active_bundle[_id] = ActiveItem(flattened_item = flattened_item, data_model = None)
         self.item_id_to_bundle_id[_id] = -1
         self.active_bundle_length += len(flattened_item)
         if self.active_bundle_length > config.MAX_ROWS:
             self.export()
-        return item_content
+
+    def copy_item_from(self, other_loader, _id):
+        # copy the flattened rows of an item from another loader, e.g., the one of the previous workspace
+        if not other_loader.contain(_id):
+            return False
+        item_df = other_loader.get_raw_item_by_id(_id)
+        flattened_item = []
+        if isinstance(item_df, DataModel):
+            flattened_item = [row.to_dict() for row in item_df]
+        self.save_flattened_item(_id, flattened_item)
+        return True
 
     def export(self):
         if self.active_bundle_length > 0:
             new_bundle_id = self.new_bundle_id()
             bundle_df = self.convert_active_bundle_to_dataframe()
             bundle_path = f"{self.bundle_path_summary}.bundle{new_bundle_id}"
-            bundle_df.save(bundle_path)
+            if bundle_df.save(bundle_path, chunksize = config.BUNDLE_RECORD_BATCH_ROWS) is not None:
+                self.save_bundle_offsets(bundle_path)
 
             self.bundle_cache.put(new_bundle_id, bundle_df)
             for item_id, bundle_id in self.item_id_to_bundle_id.items():
@@ -354,6 +401,10 @@ class GeneralLoader:
 
         #self.item_cache.clean()
 
+    def save_bundle_offsets(self, bundle_path):
+        if len(self.indexed_columns) > 0:
+            BundleReader(bundle_path).save_offsets(self.indexed_columns)
+
     def export_indexing(self):
         results = []
         for (key, value) in self.item_id_to_bundle_id.items():
@@ -384,6 +435,8 @@ class UnitLevelLoader(GeneralLoader):
     """
     This loader is used to manage unit-level data content
     """
+    indexed_columns = ["unit_id"]
+
     def query_flattened_item_when_loading(self, unit_id, bundle_data):
         flattened_item = bundle_data.query_index_column_value("unit_id", unit_id)
         return flattened_item
@@ -401,12 +454,97 @@ class UnitLevelLoader(GeneralLoader):
         return results
 
 class UnitGIRLoader(UnitLevelLoader):
+    """
+    GIR is stored column by column: each unit is converted into an arrow RecordBatch as soon as it is saved,
+    and the batches of the active bundle are written to gir.bundleN without building a pandas DataFrame.
+    The common columns have declared types (schema.gir_column_types), and every bundle records
+    config.GIR_SCHEMA_VERSION in its metadata.
+    """
+    def build_column(self, name, values):
+        # from_pandas: the missing ids of GIR rows read back from a bundle are pd.NA
+        column_type = schema.gir_column_types.get(name)
+        if column_type is not None:
+            try:
+                return pa.array(values, type = column_type, from_pandas = True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+
+        try:
+            return pa.array(values, from_pandas = True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            util.warn(f"GIR column <{name}> contains mixed types; its values are stored as strings")
+            return pa.array([None if value is None or value is pd.NA else str(value) for value in values], type = pa.large_string())
+
+    def flatten_item_when_saving(self, unit_id, item_content):
+        if isinstance(item_content, DataModel):
+            item_content = [row.to_dict() for row in item_content]
+
+        rows = [item if isinstance(item, dict) else item.to_dict() for item in item_content]
+        names = list(dict.fromkeys(key for row in rows for key in row))
+        if "unit_id" not in names:
+            names.append("unit_id")
+
+        arrays = []
+        for name in names:
+            if name == "unit_id":
+                arrays.append(pa.array([unit_id] * len(rows), type = pa.int64()))
+            else:
+                arrays.append(self.build_column(name, [row.get(name) for row in rows]))
+        return pa.RecordBatch.from_arrays(arrays, names = names)
+
+    def convert_active_item_to_data_model(self, flattened_item):
+        return DataModel(arrow_to_pandas(flattened_item))
+
+    def convert_active_bundle_to_table(self):
+        batches = [self.active_bundle[key].flattened_item for key in sorted(self.active_bundle.keys())]
+        bundle_schema = pa.unify_schemas([batch.schema for batch in batches], promote_options = "permissive")
+        # columns without any value are kept as float64 (all NaN), which is how pandas stores them
+        bundle_schema = pa.schema([
+            pa.field(field.name, pa.float64()) if pa.types.is_null(field.type) else field
+            for field in bundle_schema
+        ])
+
+        aligned_batches = []
+        for batch in batches:
+            arrays = []
+            for field in bundle_schema:
+                column = batch.column(field.name) if field.name in batch.schema.names else None
+                if column is None:
+                    arrays.append(pa.nulls(len(batch), type = field.type))
+                else:
+                    arrays.append(column.cast(field.type))
+            aligned_batches.append(pa.RecordBatch.from_arrays(arrays, schema = bundle_schema))
+        table = pa.Table.from_batches(aligned_batches, schema = bundle_schema)
+        table = table.unify_dictionaries().combine_chunks()
+        nullable_int_columns = [
+            field.name for field, column in zip(table.schema, table.columns)
+            if pa.types.is_integer(field.type) and column.null_count > 0
+        ]
+        return table.replace_schema_metadata({
+            config.GIR_SCHEMA_VERSION_KEY: str(config.GIR_SCHEMA_VERSION),
+            config.NULLABLE_INT_COLUMNS_KEY: json.dumps(nullable_int_columns),
+        })
+
+    def load_bundle(self, bundle_id):
+        bundle = super().load_bundle(bundle_id)
+        metadata = bundle.get_metadata()
+        # bundles without the version key were written by pandas before the GIR schema was declared
+        version = metadata.get(config.GIR_SCHEMA_VERSION_KEY)
+        if version is not None and int(version) != config.GIR_SCHEMA_VERSION:
+            util.error_and_quit(
+                f"{self.get_bundle_path(bundle_id)} uses GIR schema version {int(version)}, "
+                f"but version {config.GIR_SCHEMA_VERSION} is expected. Please regenerate the workspace with -f"
+            )
+        return bundle
+
     def export(self):
         if self.active_bundle_length > 0:
             new_bundle_id = self.new_bundle_id()
-            bundle_df = self.convert_active_bundle_to_dataframe()
-            bundle_path = f"{self.bundle_path_summary}.bundle{new_bundle_id}"
-            bundle_df.save(bundle_path)
+            bundle_path = self.get_bundle_path(new_bundle_id)
+            pyarrow.feather.write_feather(
+                self.convert_active_bundle_to_table(), bundle_path, chunksize = config.BUNDLE_RECORD_BATCH_ROWS
+            )
+            self.save_bundle_offsets(bundle_path)
 
             for item_id, bundle_id in self.item_id_to_bundle_id.items():
                 if bundle_id == -1:
@@ -462,6 +600,8 @@ class ClassIDToMembersLoader(UnitLevelLoader):
 
 
 class SymbolNameToScopeIDsLoader(GeneralLoader):
+    indexed_columns = ["unit_id"]
+
     def query_flattened_item_when_loading(self, unit_id, bundle_data):
         flattened_item = bundle_data.query_index_column_value("unit_id", unit_id)
         #print("flattened_item", flattened_item)
@@ -486,6 +626,8 @@ class SymbolNameToScopeIDsLoader(GeneralLoader):
         return symbol_name_to_scope_ids
 
 class ScopeIDToSymbolInfoLoader(GeneralLoader):
+    indexed_columns = ["unit_id"]
+
     def query_flattened_item_when_loading(self, unit_id, bundle_data):
         flattened_item = bundle_data.query_index_column_value("unit_id", unit_id)
         return flattened_item
@@ -519,6 +661,8 @@ class ScopeIDToSymbolInfoLoader(GeneralLoader):
         return scope_id_to_symbol_info
 
 class ScopeIDToAvailableScopeIDsLoader(GeneralLoader):
+    indexed_columns = ["unit_id"]
+
     def query_flattened_item_when_loading(self, unit_id, bundle_data):
         flattened_item = bundle_data.query_index_column_value("unit_id", unit_id)
         return flattened_item
@@ -592,6 +736,8 @@ class StmtIDToScopeIDLoader:
             self.stmt_id_to_scope_id[stmt_id] = scope_id
 
 class SymbolNameToDeclIDsLoader(GeneralLoader):
+    indexed_columns = ["unit_id"]
+
     def query_flattened_item_when_loading(self, unit_id, bundle_data):
         flattened_item = bundle_data.query_index_column_value("unit_id", unit_id)
         return flattened_item
@@ -665,16 +811,88 @@ class MethodIDToMethodDeclFormatLoader:
         for row in df:
             self.method_id_to_method_decl_format[row.method_id] = row
 
-class UnitIDToStmtIDLoader:
+class IDMapLoader:
+    """
+    Base of the loaders keeping id maps (dicts) in memory; id_maps lists the attribute names and the classes of
+    their read-only forms. Once frozen:
+    1. each map is a few sorted int64 arrays (data_model.IDArrayMap), which forked workers read without copying
+    2. the arrays are exported to <path>.idmap, so a read-only restore memory-maps them instead of rebuilding dicts
+    3. any save turns the maps back into dicts first
+    """
+    id_maps = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.frozen = False
+
+    def freeze(self):
+        if self.frozen or len(self.id_maps) == 0:
+            return
+
+        frozen_maps = {}
+        for name, map_class in self.id_maps.items():
+            frozen_map = map_class.from_dict(getattr(self, name))
+            if frozen_map is None:
+                # not all keys and values are ids
+                return
+            frozen_maps[name] = frozen_map
+
+        for name, frozen_map in frozen_maps.items():
+            setattr(self, name, frozen_map)
+        self.frozen = True
+
+    def thaw(self):
+        if not self.frozen:
+            return
+
+        for name in self.id_maps:
+            setattr(self, name, getattr(self, name).to_dict())
+        self.frozen = False
+
+    def get_id_map_path(self):
+        return f"{self.path}.{config.ID_MAP_SUFFIX}"
+
+    def export_id_maps(self):
+        id_map_path = self.get_id_map_path()
+        arrays = {}
+        for name, map_class in self.id_maps.items():
+            frozen_map = getattr(self, name) if self.frozen else map_class.from_dict(getattr(self, name))
+            if frozen_map is None:
+                arrays = None
+                break
+            arrays.update(frozen_map.to_arrays(name))
+
+        if arrays:
+            save_id_arrays(id_map_path, arrays)
+        elif os.path.exists(id_map_path):
+            # never leave the arrays of a previous export next to the new data
+            os.remove(id_map_path)
+
+    def attach_id_maps(self):
+        id_map_path = self.get_id_map_path()
+        if len(self.id_maps) == 0 or not os.path.exists(id_map_path):
+            return False
+
+        arrays = load_id_arrays(id_map_path)
+        for name, map_class in self.id_maps.items():
+            setattr(self, name, map_class.from_arrays(arrays, name))
+        self.frozen = True
+        return True
+
+class UnitIDToStmtIDLoader(IDMapLoader):
+    id_maps = {"unit_id_to_stmt_ids": IDListArrayMap, "stmt_id_to_unit_id": IDArrayMap}
+
     def __init__(self, path):
+        super().__init__(path)
         self.unit_id_to_stmt_ids = {}
         self.stmt_id_to_unit_id = {}
-        self.path = path
 
     def save(self, unit_id, all_ids):
         if len(all_ids) == 0:
             return
 
+        self.thaw()
+
         self.unit_id_to_stmt_ids[unit_id] = all_ids
         for stmt_id in all_ids:
             self.stmt_id_to_unit_id[stmt_id] = unit_id
@@ -699,8 +917,13 @@ class UnitIDToStmtIDLoader:
         for (unit_id, stmt_ids) in self.unit_id_to_stmt_ids.items():
             results.append([unit_id, min(stmt_ids), max(stmt_ids)])
         DataModel(results, columns = schema.unit_id_to_stmt_id_schema).save(self.path)
+        self.export_id_maps()
 
-    def restore(self):
+    def restore(self, read_only = False):
+        if read_only and self.attach_id_maps():
+            return
+
+        self.thaw()
         df = DataModel().load(self.path)
         for row in df:
             unit_id = row.unit_id
@@ -711,9 +934,11 @@ class UnitIDToStmtIDLoader:
             for stmt_id in stmt_ids:
                 self.stmt_id_to_unit_id[stmt_id] = unit_id
 
-class OneToManyMapLoader:
+class OneToManyMapLoader(IDMapLoader):
+    id_maps = {"one_to_many": IDListArrayMap, "many_to_one": IDArrayMap}
+
     def __init__(self, path, schema):
-        self.path = path
+        super().__init__(path)
         self.schema = schema
         self.one_to_many = {}
         self.many_to_one = {}
@@ -722,6 +947,7 @@ class OneToManyMapLoader:
         if len(many) == 0:
             return
 
+        self.thaw()
         if isinstance(many, set):
             many = list(many)
 
@@ -753,8 +979,13 @@ class OneToManyMapLoader:
         for (one, many) in self.one_to_many.items():
             results.append([one, many])
         DataModel(results, columns = self.schema).save(self.path)
+        self.export_id_maps()
 
-    def restore(self):
+    def restore(self, read_only = False):
+        if read_only and self.attach_id_maps():
+            return
+
+        self.thaw()
         df = DataModel().load(self.path)
         for row in df:
             one, many = row.raw_data()
@@ -770,6 +1001,7 @@ class UnitIDToMethodIDLoader(OneToManyMapLoader):
         return stmt_id in self.many_to_one
 
     def add_method_id_to_unit_id(self, method_id, unit_id):
+        self.thaw()
         if unit_id in self.one_to_many:
             self.one_to_many[unit_id].append(method_id)
         else:
@@ -782,6 +1014,7 @@ class ClassIdToNameLoader(OneToManyMapLoader):
         super().__init__(path, schema.class_id_to_class_name_schema)
 
     def save(self, class_name, class_id):
+        self.thaw()
         if class_name not in self.one_to_many:
             self.one_to_many[class_name] = set()
         self.one_to_many[class_name].add(class_id)
@@ -792,6 +1025,7 @@ class MethodIDToMethodNameLoader(OneToManyMapLoader):
         super().__init__(path, schema.method_id_to_method_name_schema)
 
     def save(self, method_name, method_id):
+        self.thaw()
         if method_name not in self.one_to_many:
             self.one_to_many[method_name] = set()
         self.one_to_many[method_name].add(method_id)
@@ -867,6 +1101,9 @@ class ClassIDToFieldIDLoader(OneToManyMapLoader):
         return stmt_id in fields
 
 class ClassIDToMethodsLoader(OneToManyMapLoader):
+    # the methods are MethodInClass objects, so the maps are never frozen
+    id_maps = {}
+
     def __init__(self, path):
         super().__init__(path, schema.class_id_to_methods_schema)
 
@@ -898,7 +1135,7 @@ class ClassIDToMethodsLoader(OneToManyMapLoader):
                 ])
         DataModel(results, columns = schema.class_id_to_methods_schema).save(self.path)
 
-    def restore(self):
+    def restore(self, read_only = False):
         df = DataModel().load(self.path)
         for row in df:
             unit_id, class_id, method_name, method_stmt_id = row.raw_data()
@@ -971,6 +1208,8 @@ class EntryPointsLoader:
         self.entry_points = set(data[0])
 
 class CFGLoader(GeneralLoader):
+    indexed_columns = ["method_id"]
+
     def query_flattened_item_when_loading(self, method_id, bundle_data):
         flattened_item = bundle_data.query_index_column_value("method_id", method_id)
         return flattened_item
@@ -997,6 +1236,8 @@ class CFGLoader(GeneralLoader):
 # The following is to deal with the results of basic analysis
 ##############################################################
 class MethodLevelAnalysisResultLoader(GeneralLoader):
+    indexed_columns = ["hash_id", "method_id"]
+
     def query_flattened_item_when_loading(self, _id, bundle_data):
         if type(_id) == tuple:
             flattened_item = bundle_data.query_index_column_value("hash_id", hash(_id))
@@ -1025,8 +1266,8 @@ class MethodLevelAnalysisResultLoader(GeneralLoader):
         for row in df:
             data = row.raw_data()
             key = data[0]
-            if isinstance(key, list):
-                key = tuple(key)
+            if isinstance(key, (list, numpy.ndarray)):
+                key = tuple(int(each_id) for each_id in key)
             if isinstance(key, tuple) and len(key) == 3:
                 try:
                     key = CallSite(key[0], key[1], key[2])
@@ -1040,14 +1281,82 @@ class MethodLevelAnalysisResultLoader(GeneralLoader):
                 self.item_id_to_bundle_id[key] = data[1]
                 self.bundle_count = max(self.bundle_count, data[1] + 1)
 
+    def copy_items_from(self, other_loader, method_ids):
+        """
+        copy the flattened rows of the given methods from another loader, reading each of its bundles only once
+        """
+        bundle_id_to_method_ids = {}
+        for method_id in method_ids:
+            bundle_id = other_loader.item_id_to_bundle_id.get(method_id)
+            if bundle_id == -1:
+                self.copy_item_from(other_loader, method_id)
+            elif bundle_id is not None:
+                bundle_id_to_method_ids.setdefault(bundle_id, set()).add(method_id)
+
+        for bundle_id in sorted(bundle_id_to_method_ids):
+            method_id_to_rows = {method_id: [] for method_id in bundle_id_to_method_ids[bundle_id]}
+            bundle_data = other_loader.load_bundle(bundle_id).load_all()
+            for row in bundle_data.get_data().to_dict(orient = "records"):
+                rows = method_id_to_rows.get(row["method_id"])
+                if rows is not None:
+                    rows.append(row)
+            for method_id in sorted(method_id_to_rows):
+                self.save_flattened_item(method_id, method_id_to_rows[method_id])
+
+    def group_rows_by_method_id(self, columns):
+        """
+        the given columns of all saved rows, grouped by method_id; each bundle is read only once
+        """
+        method_id_to_rows = {}
+        for method_id, active_item in self.active_bundle.items():
+            method_id_to_rows[method_id] = [tuple(row.get(column) for column in columns) for row in active_item.flattened_item]
+
+        for bundle_id in sorted(set(self.item_id_to_bundle_id.values()) - {-1}):
+            bundle_data = self.load_bundle(bundle_id).load_all().get_data()
+            if len(bundle_data) == 0:
+                continue
+            for method_id, group in bundle_data.groupby("method_id", sort = False):
+                method_id_to_rows[method_id] = list(group[columns].itertuples(index = False, name = None))
+        return method_id_to_rows
+
+    def get_items_in_bundle_order(self, item_ids = None):
+        """
+        yield (item_id, item) of the given items (all saved items by default), grouped by bundle so that each bundle
+        is opened only once; the item cache is bypassed since every item is read once
+        """
+        if item_ids is None:
+            item_ids = self.item_id_to_bundle_id.keys()
+        bundle_id_to_item_ids = {}
+        for item_id in item_ids:
+            bundle_id = self.item_id_to_bundle_id.get(item_id)
+            if bundle_id is not None:
+                bundle_id_to_item_ids.setdefault(bundle_id, []).append(item_id)
+
+        for bundle_id in sorted(bundle_id_to_item_ids):
+            if bundle_id == -1:
+                for item_id in bundle_id_to_item_ids[bundle_id]:
+                    yield item_id, self.get_item_by_id(item_id)
+                continue
+
+            if self.bundle_cache.contain(bundle_id):
+                bundle_data = self.bundle_cache.get(bundle_id)
+            else:
+                bundle_data = self.load_bundle(bundle_id)
+            for item_id in bundle_id_to_item_ids[bundle_id]:
+                item_df = self.query_flattened_item_when_loading(item_id, bundle_data)
+                if isinstance(item_df, DataModel):
+                    item_df = self.unflatten_item_dataframe_when_loading(item_id, item_df)
+                yield item_id, item_df
+
 class BitVectorManagerLoader(MethodLevelAnalysisResultLoader):
     def unflatten_item_dataframe_when_loading(self, _id, flattened_item):
         manager = BitVectorManager()
-        counter = 0
+        counter = 1
         id_to_bit_pos = {}
         bit_pos_to_id = {}
         for row in flattened_item:
-            counter += 1
+            # new bits must not reuse the positions of the loaded ones
+            counter = max(counter, int(row.bit_pos) + 1)
             bit_id = None
             if row.state_id:
                 bit_id = StateDefNode(index = int(row.index), state_id = int(row.state_id), stmt_id = int(row.stmt_id))
@@ -1069,34 +1378,6 @@ class StmtStatusLoader(MethodLevelAnalysisResultLoader):
     def unflatten_item_dataframe_when_loading(self, method_id, flattened_item):
         stmt_to_status = {}
         for row in flattened_item:
-            in_symbol_bits_list = json.loads(row.in_symbol_bits)
-            new_in_symbol_bits_list = []
-            for item in in_symbol_bits_list:
-                new_in_symbol_bits_list.append(
-                    SymbolDefNode(index = item["index"], symbol_id = item["symbol_id"], stmt_id = item["stmt_id"])
-                )
-
-            out_symbol_bits_list = json.loads(row.out_symbol_bits)
-            new_out_symbol_bits_list = []
-            for item in out_symbol_bits_list:
-                new_out_symbol_bits_list.append(
-                    SymbolDefNode(index = item["index"], symbol_id = item["symbol_id"], stmt_id = item["stmt_id"])
-                )
-
-            in_state_bits_list = json.loads(row.in_state_bits)
-            new_in_state_bits_list = []
-            for item in in_state_bits_list:
-                new_in_state_bits_list.append(
-                    StateDefNode(index = item["index"], state_id = item["state_id"], stmt_id = item["stmt_id"])
-                )
-
-            out_state_bits_list = json.loads(row.out_state_bits)
-            new_out_state_bits_list = []
-            for item in out_state_bits_list:
-                new_out_state_bits_list.append(
-                    StateDefNode(index = item["index"], state_id = item["state_id"], stmt_id = item["stmt_id"])
-                )
-
             stmt_to_status[row.stmt_id] = \
                 StmtStatus(
                     stmt_id = int(row.stmt_id),
@@ -1104,11 +1385,11 @@ class StmtStatusLoader(MethodLevelAnalysisResultLoader):
                     used_symbols = json.loads(row.used_symbols),
                     implicitly_defined_symbols = json.loads(row.implicitly_defined_symbols),
                     implicitly_used_symbols = json.loads(row.implicitly_used_symbols),
-                    in_symbol_bits = set(new_in_symbol_bits_list),
-                    out_symbol_bits = set(new_out_symbol_bits_list),
+                    in_symbol_bits = decode_def_nodes(row.in_symbol_bits, SymbolDefNode),
+                    out_symbol_bits = decode_def_nodes(row.out_symbol_bits, SymbolDefNode),
                     defined_states = set(json.loads(row.defined_states)),
-                    in_state_bits = set(new_in_state_bits_list),
-                    out_state_bits = set(new_out_state_bits_list),
+                    in_state_bits = decode_def_nodes(row.in_state_bits, StateDefNode),
+                    out_state_bits = decode_def_nodes(row.out_state_bits, StateDefNode),
                     field_name = row.field,
                 )
         return stmt_to_status
@@ -1131,7 +1412,7 @@ class SymbolStateSpaceLoader(MethodLevelAnalysisResultLoader):
                     source_unit_id = row.source_unit_id,
                     name = row.name,
                     default_data_type = row.default_data_type,
-                    states = set(row.states),
+                    states = {int(index) for index in row.states},
                     symbol_or_state = row.symbol_or_state
                 )
             else:
@@ -1277,11 +1558,11 @@ class MethodSummaryLoader:
 
         results = {}
         for item in l:
-            key = item[0]
-            raw_index = item[1]
-            new_index = item[2]
+            key = int(item[0])
+            raw_index = int(item[1])
+            new_index = int(item[2])
             if len(item) > 3:
-                default_value_symbol_id = item[3]
+                default_value_symbol_id = int(item[3])
             else:
                 default_value_symbol_id = -1
 
@@ -1297,6 +1578,16 @@ class MethodSummaryLoader:
 
         return results
 
+    def convert_pair_list_to_dict(self, l):
+        if util.is_empty(l):
+            return {}
+        return {int(item[0]): int(item[1]) for item in l}
+
+    def convert_list_to_set(self, l):
+        if util.is_empty(l):
+            return set()
+        return {int(item) for item in l}
+
     def restore(self):
         # read file and convert to self.all_method_def_use
         df = DataModel().load(self.path)
@@ -1309,15 +1600,16 @@ class MethodSummaryLoader:
                     used_external_symbols = {},
                     return_symbols = {},
                     key_dynamic_content = {},
-                    dynamic_call_stmts = row.dynamic_call_stmts,
+                    dynamic_call_stmts = self.convert_list_to_set(row.dynamic_call_stmts),
                     this_symbols = {}
                 )
                 method_instance.parameter_symbols = self.convert_list_to_dict(row.parameter_symbols, method_instance)
                 method_instance.defined_external_symbols = self.convert_list_to_dict(row.defined_external_symbols, method_instance)
-                method_instance.used_external_symbols = self.convert_list_to_dict(row.used_external_symbol_ids, method_instance)
+                method_instance.used_external_symbols = self.convert_list_to_dict(row.used_external_symbols, method_instance)
                 method_instance.return_symbols = self.convert_list_to_dict(row.return_symbols, method_instance)
                 method_instance.key_dynamic_content = self.convert_list_to_dict(row.key_dynamic_content, method_instance)
                 method_instance.this_symbols = self.convert_list_to_dict(row.this_symbols, method_instance)
+                method_instance.external_symbol_to_state = self.convert_pair_list_to_dict(row.external_symbol_to_state)
                 self.method_summary_records[(row.caller_id, row.call_stmt_id, row.method_id)] = method_instance
             else:
                 method_summary = MethodSummaryTemplate(
@@ -1327,15 +1619,16 @@ class MethodSummaryLoader:
                     used_external_symbols = {},
                     return_symbols = {},
                     key_dynamic_content = {},
-                    dynamic_call_stmts = row.dynamic_call_stmts,
+                    dynamic_call_stmts = self.convert_list_to_set(row.dynamic_call_stmts),
                     this_symbols = {}
                 )
                 method_summary.parameter_symbols = self.convert_list_to_dict(row.parameter_symbols, method_summary)
                 method_summary.defined_external_symbols = self.convert_list_to_dict(row.defined_external_symbols, method_summary)
-                method_summary.used_external_symbols = self.convert_list_to_dict(row.used_external_symbol_ids, method_summary)
+                method_summary.used_external_symbols = self.convert_list_to_dict(row.used_external_symbols, method_summary)
                 method_summary.return_symbols = self.convert_list_to_dict(row.return_symbols, method_summary)
                 method_summary.key_dynamic_content = self.convert_list_to_dict(row.key_dynamic_content, method_summary)
                 method_summary.this_symbols = self.convert_list_to_dict(row.this_symbols, method_summary)
+                method_summary.external_symbol_to_state = self.convert_pair_list_to_dict(row.external_symbol_to_state)
                 self.method_summary_records[row.method_id] = method_summary
 
     def export(self):
@@ -1416,12 +1709,42 @@ class CallGraphLoader:
         DataModel(results).save(self.path)
 
 class CallPathLoader:
+    """
+    P3 call paths. The queries go through indexes built once in save()/restore():
+    1. callee_to_callers / caller_to_callees: method_id -> entry_point -> method ids
+    2. entry_point_to_paths: the paths starting from each entry point
+    3. callee_to_paths: the paths containing a call to each method
+    """
     def __init__(self, file_path):
         self.path = file_path
         self.all_paths = set()
+        self.build_index()
+
+    def build_index(self):
+        self.callee_to_callers = {}
+        self.caller_to_callees = {}
+        self.entry_point_to_paths = {}
+        self.callee_to_paths = {}
+        self.path_to_parent_map = {}
+
+        for path in self.all_paths:
+            if len(path) == 0:
+                continue
+            entry_point = path[0].caller_id
+            self.entry_point_to_paths.setdefault(entry_point, []).append(path)
+            for call_site in path:
+                callee_id = call_site.callee_id
+                paths = self.callee_to_paths.setdefault(callee_id, [])
+                if len(paths) == 0 or paths[-1] is not path:
+                    paths.append(path)
+                if callee_id == 0:
+                    continue
+                self.callee_to_callers.setdefault(callee_id, {}).setdefault(entry_point, set()).add(call_site.caller_id)
+                self.caller_to_callees.setdefault(call_site.caller_id, {}).setdefault(entry_point, set()).add(callee_id)
 
     def save(self, all_paths: set):
         self.all_paths = all_paths
+        self.build_index()
 
     def get_all(self):
         return self.all_paths
@@ -1437,6 +1760,7 @@ class CallPathLoader:
 
             path = CallPath(tuple(callsite_list))
             self.all_paths.add(path)
+        self.build_index()
 
     def export(self):
         if len(self.all_paths) == 0:
@@ -1454,30 +1778,27 @@ class CallPathLoader:
 
         DataModel(dict_list).save(self.path)
 
+    def query_method_index(self, index, method_id, entry_point):
+        entry_point_to_ids = index.get(method_id)
+        if not entry_point_to_ids:
+            return set()
+        if entry_point > 0:
+            return set(entry_point_to_ids.get(entry_point, set()))
+        result = set()
+        for ids in entry_point_to_ids.values():
+            result.update(ids)
+        return result
+
     def get_callers_by_method_id(self, method_id, entry_point = -1):
-        caller = set()
-        for path in self.all_paths:
-            if entry_point > 0 and path[0].caller_id != entry_point:
-                continue
-            for call_site in path:
-                if call_site.callee_id == method_id and call_site.callee_id != 0:
-                    caller.add(call_site.caller_id)
-        return caller
+        return self.query_method_index(self.callee_to_callers, method_id, entry_point)
 
     def get_callees_by_method_id(self, method_id, entry_point = -1):
-        callee = set()
-        for path in self.all_paths:
-            if entry_point > 0 and path[0].caller_id != entry_point:
-                continue
-            for call_site in path:
-                if call_site.caller_id == method_id and call_site.callee_id != 0:
-                    callee.add(call_site.callee_id)
-        return callee
+        return self.query_method_index(self.caller_to_callees, method_id, entry_point)
 
     def get_call_path_between_two_methods(self, src_method, dst_method):
         """if des_method is None, return all call_path from src to end"""
         call_paths_between_two_methods = []
-        for path in self.all_paths:
+        for path in self.callee_to_paths.get(src_method, []):
             current_path = []
             found_src = False
             for call_site in path:
@@ -1495,42 +1816,40 @@ class CallPathLoader:
         return call_paths_between_two_methods
 
     def get_call_path_by_entry_point(self, entry_point):
-        call_paths_between_two_methods = []
-        for path in self.all_paths:
-            call_path = []
-            if 0 < entry_point != path[0].caller_id:
-                continue
-            call_paths_between_two_methods.append(path)
-        return call_paths_between_two_methods
+        if entry_point <= 0:
+            return list(self.all_paths)
+        return list(self.entry_point_to_paths.get(entry_point, []))
 
+    def get_parent_map(self, call_path):
+        """
+        {子节点: 父节点} 的映射字典，以及路径上出现过的所有节点；每条路径只构建一次
+        """
+        if call_path not in self.path_to_parent_map:
+            parent_map = {}
+            all_nodes = set()
+            for call_site in call_path:
+                parent_map[call_site.callee_id] = call_site.caller_id
+                all_nodes.add(call_site.caller_id)
+                all_nodes.add(call_site.callee_id)
+            self.path_to_parent_map[call_path] = (parent_map, all_nodes)
+        return self.path_to_parent_map[call_path]
 
     def get_lowest_common_ancestor(self, node1, node2, entry_point):
         """
         寻找两个节点的最近公共祖先 (LCA)
-        :param edges: 列表，格式为 [(src, weight, dst), ...]
         :param node1: 目标节点1
         :param node2: 目标节点2
+        :param entry_point: 以该入口开始的调用路径
         :return: 公共祖先节点 (如果不存在则返回 None)
         """
 
-        # 1. 构建 {子节点: 父节点} 的映射字典
+        # 1. 取出 {子节点: 父节点} 的映射字典
         # 假设边是有向的: src -> dst (父 -> 子)
-        call_path = None
-        for path in self.all_paths:
-            if path[0].caller_id == entry_point:
-                call_path = path
-        if not call_path:
+        paths = self.entry_point_to_paths.get(entry_point)
+        if not paths:
             return None
-        parent_map = {}
-
-        # 用来记录所有出现过的节点，防止查询不存在的节点
-        all_nodes = set()
+        parent_map, all_nodes = self.get_parent_map(paths[-1])
 
-        for call_site in call_path:
-            parent_map[call_site.callee_id] = call_site.caller_id
-            all_nodes.add(call_site.caller_id)
-            all_nodes.add(call_site.callee_id)
-        #print(parent_map)
         # 如果输入的节点不在树中，直接返回 None
         if node1 not in all_nodes or node2 not in all_nodes:
             return None
@@ -1558,6 +1877,8 @@ class UniqueSymbolIDAssignerLoader:
         self.negative_symbol_id = config.BUILTIN_SYMBOL_START_ID
         self.max_gir_id = config.DEFAULT_MAX_GIR_ID
         self.positive_symbol_id = self.max_gir_id + config.POSITIVE_GIR_INTERVAL
+        # the state id counter of the last run, restored for incremental analysis
+        self.next_state_id = config.START_INDEX
 
     def save_max_gir_id(self, max_gir_id):
         self.max_gir_id = max_gir_id
@@ -1572,10 +1893,19 @@ class UniqueSymbolIDAssignerLoader:
     def is_greater_than_max_gir_id(self, symbol_id):
         return symbol_id > self.max_gir_id
 
+    def get_next_state_id(self):
+        return self.next_state_id
+
     def assign_new_unique_negative_id(self):
         self.negative_symbol_id -= 1
         return self.negative_symbol_id
 
+    def get_last_negative_symbol_id(self):
+        return self.negative_symbol_id
+
+    def set_last_negative_symbol_id(self, symbol_id):
+        self.negative_symbol_id = symbol_id
+
     def assign_new_unique_positive_id(self):
         self.positive_symbol_id += 1
         return self.positive_symbol_id
@@ -1586,16 +1916,94 @@ class UniqueSymbolIDAssignerLoader:
             self.negative_symbol_id = row.negative_symbol_id
             self.positive_symbol_id = row.positive_symbol_id
             self.max_gir_id = row.max_gir_id
+            if row.next_state_id is not None:
+                self.next_state_id = int(row.next_state_id)
             break
 
     def export(self):
         results = [{
             "negative_symbol_id": self.negative_symbol_id,
             "positive_symbol_id": self.positive_symbol_id,
-            "max_gir_id": self.max_gir_id
+            "max_gir_id": self.max_gir_id,
+            "next_state_id": common_structs.global_state_id,
         }]
         DataModel(results).save(self.path)
 
+class UnitStmtIDRangeLoader:
+    """
+    每个unit的语句ID占用一段连续的区间[start_stmt_id, end_stmt_id)，按unit_path保存：
+    1. 增量分析时，内容未改变的unit沿用上一轮的区间，其他unit的改变不会导致其语句ID偏移
+    2. 改变的unit在原区间放得下时仍使用原区间，否则被移到所有区间之后
+    3. 没有上一轮结果时，各unit依次排列，与逐个分配语句ID的结果一致
+    """
+    def __init__(self, path):
+        self.path = path
+        self.unit_path_to_range = {}
+        self.previous_unit_path_to_range = {}
+        self.next_stmt_id = config.START_INDEX
+
+    def init_ranges(self, first_stmt_id, previous_unit_path_to_range):
+        # the ranges overlapping the module ids are dropped
+        self.previous_unit_path_to_range = {
+            unit_path: stmt_id_range
+            for unit_path, stmt_id_range in previous_unit_path_to_range.items()
+            if stmt_id_range[0] >= first_stmt_id
+        }
+        self.unit_path_to_range = {}
+        self.next_stmt_id = first_stmt_id
+        for (_, end_stmt_id) in self.previous_unit_path_to_range.values():
+            self.next_stmt_id = max(self.next_stmt_id, end_stmt_id)
+
+    def is_in_previous_range(self, unit_path, min_stmt_id, max_stmt_id):
+        stmt_id_range = self.previous_unit_path_to_range.get(unit_path)
+        if stmt_id_range is None:
+            return False
+        return stmt_id_range[0] <= min_stmt_id and max_stmt_id < stmt_id_range[1]
+
+    def keep_previous_range(self, unit_path):
+        self.unit_path_to_range[unit_path] = self.previous_unit_path_to_range.pop(unit_path)
+
+    def obtain_start_stmt_id(self, unit_path):
+        stmt_id_range = self.previous_unit_path_to_range.get(unit_path)
+        if stmt_id_range is not None:
+            return stmt_id_range[0]
+        return self.next_stmt_id
+
+    def save_range(self, unit_path, start_stmt_id, end_stmt_id, next_start_stmt_id):
+        """
+        end_stmt_id是该unit之后第一个未使用的ID，next_start_stmt_id是新区间的结束位置（含预留的间隔）
+        返回False时说明原区间放不下，需要从obtain_start_stmt_id()重新分配
+        """
+        stmt_id_range = self.previous_unit_path_to_range.pop(unit_path, None)
+        if stmt_id_range is not None and stmt_id_range[0] == start_stmt_id:
+            if end_stmt_id <= stmt_id_range[1]:
+                self.unit_path_to_range[unit_path] = stmt_id_range
+                return True
+            return False
+
+        self.unit_path_to_range[unit_path] = (start_stmt_id, next_start_stmt_id)
+        self.next_stmt_id = next_start_stmt_id
+        return True
+
+    def get_next_stmt_id(self):
+        return self.next_stmt_id
+
+    def get_all(self):
+        return self.unit_path_to_range
+
+    def export(self):
+        if len(self.unit_path_to_range) == 0:
+            return
+        results = []
+        for unit_path, (start_stmt_id, end_stmt_id) in self.unit_path_to_range.items():
+            results.append([unit_path, start_stmt_id, end_stmt_id])
+        DataModel(results, columns = schema.unit_stmt_id_range_schema).save(self.path)
+
+    def restore(self):
+        df = DataModel().load(self.path)
+        for row in df:
+            self.unit_path_to_range[row.unit_path] = (int(row.start_stmt_id), int(row.end_stmt_id))
+
 class ImportGraphLoader:
     def __init__(self, path):
         self.path = path
@@ -1812,7 +2220,7 @@ class MethodStateToDefinedLoader(MethodLevelAnalysisResultLoader):
                 defined_states[row.state_id] = set()
 
             for each_defined in row.defined:
-                if isinstance(each_defined, tuple):
+                if isinstance(each_defined, (tuple, numpy.ndarray)):
                     defined_states[row.state_id].add(
                         StateDefNode(index = int(each_defined[0]), state_id = int(row.state_id), stmt_id = int(each_defined[1])))
         return defined_states
@@ -1992,6 +2400,10 @@ class Loader:
             os.path.join(self.frontend_path, config.UNIQUE_SYMBOL_IDS_PATH),
         )
 
+        self._unit_stmt_id_range_loader = UnitStmtIDRangeLoader(
+            os.path.join(self.frontend_path, config.UNIT_STMT_ID_RANGES_PATH),
+        )
+
         self._external_symbol_id_collection_loader = ExternalSymbolIDCollectionLoader(
             os.path.join(self.semantic_p1_path, config.EXTERNAL_SYMBOL_ID_COLLECTION_PATH)
         )
@@ -2526,7 +2938,18 @@ class Loader:
             if hasattr(loader, 'export_indexing'):
                 loader.export_indexing()
 
-    def restore(self):
+    def freeze(self):
+        """
+        turn the in-memory id maps into shared arrays before forking workers; see IDMapLoader
+        """
+        for loader in self._all_loaders:
+            if isinstance(loader, IDMapLoader):
+                loader.freeze()
+
+    def restore(self, read_only = False):
+        """
+        read_only: attach the exported id maps as memory-mapped arrays instead of rebuilding the dicts
+        """
         for loader in self._all_loaders:
             # print(type(loader))
             if hasattr(loader, 'restore_indexing'):
@@ -2541,7 +2964,10 @@ class Loader:
             if hasattr(loader, 'restore'):
                 #util.debug(loader.__class__.__name__ + " is restoring")
                 try:
-                    loader.restore()
+                    if isinstance(loader, IDMapLoader):
+                        loader.restore(read_only = read_only)
+                    else:
+                        loader.restore()
                 except (FileNotFoundError, Exception) as e:
                     if not isinstance(e, FileNotFoundError):
                         util.warn(f"Failed to restore {loader.__class__.__name__}: {e}")
@@ -2557,6 +2983,8 @@ class Loader:
         return self._module_symbols_loader.get_module_symbol_table()
     def save_module_symbols(self, module_symbol_results):
         return self._module_symbols_loader.save(module_symbol_results)
+    def update_unit_hashes(self, unit_id_to_hash):
+        return self._module_symbols_loader.update_unit_hashes(unit_id_to_hash)
     def get_all_module_ids(self):
         return self._module_symbols_loader.get_all_module_ids()
     def get_all_unit_info(self):
@@ -2785,6 +3213,36 @@ class Loader:
         return self._unique_symbol_id_assigner_loader.assign_new_unique_positive_id()
     def assign_new_unique_negative_id(self):
         return self._unique_symbol_id_assigner_loader.assign_new_unique_negative_id()
+    def get_last_negative_symbol_id(self):
+        return self._unique_symbol_id_assigner_loader.get_last_negative_symbol_id()
+    def set_last_negative_symbol_id(self, symbol_id):
+        return self._unique_symbol_id_assigner_loader.set_last_negative_symbol_id(symbol_id)
+
+    def replay_saved_items(self, saved_items):
+        """
+        apply the save_* calls recorded by a LoaderSaveRecorder
+        """
+        for name, saved_item in saved_items:
+            _, args, kwargs = pickle.loads(saved_item)
+            getattr(self, name)(*args, **kwargs)
+
+    def get_next_state_id(self):
+        return self._unique_symbol_id_assigner_loader.get_next_state_id()
+
+    def init_unit_stmt_id_ranges(self, first_stmt_id, previous_unit_path_to_range):
+        return self._unit_stmt_id_range_loader.init_ranges(first_stmt_id, previous_unit_path_to_range)
+    def is_in_previous_unit_stmt_id_range(self, unit_path, min_stmt_id, max_stmt_id):
+        return self._unit_stmt_id_range_loader.is_in_previous_range(unit_path, min_stmt_id, max_stmt_id)
+    def keep_previous_unit_stmt_id_range(self, unit_path):
+        return self._unit_stmt_id_range_loader.keep_previous_range(unit_path)
+    def obtain_unit_start_stmt_id(self, unit_path):
+        return self._unit_stmt_id_range_loader.obtain_start_stmt_id(unit_path)
+    def save_unit_stmt_id_range(self, unit_path, start_stmt_id, end_stmt_id, next_start_stmt_id):
+        return self._unit_stmt_id_range_loader.save_range(unit_path, start_stmt_id, end_stmt_id, next_start_stmt_id)
+    def get_next_unit_stmt_id(self):
+        return self._unit_stmt_id_range_loader.get_next_stmt_id()
+    def get_all_unit_stmt_id_ranges(self):
+        return self._unit_stmt_id_range_loader.get_all()
 
     def save_stmt_id_to_scope_id(self, stmt_id_to_scope_id_cache):
         return self._stmt_id_to_scope_id_loader.save(stmt_id_to_scope_id_cache)
@@ -2887,6 +3345,8 @@ class Loader:
         return self._symbol_state_space_p1_loader.save(method_id, state_space)
     def get_symbol_state_space_p1(self, method_id):
         return self._symbol_state_space_p1_loader.get_item_by_id(method_id)
+    def group_symbol_state_space_rows_by_method_id_p1(self, columns):
+        return self._symbol_state_space_p1_loader.group_rows_by_method_id(columns)
     def contain_symbol_state_space_p1(self, method_id):
         return self._symbol_state_space_p1_loader.contain(method_id)
 
@@ -3145,6 +3605,8 @@ class Loader:
         return self._state_flow_graph_p2_loader.get_item_by_id(method_id)
     def get_global_sfg_by_entry_point(self, method_id):
         return self._state_flow_graph_p3_loader.get_item_by_id(method_id)
+    def get_global_sfgs_in_bundle_order(self, entry_points = None):
+        return self._state_flow_graph_p3_loader.get_items_in_bundle_order(entry_points)
     def save_global_sfg_by_entry_point(self, method_id, graph: StateFlowGraph):
         return self._state_flow_graph_p3_loader.save(method_id, graph.graph)
 
@@ -3168,6 +3630,33 @@ class Loader:
     def save_parameter_mapping_p2(self, call_site, mapping):
         return self._callee_parameter_mapping_p2_loader.save(call_site, mapping)
 
+    def copy_parameter_mapping_p2(self, previous_loader, call_site):
+        return self._callee_parameter_mapping_p2_loader.copy_item_from(previous_loader._callee_parameter_mapping_p2_loader, call_site)
+
+    def copy_method_results_p2(self, previous_loader, method_ids):
+        """
+        复用另一个loader（上一轮分析）中这些方法的P2结果：
+        1. 按方法保存的结果直接复制打平后的记录
+        2. 方法摘要模板从上一轮还原后再保存
+        3. P2的state flow graph没有被后续阶段使用，不复制
+        """
+        for current_loader, other_loader in (
+            (self._symbol_state_space_p2_loader, previous_loader._symbol_state_space_p2_loader),
+            (self._symbol_state_space_summary_p2_loader, previous_loader._symbol_state_space_summary_p2_loader),
+            (self._stmt_status_p2_loader, previous_loader._stmt_status_p2_loader),
+            (self._symbol_bit_vector_manager_p2_loader, previous_loader._symbol_bit_vector_manager_p2_loader),
+            (self._state_bit_vector_manager_p2_loader, previous_loader._state_bit_vector_manager_p2_loader),
+            (self._symbol_graph_p2_loader, previous_loader._symbol_graph_p2_loader),
+            (self._defined_symbols_p2_loader, previous_loader._defined_symbols_p2_loader),
+            (self._defined_states_p2_loader, previous_loader._defined_states_p2_loader),
+        ):
+            current_loader.copy_items_from(other_loader, method_ids)
+
+        for method_id in method_ids:
+            summary_template = previous_loader.get_method_summary_template(method_id)
+            if summary_template is not None:
+                self.save_method_summary_template(method_id, summary_template)
+
     def get_parameter_mapping_p3(self, call_site):
         return self._callee_parameter_mapping_p3_loader.get_item_by_id(call_site)
     def save_parameter_mapping_p3(self, call_site, mapping):
@@ -3224,7 +3713,7 @@ class Loader:
         stmt = self.get_stmt_gir(stmt_id)
         if stmt.operation == 'method_decl':
             start = stmt.start_row
-            if stmt.start_row <= 0:
+            if util.isna(start) or start <= 0:
                 start = 0
             return self._get_source_code_from_start_to_end(unit_source_code, start = start, end = stmt.end_row)
         return self._get_source_code_from_start_to_end(unit_source_code, start = stmt.start_row, end = stmt.end_row)
@@ -3442,9 +3931,9 @@ class Loader:
             return -1
 
         for stmt in unit_gir:
-            start_row = stmt.start_row + 1
-            if math.isnan(start_row):
+            if util.isna(stmt.start_row):
                 continue
+            start_row = stmt.start_row + 1
             if start_row == line_num:
                 return self.convert_stmt_id_to_method_id(stmt.stmt_id)
         return -1
@@ -3474,10 +3963,10 @@ class Loader:
                     method_ids.update(self.convert_unit_id_to_method_ids(unit_id))
         for method_id in method_ids:
             method_stmt = self.get_stmt_gir(method_id)
+            if util.isna(method_stmt.start_row):
+                continue
             start_row = method_stmt.start_row + 1
             end_row = method_stmt.end_row + 1
-            if math.isnan(start_row):
-                continue
             if int(start_row) <= rule.line_num <= int(end_row):
                 return method_id
         return -1
@@ -3543,3 +4032,48 @@ class Loader:
 
         return source_stmt_ids, sink_stmt_ids
 
+class LoaderSaveRecorder:
+    """
+    分析一个unit/方法组/入口时代替Loader（子进程中或单核时在本进程中）：
+    1. save_*调用时即把参数pickle下来记录，由父进程按原顺序重放
+    2. readable_items中的结果（如save_xxx与get_xxx/convert_xxx中的xxx）只对本次分析可见：
+       get_xxx先查本次保存的副本，own_results_only为False时再查Loader
+    3. local_items与readable_items一样可读（总会再查Loader），但它们的保存只属于本次分析，不会被重放
+    4. 其余调用直接转发给Loader
+    Loader与本次分析读到的总是同一份pickle的副本（集合的遍历顺序等也一致），且不会读到其他unit/组/入口的保存，
+    因此结果与核数和调度顺序无关
+    """
+    def __init__(self, loader, readable_items = (), own_results_only = False, local_items = ()):
+        self.loader = loader
+        self.readable_items = {item_name: {} for item_name in list(readable_items) + list(local_items)}
+        self.own_results_only = own_results_only
+        self.local_items = set(local_items)
+        self.saved_items = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.loader, name)
+        item_name = name.split("_", 1)[-1]
+        if name.startswith(("get_", "convert_")) and item_name in self.readable_items:
+            kept_items = self.readable_items[item_name]
+            falls_through = not self.own_results_only or item_name in self.local_items
+
+            def get(_id, *args, **kwargs):
+                if _id in kept_items:
+                    # every read gets its own copy, as if unflattened from the loader
+                    _, (_, item_content), _ = pickle.loads(kept_items[_id])
+                    return item_content
+                if not falls_through:
+                    return None
+                return attr(_id, *args, **kwargs)
+            return get
+
+        if not name.startswith("save_"):
+            return attr
+
+        def record(*args, **kwargs):
+            saved_item = pickle.dumps((name, args, kwargs), protocol = pickle.HIGHEST_PROTOCOL)
+            if item_name not in self.local_items:
+                self.saved_items.append((name, saved_item))
+            if item_name in self.readable_items:
+                self.readable_items[item_name][args[0]] = saved_item
+        return record
@@ -163,7 +163,7 @@ class ReadableGir:
 
     def if_stmt(self, stmt):
         if_str = ""
-        if hasattr(stmt, "then_body") and stmt.then_body:
+        if hasattr(stmt, "then_body") and util.is_available(stmt.then_body):
             if_str = f"if {stmt.condition}"
             
         return if_str
@@ -15,7 +15,7 @@ from lian.config import config
 
 def is_empty(element):
     #print("is_empty:", element)
-    if element is None:
+    if element is None or element is pd.NA:
         return True
     if isinstance(element, (int, float)):
         return math.isnan(element)
@@ -26,7 +26,7 @@ def is_empty(element):
     return False
 
 def isna(element):
-    if element is None:
+    if element is None or element is pd.NA:
         return True
     if isinstance(element, (int, float)):
         return math.isnan(element)
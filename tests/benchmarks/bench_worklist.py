@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the statement worklist used by the fixpoint iteration of P2/P3
+
+It builds CFGs with thousands of statements (sequences, branches and loops), and replays the access pattern of
+P2PrelimSemanticAnalysis.analyze_stmts(): peek the current statement, analyze it, add its successors and remove it.
+The list-based worklist (pop(0) on a heapq list) used before is kept here for comparison.
+
+usage: PYTHONPATH=src python tests/benchmarks/bench_worklist.py [number of statements ...]
+"""
+
+import heapq
+import sys
+import time
+import builtins
+
+if not hasattr(builtins, "profile"):
+    builtins.profile = lambda func: func
+
+import networkx as nx
+
+from lian.common_structs import SimpleWorkList
+
+VARIABLE_COUNT = 50
+
+class ListWorkList:
+    def __init__(self, graph):
+        self.work_list = []
+        self.all_data = set()
+        cfg_order = list(reversed(list(nx.dfs_postorder_nodes(graph, source = 1))))
+        self.priority_dict = {node: idx for idx, node in enumerate(cfg_order)}
+
+    def add(self, data):
+        for item in data:
+            if item not in self.all_data:
+                heapq.heappush(self.work_list, (self.priority_dict.get(item, 0), item))
+                self.all_data.add(item)
+        return self
+
+    def peek(self):
+        return self.work_list[0][1]
+
+    def pop(self):
+        result = self.work_list.pop(0)[1]
+        self.all_data.discard(result)
+        return result
+
+    remove = lambda self, item: self.pop()
+
+    def __len__(self):
+        return len(self.work_list)
+
+def build_cfg(stmt_count, loop_size = 20, branch_size = 7):
+    cfg = nx.DiGraph()
+    stmt_id = 1
+    while stmt_id < stmt_count:
+        if stmt_id % (loop_size * 3) == 1 and stmt_id + loop_size < stmt_count:
+            # loop header -> body -> back edge
+            for each_id in range(stmt_id, stmt_id + loop_size):
+                cfg.add_edge(each_id, each_id + 1)
+            cfg.add_edge(stmt_id + loop_size, stmt_id)
+            stmt_id += loop_size
+        elif stmt_id % (branch_size * 2) == 0 and stmt_id + branch_size + 1 < stmt_count:
+            # if/else, both branches meet at the end
+            middle = stmt_id + branch_size // 2
+            end = stmt_id + branch_size
+            for each_id in range(stmt_id, middle):
+                cfg.add_edge(each_id, each_id + 1)
+            cfg.add_edge(stmt_id, middle + 1)
+            for each_id in range(middle + 1, end):
+                cfg.add_edge(each_id, each_id + 1)
+            cfg.add_edge(middle, end)
+            stmt_id = end
+        else:
+            cfg.add_edge(stmt_id, stmt_id + 1)
+            stmt_id += 1
+    return cfg
+
+def run_fixpoint(cfg, worklist):
+    # reaching definitions: each statement defines the variable (stmt_id % VARIABLE_COUNT)
+    defs_of_variable = {}
+    for node in cfg.nodes:
+        defs_of_variable[node % VARIABLE_COUNT] = defs_of_variable.get(node % VARIABLE_COUNT, 0) | (1 << node)
+    out_bits = {}
+    worklist.add([1])
+    visits = 0
+    while len(worklist) != 0:
+        stmt_id = worklist.peek()
+        visits += 1
+        in_bits = 0
+        for parent_id in cfg.predecessors(stmt_id):
+            in_bits |= out_bits.get(parent_id, 0)
+        new_out_bits = (in_bits & ~defs_of_variable[stmt_id % VARIABLE_COUNT]) | (1 << stmt_id)
+        if out_bits.get(stmt_id) != new_out_bits:
+            out_bits[stmt_id] = new_out_bits
+            worklist.add(cfg.successors(stmt_id))
+        worklist.remove(stmt_id)
+    return visits, out_bits
+
+def measure(cfg, make_worklist):
+    start = time.perf_counter()
+    visits, out_bits = run_fixpoint(cfg, make_worklist(cfg))
+    return visits, out_bits, time.perf_counter() - start
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    print(f"{'stmts':>8} {'worklist':>10} {'visits':>8} {'seconds':>9} {'wrong stmts':>12}")
+    for stmt_count in sizes:
+        cfg = build_cfg(stmt_count)
+        expected = None
+        for name, make_worklist in (
+            ("heap", lambda graph: SimpleWorkList(graph = graph)),
+            ("list", ListWorkList),
+        ):
+            visits, out_bits, seconds = measure(cfg, make_worklist)
+            if expected is None:
+                expected = out_bits
+            # the list-based worklist may pop a loop header instead of the current statement and lose it
+            wrong_stmts = sum(1 for node in cfg.nodes if out_bits.get(node) != expected.get(node))
+            print(f"{stmt_count:>8} {name:>10} {visits:>8} {seconds:>9.4f} {wrong_stmts:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+def is_even(n):
+    if n == 0:
+        return True
+    return is_odd(n - 1)
+
+
+def is_odd(n):
+    if n == 0:
+        return False
+    return is_even(n - 1)
+
+
+def apply(func, value):
+    return func(value)
+
+
+def twice(value):
+    return value * 2
+
+
+def pick(values):
+    result = []
+    for value in values:
+        if apply(is_even, value):
+            result.append(apply(twice, value))
+    return result
@@ -0,0 +1,21 @@
+from arith import pick, is_odd
+from shapes import Shape
+
+
+def build(values):
+    shape = Shape("numbers")
+    for value in pick(values):
+        shape.add(value)
+    return shape
+
+
+def report(values):
+    shape = build(values)
+    text = shape.describe()
+    if is_odd(len(values)):
+        text = text + "!"
+    return text
+
+
+data = [1, 2, 3, 4]
+print(report(data))
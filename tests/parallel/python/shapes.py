@@ -0,0 +1,21 @@
+class Shape:
+    def __init__(self, name):
+        self.name = name
+        self.parts = []
+
+    def add(self, part):
+        self.parts.append(part)
+        return self
+
+    def describe(self):
+        return describe_parts(self, self.parts)
+
+
+def describe_parts(shape, parts):
+    if len(parts) == 0:
+        return shape.name
+    return shape.name + ":" + describe_rest(shape, parts[1:])
+
+
+def describe_rest(shape, parts):
+    return describe_parts(shape, parts)
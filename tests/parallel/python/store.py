@@ -0,0 +1,18 @@
+from shapes import Shape
+
+
+class Store:
+    def __init__(self):
+        self.items = {}
+
+    def put(self, key, value):
+        self.items[key] = value
+        return value
+
+    def get(self, key):
+        return self.items.get(key)
+
+
+store = Store()
+store.put("square", Shape("square").add(4))
+print(store.get("square").describe())
@@ -19,7 +19,7 @@ elif [ "$TARGET" == "sfg" ]; then
 elif [ "$TARGET" == "sdg" ]; then
     TESTS=("tests.run.test_sdg")
 elif [ -z "$TARGET" ] || [ "$TARGET" == "all" ]; then
-    TESTS=("tests.run.test_util_dataframe" "tests.run.test_cfg" "tests.run.test_sfg" "tests.run.test_sdg")
+    TESTS=("tests.run.test_util_dataframe" "tests.run.test_gir_loader" "tests.run.test_bit_vector" "tests.run.test_worklist" "tests.run.test_call_path_loader" "tests.run.test_method_result_loader" "tests.run.test_parallel_lang" "tests.run.test_parallel_p1" "tests.run.test_parallel_p2" "tests.run.test_parallel_p3" "tests.run.test_id_map_loader" "tests.run.test_taint_propagation" "tests.run.test_rule_manager" "tests.run.test_preparation" "tests.run.test_cfg" "tests.run.test_sfg" "tests.run.test_sdg")
 else
     echo "Usage: $0 [cfg|sfg|sdg|all] [--update]"
     exit 1
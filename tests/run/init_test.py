@@ -29,3 +29,26 @@ TEST_DIR = path.realpath(path.dirname(path.dirname(__file__)))
 TMP_DIR = path.realpath(path.join(TEST_DIR, './tmp'))
 OUTPUT_DIR = "/tmp/lian_workspace"
 OUTPUT_LLVM = os.path.join(OUTPUT_DIR, "output.ll")
+
+def run_lian(target, workspace, cores, sub_command = "semantic", *options):
+    # imported here, since most tests only need a part of lian
+    from unittest.mock import patch
+    from lian import common_structs
+    from lian.config import config
+    from lian.main import Lian
+
+    # every run starts with the state ids of a fresh process
+    common_structs.global_state_id = config.START_INDEX
+    argv = ["", sub_command, "-f", "-q", "-l", "python", "-c", str(cores), "-w", workspace, *options, target]
+    with patch("sys.argv", argv):
+        Lian().run()
+
+def read_output_files(workspace, sub_dir):
+    from lian.config import config
+
+    output_dir = os.path.join(workspace, config.DEFAULT_WORKSPACE, sub_dir)
+    output_files = {}
+    for name in sorted(os.listdir(output_dir)):
+        with open(os.path.join(output_dir, name), "rb") as f:
+            output_files[name] = f.read()
+    return output_files
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import init_test
+
+from lian.common_structs import (
+    BitVectorManager,
+    StateDefNode,
+    StmtStatus,
+    SymbolDefNode,
+)
+
+class TestBitVectorManager(unittest.TestCase):
+    def setUp(self):
+        self.defs = [SymbolDefNode(index = i, symbol_id = 100 + i % 2, stmt_id = 10 + i) for i in range(4)]
+        self.manager = BitVectorManager()
+        self.manager.init(self.defs)
+
+    def test_gen_and_kill(self):
+        bits = self.manager.gen_bit_ids(0, self.defs[:3])
+        self.assertEqual(self.manager.explain(bits), set(self.defs[:3]))
+
+        bits = self.manager.kill_bit_ids(bits, [self.defs[0], self.defs[3]])
+        self.assertEqual(self.manager.explain(bits), {self.defs[1], self.defs[2]})
+        self.assertTrue(self.manager.is_bit_id_available(bits, self.defs[1]))
+        self.assertFalse(self.manager.is_bit_id_available(bits, self.defs[0]))
+
+        # killing unknown ids is a no-op, generating them allocates new bits
+        new_def = SymbolDefNode(index = 9, symbol_id = 200, stmt_id = 19)
+        self.assertEqual(self.manager.kill_bit_ids(bits, [new_def]), bits)
+        bits = self.manager.gen_bit_ids(bits, [new_def])
+        self.assertEqual(self.manager.explain(bits), {self.defs[1], self.defs[2], new_def})
+
+    def test_union_and_diff(self):
+        left = self.manager.to_bit_vector(self.defs[:2])
+        right = self.manager.to_bit_vector(self.defs[1:3])
+        self.assertEqual(self.manager.explain(left | right), set(self.defs[:3]))
+        self.assertEqual(self.manager.explain(left & ~right), {self.defs[0]})
+        self.assertEqual(self.manager.explain(0), set())
+
+    def test_reindex(self):
+        bits = self.manager.to_bit_vector(self.defs)
+        for bit_id in self.manager.bit_pos_to_id.values():
+            bit_id.index += 50
+        self.manager.reindex()
+        shifted = SymbolDefNode(index = 50, symbol_id = 100, stmt_id = 10)
+        self.assertTrue(self.manager.is_bit_id_available(bits, shifted))
+
+class TestStmtStatusBits(unittest.TestCase):
+    def test_explain_and_load(self):
+        symbol_manager = BitVectorManager()
+        state_manager = BitVectorManager()
+        symbol_def = SymbolDefNode(index = 1, symbol_id = 100, stmt_id = 10)
+        state_def = StateDefNode(index = 2, state_id = 200, stmt_id = 10)
+
+        status = StmtStatus(stmt_id = 10)
+        status.out_symbol_bits = symbol_manager.gen_bit_ids(0, [symbol_def])
+        status.in_state_bits = state_manager.gen_bit_ids(0, [state_def])
+
+        explained = status.explain_bits(symbol_manager, state_manager)
+        self.assertEqual(explained.out_symbol_bits, {symbol_def})
+        self.assertEqual(explained.in_state_bits, {state_def})
+        self.assertEqual(explained.in_symbol_bits, set())
+
+        loaded = explained.copy().load_bits(symbol_manager, state_manager)
+        self.assertEqual(loaded.out_symbol_bits, status.out_symbol_bits)
+        self.assertEqual(loaded.in_state_bits, status.in_state_bits)
+        self.assertEqual(loaded.in_symbol_bits, 0)
+
+if __name__ == '__main__':
+    unittest.main()
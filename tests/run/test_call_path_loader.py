@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+import init_test
+
+from lian.common_structs import CallPath, CallSite
+from lian.util.loader import CallPathLoader
+
+def make_path(*method_ids):
+    path = CallPath()
+    for index in range(len(method_ids) - 1):
+        path = path.add_call(method_ids[index], 100 * method_ids[index] + index, method_ids[index + 1])
+    return path
+
+class TestCallPathLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = {
+            make_path(1, 2, 3),
+            make_path(1, 2, 4, 6),
+            make_path(5, 2, 3),
+        }
+        self.loader = CallPathLoader(os.path.join(self.tmp_dir.name, "call_paths_p3"))
+        self.loader.save(self.paths)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_queries(self, loader):
+        self.assertEqual(loader.get_callers_by_method_id(2), {1, 5})
+        self.assertEqual(loader.get_callers_by_method_id(2, entry_point = 5), {5})
+        self.assertEqual(loader.get_callers_by_method_id(7), set())
+        self.assertEqual(loader.get_callees_by_method_id(2), {3, 4})
+        self.assertEqual(loader.get_callees_by_method_id(2, entry_point = 5), {3})
+
+        self.assertEqual(len(loader.get_call_path_by_entry_point(1)), 2)
+        self.assertEqual(len(loader.get_call_path_by_entry_point(-1)), 3)
+        self.assertEqual(loader.get_call_path_by_entry_point(9), [])
+
+        results = loader.get_call_path_between_two_methods(2, 6)
+        self.assertEqual(len(results), 1)
+        self.assertEqual([call_site.callee_id for call_site in results[0]], [2, 4, 6])
+        self.assertEqual(len(loader.get_call_path_between_two_methods(2, None)), 3)
+
+        self.assertEqual(loader.get_lowest_common_ancestor(3, 2, 5), 2)
+        self.assertIsNone(loader.get_lowest_common_ancestor(3, 9, 5))
+
+    def test_queries(self):
+        self.check_queries(self.loader)
+
+    def test_export_and_restore(self):
+        self.loader.export()
+        loader = CallPathLoader(self.loader.path)
+        loader.restore()
+        self.assertEqual(loader.get_all(), self.paths)
+        self.check_queries(loader)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import types
+import unittest
+
+import pandas as pd
+import pyarrow.feather
+
+import init_test
+
+from lian.config import config
+from lian.util import util
+from lian.util.loader import UnitGIRLoader, UnitStmtIDRangeLoader
+
+UNIT_GIRS = {
+    11: [
+        {"operation": "variable_decl", "parent_stmt_id": 0, "stmt_id": 20, "name": "a", "start_row": 0},
+        {"operation": "assign_stmt", "parent_stmt_id": 0, "stmt_id": 21, "target": "a", "operand": "1", "start_row": 0},
+    ],
+    12: [
+        {"operation": "method_decl", "parent_stmt_id": 0, "stmt_id": 30, "name": "f", "body": 31, "start_row": 1},
+        {"operation": "block_start", "stmt_id": 31, "parent_stmt_id": 30},
+        {"operation": "return_stmt", "parent_stmt_id": 31, "stmt_id": 32, "name": "%v0", "start_row": 2},
+        {"operation": "block_end", "stmt_id": 31, "parent_stmt_id": 30},
+    ],
+}
+
+class TestUnitGIRLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bundle_path_summary = os.path.join(self.tmp_dir.name, config.GIR_BUNDLE_PATH)
+        self.loader = self.new_loader()
+        for unit_id, gir in UNIT_GIRS.items():
+            self.loader.save(unit_id, [dict(row, unit_id = unit_id) for row in gir])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_loader(self):
+        return UnitGIRLoader(types.SimpleNamespace(), [], self.bundle_path_summary, 10, 2)
+
+    def check_unit(self, loader, unit_id):
+        gir = loader.get_item_by_id(unit_id)
+        expected = UNIT_GIRS[unit_id]
+        self.assertEqual(len(gir), len(expected))
+        for row, expected_row in zip(gir, expected):
+            self.assertEqual(row.operation, expected_row["operation"])
+            self.assertEqual(row.stmt_id, expected_row["stmt_id"])
+            self.assertEqual(row.parent_stmt_id, expected_row["parent_stmt_id"])
+            self.assertEqual(row.unit_id, unit_id)
+
+    def check_nullable_ids(self, loader):
+        # ids with missing values stay integers instead of float64 with NaN
+        gir = loader.get_item_by_id(12)
+        self.assertEqual(str(gir.get_data()["body"].dtype), "Int64")
+        method_decl, block_start = gir.access(0), gir.access(1)
+        self.assertIs(type(method_decl.body), int)
+        self.assertEqual(method_decl.body, 31)
+        self.assertIs(type(method_decl.start_row), int)
+        self.assertIs(block_start.body, pd.NA)
+        self.assertTrue(util.isna(block_start.start_row))
+        self.assertEqual(gir.read_block(method_decl.body).access(0).stmt_id, 32)
+
+    def test_active_bundle(self):
+        for unit_id in UNIT_GIRS:
+            self.check_unit(self.loader, unit_id)
+        self.check_nullable_ids(self.loader)
+
+    def test_export_and_restore(self):
+        self.loader.export()
+        self.loader.export_indexing()
+
+        table = pyarrow.feather.read_table(self.loader.get_bundle_path(0))
+        self.assertEqual(
+            table.schema.metadata[config.GIR_SCHEMA_VERSION_KEY], str(config.GIR_SCHEMA_VERSION).encode()
+        )
+        self.assertEqual(table.schema.field("stmt_id").type, "int64")
+        self.assertTrue(str(table.schema.field("operation").type).startswith("dictionary"))
+
+        loader = self.new_loader()
+        loader.restore_indexing()
+        for unit_id in UNIT_GIRS:
+            self.check_unit(loader, unit_id)
+        self.check_nullable_ids(loader)
+
+class TestUnitStmtIDRangeLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, config.UNIT_STMT_ID_RANGES_PATH)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def layout_units(self, loader, unit_sizes):
+        for unit_path, size in unit_sizes:
+            start_stmt_id = loader.obtain_start_stmt_id(unit_path)
+            if not loader.save_range(unit_path, start_stmt_id, start_stmt_id + size, start_stmt_id + size + 10):
+                start_stmt_id = loader.obtain_start_stmt_id(unit_path)
+                self.assertTrue(loader.save_range(unit_path, start_stmt_id, start_stmt_id + size, start_stmt_id + size + 10))
+
+    def test_unchanged_units_keep_their_ranges(self):
+        loader = UnitStmtIDRangeLoader(self.path)
+        loader.init_ranges(100, {})
+        self.layout_units(loader, [("a.py", 20), ("b.py", 30), ("c.py", 5)])
+        ranges = dict(loader.get_all())
+        self.assertEqual(ranges, {"a.py": (100, 130), "b.py": (130, 170), "c.py": (170, 185)})
+        loader.export()
+
+        previous_loader = UnitStmtIDRangeLoader(self.path)
+        previous_loader.restore()
+        self.assertEqual(previous_loader.get_all(), ranges)
+
+        loader = UnitStmtIDRangeLoader(self.path)
+        loader.init_ranges(100, previous_loader.get_all())
+        self.assertTrue(loader.is_in_previous_range("c.py", 170, 174))
+        self.assertFalse(loader.is_in_previous_range("c.py", 130, 174))
+        loader.keep_previous_range("c.py")
+        # a shrunk unit stays in place, a grown one is moved behind all ranges
+        self.layout_units(loader, [("a.py", 10), ("b.py", 45), ("d.py", 1)])
+        self.assertEqual(
+            loader.get_all(),
+            {"c.py": (170, 185), "a.py": (100, 130), "b.py": (185, 240), "d.py": (240, 251)}
+        )
+        self.assertEqual(loader.get_next_stmt_id(), 251)
+
+    def test_ranges_overlapping_module_ids_are_dropped(self):
+        loader = UnitStmtIDRangeLoader(self.path)
+        loader.init_ranges(140, {"a.py": (100, 130), "b.py": (130, 170), "c.py": (170, 185)})
+        self.assertFalse(loader.is_in_previous_range("b.py", 130, 160))
+        self.assertEqual(loader.obtain_start_stmt_id("b.py"), 185)
+        self.assertEqual(loader.obtain_start_stmt_id("c.py"), 170)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+import init_test
+
+from lian.util.data_model import IDArrayMap, IDListArrayMap
+from lian.util.loader import ClassIdToNameLoader, UnitIDToMethodIDLoader, UnitIDToStmtIDLoader
+
+class TestIDMapLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.loader = self.new_loader()
+        self.loader.save(3, [30, 31])
+        self.loader.save(1, {10})
+        self.loader.save(2, [20])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_loader(self):
+        return UnitIDToMethodIDLoader(os.path.join(self.tmp_dir.name, "unit_to_method_id"))
+
+    def check_lookups(self, loader, method_ids_of_3):
+        self.assertEqual(list(loader.convert_one_to_many(3)), method_ids_of_3)
+        self.assertEqual(loader.convert_many_to_one(31), 3)
+        # ids read back from columns with missing values are floats
+        self.assertEqual(loader.convert_many_to_one(31.0), 3)
+        self.assertEqual(loader.convert_many_to_one(99), -1)
+        self.assertEqual(loader.convert_one_to_many(99), [])
+        self.assertTrue(loader.is_method_decl(20))
+        self.assertFalse(loader.is_method_decl(3))
+        self.assertEqual(set(loader.get_all_items_in_many()), {10, 20} | set(method_ids_of_3))
+
+    def test_frozen_maps_keep_lookups(self):
+        self.loader.freeze()
+        self.assertIsInstance(self.loader.one_to_many, IDListArrayMap)
+        self.assertIsInstance(self.loader.many_to_one, IDArrayMap)
+        self.check_lookups(self.loader, [30, 31])
+
+        # saving turns the maps back into dicts
+        self.loader.add_method_id_to_unit_id(32, 3)
+        self.assertFalse(self.loader.frozen)
+        self.check_lookups(self.loader, [30, 31, 32])
+
+    def test_read_only_restore_attaches_exported_arrays(self):
+        self.loader.export()
+        read_only_loader = self.new_loader()
+        read_only_loader.restore(read_only = True)
+        self.assertTrue(read_only_loader.frozen)
+        self.check_lookups(read_only_loader, [30, 31])
+
+        loader = self.new_loader()
+        loader.restore()
+        self.assertFalse(loader.frozen)
+        self.check_lookups(loader, [30, 31])
+
+    def test_stmt_ids_of_units(self):
+        path = os.path.join(self.tmp_dir.name, "unit_to_stmt_id")
+        loader = UnitIDToStmtIDLoader(path)
+        loader.save(1, range(5, 9))
+        loader.save(2, [9, 10])
+        loader.export()
+
+        read_only_loader = UnitIDToStmtIDLoader(path)
+        read_only_loader.restore(read_only = True)
+        self.assertEqual(read_only_loader.get(10), 2)
+        self.assertEqual(read_only_loader.get(4), -1)
+        self.assertEqual(list(read_only_loader.convert_one_to_many(1)), [5, 6, 7, 8])
+        self.assertEqual(sorted(read_only_loader.get_all_stmt_ids()), list(range(5, 11)))
+
+    def test_maps_with_names_are_not_frozen(self):
+        loader = ClassIdToNameLoader(os.path.join(self.tmp_dir.name, "class_id_to_name"))
+        loader.save("A", 5)
+        loader.freeze()
+        self.assertFalse(loader.frozen)
+        loader.export()
+        self.assertFalse(os.path.exists(loader.get_id_map_path()))
+
+if __name__ == '__main__':
+    unittest.main()
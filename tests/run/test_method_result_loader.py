@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import types
+import unittest
+
+import init_test
+
+from lian.common_structs import CallSite
+from lian.util.loader import MethodLevelAnalysisResultLoader
+
+class RowLoader(MethodLevelAnalysisResultLoader):
+    def flatten_item_when_saving(self, _id, item_content):
+        results = []
+        for value in item_content:
+            results.append({
+                "hash_id": hash(_id) if isinstance(_id, CallSite) else -1,
+                "method_id": _id.caller_id if isinstance(_id, CallSite) else _id,
+                "value": value,
+            })
+        return results
+
+    def unflatten_item_dataframe_when_loading(self, _id, item_df):
+        return [row.value for row in item_df]
+
+class TestMethodLevelAnalysisResultLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.previous_loader = self.new_loader("previous")
+        self.previous_loader.save(1, [10, 11])
+        self.previous_loader.save(2, [20])
+        self.previous_loader.save(3, [])
+        self.previous_loader.export()
+        self.previous_loader.export_indexing()
+        # the latest results stay in the active bundle
+        self.previous_loader.save(4, [40, 41])
+
+        self.previous_mapping_loader = self.new_loader("previous_mapping")
+        self.previous_mapping_loader.save(CallSite(1, 5, 2), [7])
+        self.previous_mapping_loader.export()
+        self.previous_mapping_loader.export_indexing()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_loader(self, name):
+        return RowLoader(types.SimpleNamespace(), ["hash_id", "method_id", "value"], os.path.join(self.tmp_dir.name, name), 10, 2)
+
+    def test_restore_call_site_keys(self):
+        loader = self.new_loader("previous_mapping")
+        loader.restore_indexing()
+        self.assertTrue(loader.contain(CallSite(1, 5, 2)))
+        self.assertEqual(loader.get_item_by_id(CallSite(1, 5, 2)), [7])
+
+        mapping_loader = self.new_loader("current_mapping")
+        self.assertTrue(mapping_loader.copy_item_from(loader, CallSite(1, 5, 2)))
+        self.assertFalse(mapping_loader.copy_item_from(loader, CallSite(1, 6, 2)))
+        self.assertEqual(mapping_loader.get_item_by_id(CallSite(1, 5, 2)), [7])
+
+    def test_copy_items(self):
+        loader = self.new_loader("current")
+        loader.copy_items_from(self.previous_loader, [1, 3, 4, 9])
+
+        self.assertEqual(loader.get_item_by_id(1), [10, 11])
+        self.assertEqual(loader.get_item_by_id(4), [40, 41])
+        self.assertFalse(loader.contain(2))
+        self.assertFalse(loader.contain(9))
+
+        loader.export()
+        loader.export_indexing()
+        restored_loader = self.new_loader("current")
+        restored_loader.restore_indexing()
+        self.assertEqual(restored_loader.get_item_by_id(1), [10, 11])
+        self.assertEqual(restored_loader.get_item_by_id(4), [40, 41])
+
+    def test_group_rows_by_method_id(self):
+        rows = self.previous_loader.group_rows_by_method_id(["value"])
+        self.assertEqual(rows[1], [(10,), (11,)])
+        self.assertEqual(rows[2], [(20,)])
+        self.assertEqual(rows[4], [(40,), (41,)])
+        self.assertNotIn(3, rows)
+
+    def test_items_in_bundle_order(self):
+        # bundle0: 1, 2, 3; bundle1: 4, 5
+        self.previous_loader.save(5, [50])
+        self.previous_loader.export()
+        self.previous_loader.export_indexing()
+        loader = self.new_loader("previous")
+        loader.restore_indexing()
+        opened_bundles = []
+        load_bundle = loader.load_bundle
+        def recording_load_bundle(bundle_id):
+            opened_bundles.append(bundle_id)
+            return load_bundle(bundle_id)
+        loader.load_bundle = recording_load_bundle
+
+        items = list(loader.get_items_in_bundle_order([5, 2, 9, 1, 4]))
+        self.assertEqual(items, [(2, [20]), (1, [10, 11]), (5, [50]), (4, [40, 41])])
+        self.assertEqual(opened_bundles, [0, 1])
+
+        loader.save(6, [60])
+        self.assertEqual([item_id for item_id, _ in loader.get_items_in_bundle_order()], [6, 1, 2, 3, 4, 5])
+
+if __name__ == '__main__':
+    unittest.main()
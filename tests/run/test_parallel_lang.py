@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import init_test
+
+from lian.config import config
+from lian.config.constants import EVENT_KIND
+from lian.events.event_manager import EventManager
+from lian.main import Lian
+
+PARSING_EVENTS = (
+    EVENT_KIND.MOCK_SOURCE_CODE_READY,
+    EVENT_KIND.ORIGINAL_SOURCE_CODE_READY,
+    EVENT_KIND.UNFLATTENED_GIR_LIST_GENERATED,
+    EVENT_KIND.GIR_LIST_GENERATED,
+)
+
+class TestParallelLangAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.target = os.path.join(init_test.TEST_DIR, "dataflows", "python")
+
+    def run_lang(self, workspace, cores):
+        # record the parsing events seen by the parent process, in the order they are notified
+        notified_events = []
+        original_notify = EventManager.notify
+
+        def notify(event_manager, data):
+            if data.event in PARSING_EVENTS:
+                notified_events.append((data.event, data.lang, repr(data.in_data)))
+            return original_notify(event_manager, data)
+
+        argv = ["", "lang", "-f", "-q", "-l", "python", "-c", str(cores), "-w", workspace, self.target]
+        with patch("sys.argv", argv), patch.object(EventManager, "notify", notify):
+            Lian().run()
+        return notified_events
+
+    def group_by_event_kind(self, notified_events):
+        events_by_kind = {}
+        for event_kind, lang, in_data in notified_events:
+            events_by_kind.setdefault(event_kind, []).append((lang, in_data))
+        return events_by_kind
+
+    def read_gir_bundles(self, workspace):
+        frontend_dir = os.path.join(workspace, config.DEFAULT_WORKSPACE, config.FRONTEND_DIR)
+        bundles = {}
+        for name in sorted(os.listdir(frontend_dir)):
+            if name.startswith("gir."):
+                with open(os.path.join(frontend_dir, name), "rb") as f:
+                    bundles[name] = f.read()
+        return bundles
+
+    def test_parallel_parsing_matches_serial(self):
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            serial_events = self.run_lang(serial_dir, 1)
+            parallel_events = self.run_lang(parallel_dir, 2)
+
+            # every event handler runs in the parent and sees the units in the serial order
+            serial_events = self.group_by_event_kind(serial_events)
+            self.assertIn(EVENT_KIND.UNFLATTENED_GIR_LIST_GENERATED, serial_events)
+            self.assertEqual(serial_events, self.group_by_event_kind(parallel_events))
+
+            serial_bundles = self.read_gir_bundles(serial_dir)
+            self.assertTrue(serial_bundles)
+            self.assertEqual(serial_bundles, self.read_gir_bundles(parallel_dir))
+
+    def test_sources_are_read_while_units_are_parsed(self):
+        # with one unit per batch, the first units are flattened before the last sources are read
+        with tempfile.TemporaryDirectory() as workspace, patch.object(config, "PARALLEL_PARSING_CHUNK_SIZE", 1):
+            event_kinds = [event_kind for event_kind, _, _ in self.run_lang(workspace, 2)]
+
+        last_source_index = len(event_kinds) - 1 - event_kinds[::-1].index(EVENT_KIND.ORIGINAL_SOURCE_CODE_READY)
+        self.assertLess(event_kinds.index(EVENT_KIND.GIR_LIST_GENERATED), last_source_index)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import types
+import unittest
+
+import init_test
+
+from lian import common_structs
+from lian.basics.basic_analysis import P1BasicSemanticAnalysis
+from lian.common_structs import BasicCallGraph, State
+from lian.config import config
+from lian.util.loader import Loader
+
+class FakeLoader:
+    def __init__(self):
+        self.negative_symbol_id = config.BUILTIN_SYMBOL_START_ID
+        self.saved_items = []
+
+    def assign_new_unique_negative_id(self):
+        self.negative_symbol_id -= 1
+        return self.negative_symbol_id
+
+    def get_last_negative_symbol_id(self):
+        return self.negative_symbol_id
+
+    def set_last_negative_symbol_id(self, symbol_id):
+        self.negative_symbol_id = symbol_id
+
+    def convert_unit_id_to_method_ids(self, unit_id):
+        return [unit_id * 10 + index for index in range(unit_id)]
+
+    def save_method_states(self, method_id, state_ids, symbol_id):
+        self.saved_items.append((method_id, state_ids, symbol_id))
+
+    def replay_saved_items(self, saved_items):
+        Loader.replay_saved_items(self, saved_items)
+
+    def freeze(self):
+        pass
+
+class FakeP1(P1BasicSemanticAnalysis):
+    def __init__(self, cores):
+        self.options = types.SimpleNamespace(cores = cores)
+        self.loader = FakeLoader()
+        self.basic_call_graph = BasicCallGraph()
+        self.parallel_id_bases = None
+
+    def analyze_unit(self, unit_id, import_analysis):
+        # unit n has n methods, each creating n states
+        for method_id in self.loader.convert_unit_id_to_method_ids(unit_id):
+            state_ids = [State().state_id for _ in range(unit_id)]
+            symbol_id = self.loader.assign_new_unique_negative_id()
+            self.basic_call_graph.add_edge(method_id, unit_id * 100, method_id + 1)
+            self.loader.save_method_states(method_id, state_ids, symbol_id)
+
+class TestParallelP1(unittest.TestCase):
+    def setUp(self):
+        self.unit_list = [1, 3, 2, 4]
+        self.original_block_size = config.PARALLEL_P1_ID_BLOCK_SIZE
+
+    def tearDown(self):
+        config.PARALLEL_P1_ID_BLOCK_SIZE = self.original_block_size
+
+    def analyze(self, cores):
+        p1 = FakeP1(cores)
+        p1.analyze_units(self.unit_list, None)
+        return p1
+
+    def check_ids(self, p1):
+        state_ids = [state_id for _, ids, _ in p1.loader.saved_items for state_id in ids]
+        symbol_ids = [symbol_id for _, _, symbol_id in p1.loader.saved_items]
+        self.assertEqual(len(set(state_ids)), len(state_ids))
+        self.assertEqual(len(set(symbol_ids)), len(symbol_ids))
+        # ids assigned after the analysis never collide with the merged ones
+        self.assertGreater(common_structs.global_state_id, max(state_ids))
+        self.assertLessEqual(p1.loader.get_last_negative_symbol_id(), min(symbol_ids))
+
+    def test_results_do_not_depend_on_cores(self):
+        target = os.path.join(init_test.TEST_DIR, "parallel", "python")
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            init_test.run_lian(target, serial_dir, 1)
+            init_test.run_lian(target, parallel_dir, 2)
+
+            serial_results = init_test.read_output_files(serial_dir, config.SEMANTIC_P1_DIR)
+            self.assertIn("call_graph_p1", serial_results)
+            self.assertEqual(serial_results, init_test.read_output_files(parallel_dir, config.SEMANTIC_P1_DIR))
+
+    def test_overflowed_units_are_analyzed_again(self):
+        # units 3 and 4 create more states than a block can hold
+        config.PARALLEL_P1_ID_BLOCK_SIZE = 5
+        for cores in (1, 2):
+            p1 = self.analyze(cores)
+
+            method_ids = [item[0] for item in p1.loader.saved_items]
+            self.assertEqual(method_ids, [10, 20, 21, 30, 31, 32, 40, 41, 42, 43])
+            self.check_ids(p1)
+
+if __name__ == '__main__':
+    unittest.main()
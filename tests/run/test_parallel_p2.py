@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import types
+import unittest
+
+import init_test
+
+from lian import common_structs
+from lian.common_structs import BasicCallGraph, CallGraph, State
+from lian.config import config
+from lian.core.prelim_semantics import P2PrelimSemanticAnalysis
+from lian.util.loader import Loader
+
+class FakeLoader:
+    def __init__(self, call_edges):
+        self.basic_call_graph = BasicCallGraph()
+        for caller_id, callee_id in call_edges:
+            self.basic_call_graph.add_edge(caller_id, callee_id, caller_id * 100)
+        self.summaries = {}
+
+    def get_classified_method_call(self):
+        return self.basic_call_graph
+
+    def save_method_summary_template(self, method_id, summary):
+        self.summaries[method_id] = summary
+
+    def get_method_summary_template(self, method_id):
+        return self.summaries.get(method_id)
+
+    def replay_saved_items(self, saved_items):
+        Loader.replay_saved_items(self, saved_items)
+
+class FakeP2(P2PrelimSemanticAnalysis):
+    def __init__(self, cores, call_edges, dynamic_call_edges = []):
+        self.options = types.SimpleNamespace(cores = cores)
+        self.loader = FakeLoader(call_edges)
+        self.call_graph = CallGraph()
+        self.analyzed_method_list = set()
+        self.applied_wave_count = 0
+        self.callees = {}
+        for caller_id, callee_id in list(call_edges) + list(dynamic_call_edges):
+            self.callees.setdefault(caller_id, []).append(callee_id)
+
+    def analyze_method(self, method_id, frame_stack = ()):
+        # a summary lists the method and the summaries of all its callees;
+        # as in P2, unanalyzed callees are analyzed first unless they are on the frame stack
+        summary = {method_id}
+        for callee_id in self.callees.get(method_id, []):
+            if callee_id not in self.analyzed_method_list and callee_id not in frame_stack:
+                self.analyze_method(callee_id, frame_stack + (method_id,))
+            callee_summary = self.loader.get_method_summary_template(callee_id)
+            if callee_summary is not None:
+                summary |= callee_summary
+            self.call_graph.add_edge(method_id, callee_id, method_id * 100)
+        State()
+        self.analyzed_method_list.add(method_id)
+        self.loader.save_method_summary_template(method_id, summary)
+
+class TestParallelP2(unittest.TestCase):
+    def test_results_do_not_depend_on_cores(self):
+        target = os.path.join(init_test.TEST_DIR, "parallel", "python")
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            init_test.run_lian(target, serial_dir, 1, "semantic", "--enable-p2")
+            init_test.run_lian(target, parallel_dir, 2, "semantic", "--enable-p2")
+
+            serial_results = init_test.read_output_files(serial_dir, config.SEMANTIC_P2_DIR)
+            self.assertIn("method_summary_template", serial_results)
+            self.assertEqual(serial_results, init_test.read_output_files(parallel_dir, config.SEMANTIC_P2_DIR))
+
+    def test_waves_are_callee_sccs(self):
+        # 1 -> 2 <-> 3 -> 4, 5 -> 4
+        p2 = FakeP2(1, [(1, 2), (2, 3), (3, 2), (3, 4), (5, 4)])
+        waves = []
+        analyze_method_group_wave = p2.analyze_method_group_wave
+
+        def record_wave(pool, published_dir, wave_index, method_groups):
+            waves.append(method_groups)
+            return analyze_method_group_wave(pool, published_dir, wave_index, method_groups)
+
+        p2.analyze_method_group_wave = record_wave
+        p2.analyze_methods_bottom_up([[1, 3, 2, 4, 5]])
+        self.assertEqual(waves, [[[4]], [[3, 2], [5]], [[1]]])
+
+    def test_groups_only_see_their_own_results(self):
+        # 8 <-> 9, while 7 only finds out about 9 during the analysis
+        call_edges = [(8, 9), (9, 8)]
+        for cores in (1, 2):
+            p2 = FakeP2(cores, call_edges, [(7, 9)])
+            state_id = common_structs.global_state_id
+            p2.analyze_methods_bottom_up([[7, 8, 9]])
+
+            self.assertEqual(p2.analyzed_method_list, {7, 8, 9})
+            # both groups analyze 8 and 9 in the same wave, and the group of 8 is replayed last
+            self.assertEqual(p2.loader.summaries[7], {7, 8, 9})
+            self.assertEqual(p2.loader.summaries[8], {8, 9})
+            self.assertEqual(p2.loader.summaries[9], {9})
+            self.assertEqual(sorted(p2.call_graph.graph.edges()), [(7, 9), (8, 9), (9, 8)])
+            self.assertGreaterEqual(common_structs.global_state_id, state_id + 5)
+
+if __name__ == '__main__':
+    unittest.main()
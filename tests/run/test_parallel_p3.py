@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import types
+import unittest
+
+import init_test
+
+from lian import common_structs
+from lian.common_structs import CallPath, CallSite, PathManager, State
+from lian.config import config
+from lian.core.global_semantics import P3GlobalSemanticAnalysis
+from lian.util.loader import Loader
+
+class FakeLoader:
+    def __init__(self, entry_points):
+        self.entry_points = entry_points
+        self.sfgs = []
+
+    def get_entry_points(self):
+        return self.entry_points
+
+    def save_global_sfg_by_entry_point(self, entry_point, state_ids):
+        self.sfgs.append((entry_point, state_ids))
+
+    def replay_saved_items(self, saved_items):
+        Loader.replay_saved_items(self, saved_items)
+
+class FakeP3(P3GlobalSemanticAnalysis):
+    def __init__(self, entry_points, cores):
+        self.options = types.SimpleNamespace(cores = cores)
+        self.loader = FakeLoader(entry_points)
+        self.path_manager = PathManager()
+        self.caller_unknown_callee_edge = {}
+
+    def analyze_entry_point(self, entry_point):
+        # entry point n calls n, n + 1, ..., 2n - 1 and creates a state per call
+        state_ids = []
+        for callee_id in range(entry_point, 2 * entry_point):
+            call_path = CallPath((CallSite(entry_point, entry_point * 10, callee_id + 100),))
+            self.path_manager.add_path(call_path)
+            self.path_manager.add_path(call_path.add_call(callee_id + 100, callee_id, callee_id + 200))
+            state_ids.append(State().state_id)
+        self.caller_unknown_callee_edge.setdefault(str(entry_point), set()).add((str(entry_point), "unknown"))
+        self.loader.save_global_sfg_by_entry_point(entry_point, state_ids)
+
+class TestParallelP3(unittest.TestCase):
+    def setUp(self):
+        self.entry_points = [1, 3, 2, 4]
+        self.original_block_size = config.PARALLEL_P3_STATE_ID_BLOCK_SIZE
+
+    def tearDown(self):
+        config.PARALLEL_P3_STATE_ID_BLOCK_SIZE = self.original_block_size
+
+    def analyze(self, cores):
+        p3 = FakeP3(self.entry_points, cores)
+        p3.analyze_entry_points(self.entry_points)
+        return p3
+
+    def check_state_ids(self, p3):
+        state_ids = [state_id for _, ids in p3.loader.sfgs for state_id in ids]
+        self.assertEqual(len(set(state_ids)), len(state_ids))
+        self.assertGreater(common_structs.global_state_id, max(state_ids))
+
+    def test_results_do_not_depend_on_cores(self):
+        target = os.path.join(init_test.TEST_DIR, "parallel", "python")
+        # without --enable-p2, P3 also computes the method summaries itself
+        for options in ((), ("--enable-p2",)):
+            with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+                init_test.run_lian(target, serial_dir, 1, "semantic", *options)
+                init_test.run_lian(target, parallel_dir, 2, "semantic", *options)
+
+                serial_results = init_test.read_output_files(serial_dir, config.SEMANTIC_P3_DIR)
+                self.assertIn("s2space_p3.bundle0", serial_results)
+                self.assertEqual(serial_results, init_test.read_output_files(parallel_dir, config.SEMANTIC_P3_DIR))
+
+    def test_overflowed_entry_points_are_analyzed_again(self):
+        # entry points 3 and 4 create more states than a block can hold
+        config.PARALLEL_P3_STATE_ID_BLOCK_SIZE = 2
+        for cores in (1, 2):
+            p3 = self.analyze(cores)
+
+            self.assertEqual([entry_point for entry_point, _ in p3.loader.sfgs], [1, 2, 3, 4])
+            self.assertEqual(len(p3.path_manager.paths), 10)
+            self.assertEqual(sorted(p3.caller_unknown_callee_edge), ["1", "2", "3", "4"])
+            self.check_state_ids(p3)
+
+if __name__ == '__main__':
+    unittest.main()
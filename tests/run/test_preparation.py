@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import types
+import unittest
+from unittest.mock import patch
+
+import init_test
+
+from lian.config import config, lang_config
+from lian.lang.lang_analysis import GIRParser
+from lian.preparation import ModuleSymbolsBuilder, WorkspaceBuilder
+
+class FakeLoader:
+    def __init__(self):
+        self.module_symbols = []
+
+    def save_module_symbols(self, module_symbol_results):
+        self.module_symbols = module_symbol_results
+
+class TestInPlacePreparation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.code_dir = os.path.join(self.tmp_dir.name, "project")
+        os.makedirs(os.path.join(self.code_dir, "pkg"))
+        with open(os.path.join(self.code_dir, "main.py"), "w") as f:
+            f.write("import pkg.util\r\n")
+        with open(os.path.join(self.code_dir, "pkg", "util.py"), "w") as f:
+            f.write("a = 1\n")
+        with open(os.path.join(self.code_dir, "README.md"), "w") as f:
+            f.write("skipped\n")
+
+        self.options = types.SimpleNamespace(
+            workspace = os.path.join(self.tmp_dir.name, config.DEFAULT_WORKSPACE),
+            in_path = [self.code_dir],
+            lang = ["python"],
+            lang_extensions = [".py"],
+            quiet = True,
+            force = True,
+            incremental = False,
+            strict_parse_mode = False,
+            in_place = True,
+            enable_header_preprocess = False,
+            nomock = True,
+            debug = False,
+            print_stmts = False,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def prepare(self):
+        workspace_builder = WorkspaceBuilder(self.options)
+        dst_file_to_src_file = workspace_builder.run()
+        loader = FakeLoader()
+        ModuleSymbolsBuilder(self.options, loader, dst_file_to_src_file).run(workspace_builder.materialize_files)
+        return loader.module_symbols
+
+    def test_module_symbols_point_to_original_files(self):
+        module_symbols = self.prepare()
+        src_dir = os.path.join(self.options.workspace, config.SOURCE_CODE_DIR)
+        self.assertEqual(os.listdir(src_dir), [])
+
+        units = {row["exported_name"]: row for row in module_symbols if "unit_id" in row}
+        self.assertEqual(set(units), {"project.main", "project.pkg.util"})
+        util_unit = units["project.pkg.util"]
+        self.assertEqual(util_unit["original_path"], os.path.realpath(os.path.join(self.code_dir, "pkg", "util.py")))
+        self.assertTrue(util_unit["unit_path"].startswith(os.path.realpath(src_dir)))
+        self.assertIsNone(util_unit["hash"])
+
+        modules = {row["module_id"]: row for row in module_symbols}
+        pkg_module = modules[util_unit["parent_module_id"]]
+        self.assertEqual(pkg_module["symbol_name"], "pkg")
+        self.assertEqual(modules[pkg_module["parent_module_id"]]["symbol_name"], "project")
+
+    def test_incremental_mode_hashes_during_preparation(self):
+        self.options.incremental = True
+        module_symbols = self.prepare()
+        for row in module_symbols:
+            if "unit_id" in row:
+                self.assertEqual(len(row["hash"]), 64)
+
+    def test_parser_read_fills_hash(self):
+        module_symbols = self.prepare()
+        main_unit = [row for row in module_symbols if row.get("exported_name") == "project.main"][0]
+        unit_info = types.SimpleNamespace(module_id = main_unit["module_id"], hash = None)
+        gir_parser = GIRParser(self.options, None, None, self.tmp_dir.name)
+
+        code = gir_parser.read_source_code(unit_info, main_unit["original_path"])
+        self.assertEqual(code, "import pkg.util\n")
+        expected_hash = ModuleSymbolsBuilder(self.options, FakeLoader()).file_hash(main_unit["original_path"])
+        self.assertEqual(gir_parser.unit_hashes[unit_info.module_id], expected_hash)
+
+class TestBackupWorkspace(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.code_dir = os.path.join(self.tmp_dir.name, "project")
+        os.makedirs(self.code_dir)
+        self.unit_path = os.path.join(self.code_dir, "main.py")
+        with open(self.unit_path, "w") as f:
+            f.write("a = 1\n")
+        self.options = types.SimpleNamespace(
+            workspace = os.path.join(self.tmp_dir.name, config.DEFAULT_WORKSPACE),
+            in_path = [self.code_dir],
+            lang = ["python"],
+            lang_extensions = [".py"],
+            quiet = True,
+            force = False,
+            incremental = True,
+            strict_parse_mode = False,
+            in_place = False,
+            enable_header_preprocess = False,
+            nomock = True,
+        )
+        os.makedirs(self.options.workspace)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def workspace_file(self, *path):
+        return os.path.join(self.options.workspace, *path)
+
+    def test_backup_does_not_copy(self):
+        WorkspaceBuilder(self.options).run()
+        gir_path = self.workspace_file(config.FRONTEND_DIR, "gir.bundle0")
+        with open(gir_path, "w") as f:
+            f.write("previous results")
+        gir_inode = os.stat(gir_path).st_ino
+        unit_path = self.workspace_file(config.SOURCE_CODE_DIR, "project", "main.py")
+        unit_inode = os.stat(unit_path).st_ino
+
+        WorkspaceBuilder(self.options).run()
+        bak_gir_path = self.workspace_file(config.BACKUP_DIR, config.FRONTEND_DIR, "gir.bundle0")
+        self.assertEqual(os.stat(bak_gir_path).st_ino, gir_inode)
+        self.assertFalse(os.path.exists(gir_path))
+        # the unchanged source is neither copied nor re-linked
+        bak_unit_path = self.workspace_file(config.BACKUP_DIR, config.SOURCE_CODE_DIR, "project", "main.py")
+        self.assertEqual(os.stat(unit_path).st_ino, unit_inode)
+        self.assertEqual(os.stat(bak_unit_path).st_ino, unit_inode)
+
+        with open(self.workspace_file(config.WORKSPACE_MANIFEST_PATH)) as f:
+            self.assertEqual(json.load(f)["generation"], 2)
+        with open(self.workspace_file(config.BACKUP_DIR, config.WORKSPACE_MANIFEST_PATH)) as f:
+            self.assertEqual(json.load(f)["generation"], 1)
+
+    def test_changed_source_keeps_backup_content(self):
+        WorkspaceBuilder(self.options).run()
+        with open(self.unit_path, "w") as f:
+            f.write("a = 22\n")
+        WorkspaceBuilder(self.options).run()
+
+        with open(self.workspace_file(config.SOURCE_CODE_DIR, "project", "main.py")) as f:
+            self.assertEqual(f.read(), "a = 22\n")
+        with open(self.workspace_file(config.BACKUP_DIR, config.SOURCE_CODE_DIR, "project", "main.py")) as f:
+            self.assertEqual(f.read(), "a = 1\n")
+
+class TestFileHashCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.options = types.SimpleNamespace(workspace = self.tmp_dir.name, in_place = False, incremental = False)
+        self.file_paths = []
+        for index in range(3):
+            file_path = os.path.join(self.tmp_dir.name, f"unit{index}.py")
+            with open(file_path, "w") as f:
+                f.write(f"a = {index}\n")
+            # files modified during the scan are never cached
+            os.utime(file_path, ns = (10 ** 18, 10 ** 18 + index))
+            self.file_paths.append(file_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def hash_units(self):
+        builder = ModuleSymbolsBuilder(self.options, FakeLoader())
+        file_hash = builder.file_hash
+        hashed_paths = []
+        def recording_file_hash(file_path):
+            hashed_paths.append(file_path)
+            return file_hash(file_path)
+        builder.file_hash = recording_file_hash
+
+        unit_symbols = [{"hash": None} for _ in self.file_paths]
+        builder.units_to_hash = list(zip(unit_symbols, self.file_paths))
+        builder.hash_units()
+        return [unit_symbol["hash"] for unit_symbol in unit_symbols], sorted(hashed_paths)
+
+    def test_unchanged_files_are_not_hashed_again(self):
+        hashes, hashed_paths = self.hash_units()
+        self.assertEqual(hashed_paths, sorted(self.file_paths))
+        self.assertEqual(len(set(hashes)), 3)
+
+        cached_hashes, hashed_paths = self.hash_units()
+        self.assertEqual(hashed_paths, [])
+        self.assertEqual(cached_hashes, hashes)
+
+        with open(self.file_paths[1], "w") as f:
+            f.write("a = 100\n")
+        os.utime(self.file_paths[1], ns = (10 ** 18, 10 ** 18 + 10))
+        new_hashes, hashed_paths = self.hash_units()
+        self.assertEqual(hashed_paths, [self.file_paths[1]])
+        self.assertEqual(new_hashes[0], hashes[0])
+        self.assertNotEqual(new_hashes[1], hashes[1])
+
+    def test_recently_modified_files_are_not_cached(self):
+        os.utime(self.file_paths[0])
+        self.hash_units()
+        _, hashed_paths = self.hash_units()
+        self.assertEqual(hashed_paths, [self.file_paths[0]])
+
+    def test_file_hash_without_file_digest(self):
+        # Python 3.10 has no hashlib.file_digest; the file is then hashed chunk by chunk
+        with open(self.file_paths[0], "wb") as f:
+            f.write(bytes(range(256)) * 10)
+        builder = ModuleSymbolsBuilder(self.options, FakeLoader())
+        expected_hash = builder.file_hash(self.file_paths[0])
+        with patch("lian.preparation.hashlib", types.SimpleNamespace(sha256 = hashlib.sha256)), \
+                patch.object(config, "FILE_HASH_CHUNK_SIZE", 1000):
+            self.assertEqual(builder.file_hash(self.file_paths[0]), expected_hash)
+        with open(self.file_paths[0], "rb") as f:
+            self.assertEqual(expected_hash, hashlib.sha256(f.read()).hexdigest())
+
+class TestCLikePreprocessing(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_dir = os.path.join(self.tmp_dir.name, "src")
+        os.makedirs(self.src_dir)
+        for index in range(3):
+            with open(os.path.join(self.src_dir, f"unit{index}.c"), "w") as f:
+                f.write(f'#include <stdio.h>\n#include "local.h"\nint a{index} = 0;\nstd::vector<int> v;\n')
+        self.options = types.SimpleNamespace(
+            workspace = self.tmp_dir.name, lang = ["c"], included_headers = "", cores = 2,
+            in_place = False, enable_header_preprocess = True,
+        )
+        self.commands = []
+        self.original_run = subprocess.run
+        subprocess.run = self.fake_clang
+        self.original_extensions = dict(lang_config.LANG_EXTENSIONS)
+        lang_config.update_lang_extensions(lang_config.LANG_TABLE, self.options.lang)
+
+    def tearDown(self):
+        subprocess.run = self.original_run
+        lang_config.LANG_EXTENSIONS.clear()
+        lang_config.LANG_EXTENSIONS.update(self.original_extensions)
+        self.tmp_dir.cleanup()
+
+    def preprocess(self):
+        lang_config.update_lang_extensions(lang_config.LANG_TABLE, self.options.lang)
+        builder = WorkspaceBuilder(self.options)
+        builder.clang_installed = True
+        builder.change_c_like_files(self.src_dir)
+
+    def fake_clang(self, command, check):
+        self.commands.append(command)
+        with open(command[3]) as input_file, open(command[5], "w") as output_file:
+            output_file.write(input_file.read())
+
+    def test_keyword_pattern_matches_each_keyword_search(self):
+        builder = WorkspaceBuilder(self.options)
+        lines = ["#include <vector>", "using std::string;", "int strings = 1;", "stdio.h", "x = newer;", "new int"]
+        for line in lines:
+            expected = any(re.search(fr'\b{keyword}\b', line) for keyword in builder.header_keywords)
+            self.assertEqual(bool(builder.header_keyword_pattern.search(line)), expected, line)
+
+    def test_preprocessed_outputs_are_cached(self):
+        self.preprocess()
+        self.assertEqual(len(self.commands), 3)
+        with open(os.path.join(self.src_dir, "unit1.i")) as f:
+            self.assertEqual(f.read(), '#include "local.h"\nint a1 = 0;\n')
+
+        os.unlink(os.path.join(self.src_dir, "unit1.i"))
+        self.preprocess()
+        self.assertEqual(len(self.commands), 3)
+        self.assertTrue(os.path.isfile(os.path.join(self.src_dir, "unit1.i")))
+
+        # a changed local header invalidates the cached outputs
+        with open(os.path.join(self.src_dir, "local.h"), "w") as f:
+            f.write("int b;\n")
+        self.preprocess()
+        # the three units and local.h itself
+        self.assertEqual(len(self.commands), 7)
+
+    def test_unused_cache_entries_are_removed(self):
+        cache_dir = os.path.join(self.tmp_dir.name, config.PREPROCESS_CACHE_DIR)
+        self.preprocess()
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+        # an edited unit replaces its own entry
+        with open(os.path.join(self.src_dir, "unit1.c"), "a") as f:
+            f.write("int c;\n")
+        self.preprocess()
+        self.assertEqual(len(self.commands), 4)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+        # a changed header rekeys every unit, and the entries of the old fingerprint are removed
+        with open(os.path.join(self.src_dir, "local.h"), "w") as f:
+            f.write("int b;\n")
+        self.preprocess()
+        cache_entries = os.listdir(cache_dir)
+        self.assertEqual(len(cache_entries), 4)
+
+        # the removed entries are not needed: nothing changed, so nothing is preprocessed again
+        self.preprocess()
+        self.assertEqual(len(self.commands), 8)
+        self.assertEqual(sorted(os.listdir(cache_dir)), sorted(cache_entries))
+
+    def expanding_clang(self, command, check):
+        # like clang, quoted includes are looked up next to the input file
+        self.commands.append(command)
+        input_dir = os.path.dirname(command[3])
+        with open(command[3]) as input_file, open(command[5], "w") as output_file:
+            for line in input_file:
+                match = re.match(r'#include "(.*)"', line)
+                if match:
+                    with open(os.path.join(input_dir, match.group(1))) as header_file:
+                        line = header_file.read()
+                output_file.write(line)
+
+    def test_identical_units_in_different_directories(self):
+        subprocess.run = self.expanding_clang
+        with open(os.path.join(self.src_dir, "local.h"), "w") as f:
+            f.write("\n")
+        for name in ("a", "b"):
+            unit_dir = os.path.join(self.src_dir, name)
+            os.makedirs(unit_dir)
+            with open(os.path.join(unit_dir, "unit.c"), "w") as f:
+                f.write('#include "local.h"\nint x = LOCAL;\n')
+            with open(os.path.join(unit_dir, "local.h"), "w") as f:
+                f.write(f"#define LOCAL_{name}\n")
+        self.preprocess()
+
+        for name in ("a", "b"):
+            with open(os.path.join(self.src_dir, name, "unit.i")) as f:
+                self.assertEqual(f.read(), f"#define LOCAL_{name}\nint x = LOCAL;\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import types
+import unittest
+
+import init_test
+
+from lian.config import config
+from lian.config.constants import TAG_KEYWORD
+from lian.taint.rule_manager import CodeRuleIndex, IndexedRules, Rule, RuleManager, SourceCodeRule
+
+def access_path(name):
+    return [types.SimpleNamespace(key = key) for key in name.split('.')]
+
+def check_method_name(rule_name, state_access_path):
+    rule_name = rule_name.split('.')
+    if len(state_access_path) < len(rule_name):
+        return False
+    for i, item in enumerate(reversed(rule_name)):
+        if item == TAG_KEYWORD.ANYNAME:
+            continue
+        if item != state_access_path[-i - 1].key:
+            return False
+    return True
+
+class TestRuleManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # the rules exported from code are large; use a small file instead
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        code_rules_path = os.path.join(cls.tmp_dir.name, "from_code.yaml")
+        with open(code_rules_path, "w") as f:
+            f.write("- lang: python\n  rules:\n  - unit_path: main.py\n    line_num: 3\n    symbol_name: source\n")
+        original_paths = (config.TAINT_SOURCE_FROM_CODE, config.TAINT_SINK_FROM_CODE)
+        config.TAINT_SOURCE_FROM_CODE = config.TAINT_SINK_FROM_CODE = code_rules_path
+        try:
+            cls.rule_manager = RuleManager(config.DEFAULT_SETTINGS_PATH)
+        finally:
+            config.TAINT_SOURCE_FROM_CODE, config.TAINT_SINK_FROM_CODE = original_paths
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_rules_are_selected_by_lang(self):
+        python_rules = self.rule_manager.get_compiled_rules("python")
+        self.assertIs(python_rules, self.rule_manager.get_compiled_rules("python"))
+        self.assertGreater(len(python_rules.sinks.rules), 0)
+        self.assertTrue(all(rule.lang in ("python", config.ANY_LANG) for rule in python_rules.sinks.rules))
+        self.assertEqual(
+            python_rules.sinks.rules,
+            [rule for rule in self.rule_manager.all_sinks if rule.lang in ("python", config.ANY_LANG)]
+        )
+        self.assertEqual(self.rule_manager.get_compiled_rules().sinks.rules, self.rule_manager.all_sinks)
+        self.assertTrue(python_rules.sources_from_code.match(3, "v = source()", "/project/main.py"))
+        self.assertFalse(self.rule_manager.get_compiled_rules("java").sources_from_code.has_line(3))
+
+    def test_method_name_index_matches_scan(self):
+        sinks = self.rule_manager.get_compiled_rules().sinks
+        names = {rule.name for rule in self.rule_manager.all_sinks if isinstance(rule.name, str)}
+        names |= {"a." + name for name in names} | {"os.system", "x.y.load", "load"}
+        for name in sorted(names):
+            path = access_path(name)
+            expected = [
+                rule for rule in self.rule_manager.all_sinks
+                if rule.operation == "call_stmt" and isinstance(rule.name, str) and check_method_name(rule.name, path)
+            ]
+            self.assertEqual(sinks.with_method_name("call_stmt", path), expected, name)
+
+    def test_wildcards_and_names(self):
+        rules = [
+            Rule(operation = "call_stmt", name = "pickle.load"),
+            Rule(operation = "call_stmt", name = f"{TAG_KEYWORD.ANYNAME}.load"),
+            Rule(operation = "call_stmt", name = f"os.{TAG_KEYWORD.ANYNAME}"),
+            Rule(operation = "record_write", name = None),
+            Rule(operation = "call_stmt", name = "pickle.load"),
+        ]
+        indexed = IndexedRules(rules)
+        self.assertEqual(indexed.with_method_name("call_stmt", access_path("m.pickle.load")), [rules[0], rules[1], rules[4]])
+        self.assertEqual(indexed.with_method_name("call_stmt", access_path("os.system")), [rules[2]])
+        self.assertEqual(indexed.with_method_name("call_stmt", access_path("load")), [])
+        self.assertEqual(indexed.with_names(["pickle.load", None, "pickle.load"]), [rules[0], rules[3], rules[4]])
+        self.assertEqual(indexed.with_operation("record_write"), [rules[3]])
+
+    def test_code_rules_by_line(self):
+        rules = [
+            SourceCodeRule(unit_path = "web/funcs.py", line_num = 55, symbol_name = "seed"),
+            SourceCodeRule(unit_path = "web/other.py", line_num = 55, symbol_name = "coef"),
+            SourceCodeRule(unit_path = "web/funcs.py", line_num = 59, symbol_name = "coef"),
+        ]
+        index = CodeRuleIndex(rules)
+        self.assertTrue(index.has_line(55.0))
+        self.assertFalse(index.has_line(56))
+        self.assertTrue(index.match(55, "v = coef + 1", "/src/web/other.py"))
+        self.assertFalse(index.match(55, "v = coef + 1", "/src/web/funcs.py"))
+        # without a unit path only the line and the symbol are checked
+        self.assertTrue(index.match(55, "v = coef + 1"))
+        self.assertFalse(index.match(59, "v = seed"))
+
+if __name__ == '__main__':
+    unittest.main()
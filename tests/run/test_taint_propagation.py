@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+import types
+import unittest
+
+import networkx as nx
+
+import init_test
+
+from lian.common_structs import SFGEdge, SFGNode
+from lian.config.constants import SFG_EDGE_KIND, SFG_NODE_KIND
+from lian.taint.rule_manager import CompiledRules
+from lian.taint.taint_analysis import PathFinder, TaintAnalysis, TaintRuleApplier
+from lian.taint.taint_structs import CompactSFG, TaintEnv, edge_mask
+
+def symbol(node_id):
+    return SFGNode(node_type = SFG_NODE_KIND.SYMBOL, def_stmt_id = node_id, node_id = node_id, name = f"s{node_id}")
+
+def state(node_id):
+    return SFGNode(node_type = SFG_NODE_KIND.STATE, def_stmt_id = node_id, node_id = node_id, name = f"t{node_id}")
+
+def stmt(stmt_id, name):
+    return SFGNode(node_type = SFG_NODE_KIND.STMT, def_stmt_id = stmt_id, node_id = stmt_id, name = name)
+
+class SinkRuleApplier(TaintRuleApplier):
+    def get_sink_tag_by_rules(self, node):
+        self.taint_analysis.sink_queries += 1
+        return self.taint_analysis.taint_manager.get_symbol_tag(node.node_id), "test"
+
+class FakeTaintAnalysis(TaintAnalysis):
+    def __init__(self, sfg):
+        self.loader = None
+        self.options = types.SimpleNamespace()
+        self.rule_manager = types.SimpleNamespace(get_compiled_rules = lambda lang = None: CompiledRules([], [], [], [], []))
+        self.current_entry_point = 0
+        self.sfg = None
+        self.taint_manager = TaintEnv()
+        self.rule_applier = SinkRuleApplier(self)
+        self.path_finder = PathFinder(self)
+        self.sink_queries = 0
+        self._update_sfg(sfg)
+
+class TestMultiSourcePropagation(unittest.TestCase):
+    def setUp(self):
+        self.sfg = nx.DiGraph()
+        s = {index: symbol(index) for index in range(1, 8)}
+        t = {index: state(100 + index) for index in range(1, 5)}
+        assign = stmt(201, "assign_stmt")
+        unknown = stmt(202, "unknown_stmt")
+        call = stmt(203, "call_stmt")
+        self.add_edges([
+            (s[1], t[1], SFG_EDGE_KIND.SYMBOL_STATE),
+            (s[1], assign, SFG_EDGE_KIND.SYMBOL_IS_USED),
+            (assign, s[3], SFG_EDGE_KIND.SYMBOL_IS_DEFINED),
+            (s[2], t[2], SFG_EDGE_KIND.SYMBOL_STATE),
+            (t[2], t[3], SFG_EDGE_KIND.STATE_INCLUSION),
+            # unknown_stmt does not propagate, so s4 stays clean
+            (s[2], unknown, SFG_EDGE_KIND.SYMBOL_IS_USED),
+            (unknown, s[4], SFG_EDGE_KIND.SYMBOL_IS_DEFINED),
+            (s[2], call, SFG_EDGE_KIND.SYMBOL_IS_USED),
+            (call, s[3], SFG_EDGE_KIND.SYMBOL_IS_DEFINED),
+            (s[3], s[5], SFG_EDGE_KIND.SYMBOL_FLOW),
+            (s[5], t[1], SFG_EDGE_KIND.SYMBOL_STATE),
+            (s[6], t[3], SFG_EDGE_KIND.SYMBOL_STATE),
+            (s[7], t[4], SFG_EDGE_KIND.SYMBOL_STATE),
+            (t[4], t[1], SFG_EDGE_KIND.STATE_INCLUSION),
+        ])
+        # sources share s3, s5 and t1
+        self.sources = [s[1], s[2], t[4], s[1]]
+        self.sinks = [s[4], s[5], s[6], s[7]]
+
+    def add_edges(self, edges):
+        for u, v, edge_type in edges:
+            self.sfg.add_edge(u, v, weight = SFGEdge(edge_type = edge_type))
+        self.multi_sfg = nx.MultiDiGraph(self.sfg)
+
+    def tainted_nodes(self, taint_manager, tag):
+        symbols = {symbol_id for symbol_id, bv in taint_manager.symbols_to_bv.items() if bv & tag}
+        states = {state_id for state_id, bv in taint_manager.states_to_bv.items() if bv & tag}
+        return symbols, states
+
+    def test_each_bit_matches_single_source_propagation(self):
+        expected = []
+        for source in self.sources:
+            analysis = FakeTaintAnalysis(self.sfg)
+            tag = analysis.path_finder.propagate_taint(source)
+            expected.append(self.tainted_nodes(analysis.taint_manager, tag))
+
+        analysis = FakeTaintAnalysis(self.sfg)
+        tags = analysis.path_finder.propagate_taints(self.sources)
+        # the repeated source shares its bit
+        self.assertEqual(len(set(tags)), 3)
+        self.assertEqual(tags[0], tags[3])
+        results = [self.tainted_nodes(analysis.taint_manager, tag) for tag in tags]
+        self.assertEqual(results, expected)
+        self.assertEqual(results[1], ({1, 2, 3, 5, 6, 102, 104}, {101, 102, 103}))
+
+        projected = analysis.taint_manager.project(tags[2])
+        self.assertEqual(self.tainted_nodes(projected, -1), expected[2])
+
+    def test_flows_are_checked_once_per_sink(self):
+        analysis = FakeTaintAnalysis(self.sfg)
+        original_manager = analysis.taint_manager
+        flows = analysis.find_flows(self.sources, self.sinks)
+
+        self.assertIs(analysis.taint_manager, original_manager)
+        self.assertEqual(analysis.sink_queries, len(self.sinks))
+        self.assertEqual(
+            [(flow.source_stmt_id, flow.sink_stmt_id) for flow in flows],
+            [(1, 5), (2, 5), (2, 6), (104, 5), (104, 7), (1, 5)]
+        )
+        self.assertEqual(analysis.find_flows([], self.sinks), [])
+
+    def test_multigraph_gives_same_flows(self):
+        flows = FakeTaintAnalysis(self.sfg).find_flows(self.sources, self.sinks)
+        multi_flows = FakeTaintAnalysis(self.multi_sfg).find_flows(self.sources, self.sinks)
+        self.assertEqual(
+            [(flow.source_stmt_id, flow.sink_stmt_id, flow.parent_to_sink) for flow in multi_flows],
+            [(flow.source_stmt_id, flow.sink_stmt_id, flow.parent_to_sink) for flow in flows]
+        )
+
+class TestWitnessReconstruction(unittest.TestCase):
+    def setUp(self):
+        self.sfg = nx.DiGraph()
+        self.source = symbol(1)
+        self.sink = stmt(299, "call_stmt")
+        # one route through a single statement, another through three
+        self.add_chain(self.source, [stmt(201, "assign_stmt")], self.sink, 10)
+        self.add_chain(self.source, [stmt(211, "assign_stmt"), stmt(212, "assign_stmt"), stmt(213, "assign_stmt")], self.sink, 20)
+
+    def add_chain(self, source, stmts, sink, first_symbol_id):
+        u = source
+        for index, node in enumerate(stmts):
+            self.sfg.add_edge(u, node, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_IS_USED))
+            u = symbol(first_symbol_id + index)
+            self.sfg.add_edge(node, u, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_IS_DEFINED))
+        self.sfg.add_edge(u, sink, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_IS_USED))
+
+    def reconstruct(self, k = 1, source = None, sink = None):
+        analysis = FakeTaintAnalysis(self.sfg)
+        source = source or self.source
+        tag = analysis.path_finder.propagate_taint(source)
+        flow = analysis.path_finder.reconstruct_define_use_path(source, sink or self.sink, tag, k)
+        return [flow.parent_to_sink] + flow.other_paths_to_sink
+
+    def stmt_ids(self, paths):
+        return [[node.def_stmt_id for node in path] for path in paths]
+
+    def test_shortest_witness(self):
+        self.assertEqual(self.stmt_ids(self.reconstruct()), [[201, 299]])
+
+    def test_k_shortest_witnesses(self):
+        self.assertEqual(self.stmt_ids(self.reconstruct(k = 2)), [[201, 299], [211, 212, 213, 299]])
+        self.assertEqual(self.stmt_ids(self.reconstruct(k = 5)), [[201, 299], [211, 212, 213, 299]])
+
+    def test_repeated_statement_paths_do_not_use_up_witnesses(self):
+        self.sfg = nx.DiGraph()
+        sink = stmt(202, "call_stmt")
+        assign = stmt(201, "assign_stmt")
+        x, y, z = symbol(2), symbol(3), symbol(4)
+        for u, v, edge_type in [
+            (self.source, x, SFG_EDGE_KIND.SYMBOL_FLOW),
+            (x, sink, SFG_EDGE_KIND.SYMBOL_IS_USED),
+            (self.source, y, SFG_EDGE_KIND.SYMBOL_FLOW),
+            (y, sink, SFG_EDGE_KIND.SYMBOL_IS_USED),
+            (self.source, assign, SFG_EDGE_KIND.SYMBOL_IS_USED),
+            (assign, z, SFG_EDGE_KIND.SYMBOL_IS_DEFINED),
+            (z, sink, SFG_EDGE_KIND.SYMBOL_IS_USED),
+        ]:
+            self.sfg.add_edge(u, v, weight = SFGEdge(edge_type = edge_type))
+        # the routes through x and y give the same statement sequence
+        self.assertEqual(self.stmt_ids(self.reconstruct(k = 2, sink = sink)), [[202], [201, 202]])
+        self.assertEqual(self.stmt_ids(self.reconstruct(k = 3, sink = sink)), [[202], [201, 202]])
+
+    def test_long_chain_does_not_recurse(self):
+        sink = stmt(100000, "call_stmt")
+        stmts = [stmt(50000 + index, "assign_stmt") for index in range(3000)]
+        self.add_chain(self.source, stmts, sink, 1000)
+        (path,) = self.reconstruct(sink = sink)
+        self.assertEqual(len(path), 3001)
+        self.assertEqual(path[-1], sink)
+
+    def test_unreachable_sink(self):
+        sink = stmt(300, "call_stmt")
+        self.sfg.add_node(sink)
+        self.assertEqual(self.reconstruct(k = 2, sink = sink), [[sink]])
+
+class TestCompactSFG(unittest.TestCase):
+    def setUp(self):
+        self.sfg = nx.MultiDiGraph()
+        self.call = stmt(300, "object_call_stmt")
+        self.receiver = symbol(1)
+        self.arg = symbol(2)
+        self.target = symbol(3)
+        self.sfg.add_edge(self.receiver, self.call, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_IS_USED, pos = 0))
+        self.sfg.add_edge(self.arg, self.call, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_IS_USED, pos = 1))
+        self.sfg.add_edge(self.call, self.target, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_IS_DEFINED))
+        # parallel edges keep one entry each
+        self.sfg.add_edge(self.arg, self.target, weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_FLOW))
+        self.sfg.add_edge(self.arg, self.target, weight = SFGEdge(edge_type = SFG_EDGE_KIND.INDIRECT_SYMBOL_FLOW))
+        self.sfg.add_edge(self.target, state(101), weight = SFGEdge(edge_type = SFG_EDGE_KIND.SYMBOL_STATE))
+        self.view = CompactSFG(self.sfg)
+
+    def nodes(self, indexes):
+        return [self.view.nodes[index] for index in indexes]
+
+    def test_adjacency_follows_graph_order(self):
+        view = self.view
+        self.assertEqual(len(view), len(self.sfg))
+        for node in self.sfg.nodes:
+            u = view.index_of(node)
+            self.assertEqual(view.node_ids[u], node.node_id)
+            self.assertEqual(list(dict.fromkeys(self.nodes(view.successors(u)))), list(self.sfg.successors(node)))
+            self.assertEqual(list(dict.fromkeys(self.nodes(view.predecessors(u)))), list(self.sfg.predecessors(node)))
+        self.assertEqual(view.index_of(symbol(9)), -1)
+
+        arg = view.index_of(self.arg)
+        flow_mask = edge_mask(SFG_EDGE_KIND.SYMBOL_FLOW)
+        self.assertEqual(self.nodes(view.successors(arg, flow_mask)), [self.target])
+        self.assertEqual(
+            [(view.nodes[v], pos) for v, _, pos in view.in_edges(view.index_of(self.call))],
+            [(self.receiver, 0), (self.arg, 1)]
+        )
+
+    def test_receiver_is_tainted_by_object_call(self):
+        analysis = FakeTaintAnalysis(self.sfg)
+        tag = analysis.path_finder.propagate_taint(self.arg)
+        self.assertEqual(analysis.taint_manager.get_symbol_tag(self.receiver.node_id), tag)
+        self.assertEqual(analysis.taint_manager.get_state_tag(101), tag)
+
+        receiver, states = analysis.get_stmt_used_symbol_and_state_by_pos(self.call, pos = 1)
+        self.assertEqual((receiver, states), (self.arg, []))
+        self.assertEqual(analysis.get_stmt_define_symbol_and_states_node(self.call), (self.target, [state(101)]))
+        self.assertEqual(analysis.get_all_backward_nodes(self.target), {self.target, self.call, self.arg, self.receiver})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import os
+import tempfile
 import unittest
 
 import pandas as pd
@@ -143,6 +145,50 @@ class TestDataModel(unittest.TestCase):
     def test_df_loop(self):
         compare_dataframe_and_dataframeagent(self.df._data, self.df)
 
+class TestBundleReader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, "test.bundle0")
+        cls.df = dm.DataModel({
+            "unit_id":   [1, 1, 1, 2, 2, 3, 1, 0, 4],
+            "stmt_id":   [10, 11, 12, 20, 21, 30, 13, 0, 40],
+            "operation": ["a", "b", "c", "d", "e", "f", "g", "h", "i"],
+        })
+        # small record batches so that items span several batches
+        cls.df.save(cls.path, chunksize = 2)
+        cls.reader = dm.BundleReader(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_query_same_as_data_model(self):
+        for unit_id in [0, 1, 2, 3, 4]:
+            expected = self.df.query_index_column_value("unit_id", unit_id)._data
+            result = self.reader.query_index_column_value("unit_id", unit_id)._data
+            self.assertTrue(result.equals(expected))
+            self.assertEqual(list(result.index), list(expected.index))
+
+    def test_query_missing(self):
+        self.assertEqual(self.reader.query_index_column_value("unit_id", 5), [])
+        self.assertEqual(self.reader.query_index_column_value("unit_id", None), [])
+
+    def test_len(self):
+        self.assertEqual(len(self.reader), 9)
+
+    def test_offsets_sidecar(self):
+        dm.BundleReader(self.path).save_offsets(["unit_id"])
+        self.assertTrue(os.path.exists(self.path + ".offsets"))
+
+        reader = dm.BundleReader(self.path)
+        self.assertEqual(reader.obtain_value_ranges("unit_id", 1), [(0, 3), (6, 7)])
+        self.assertEqual(reader.obtain_value_ranges("unit_id", 5), [])
+        for unit_id in [0, 1, 2, 3, 4]:
+            expected = self.df.query_index_column_value("unit_id", unit_id)._data
+            self.assertTrue(reader.query_index_column_value("unit_id", unit_id)._data.equals(expected))
+        os.remove(self.path + ".offsets")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import networkx as nx
+
+import init_test
+
+from lian.common_structs import SimpleWorkList
+
+class TestSimpleWorkList(unittest.TestCase):
+    def setUp(self):
+        # 1 -> 2 -> 3 -> 4 -> 5, with the loop 4 -> 2
+        self.cfg = nx.DiGraph()
+        nx.add_path(self.cfg, [1, 2, 3, 4, 5])
+        self.cfg.add_edge(4, 2)
+
+    def test_reverse_postorder(self):
+        worklist = SimpleWorkList(graph = self.cfg)
+        worklist.add([5, 3, 4, 1, 2, 3])
+        self.assertEqual(len(worklist), 5)
+        self.assertEqual(list(worklist), [1, 2, 3, 4, 5])
+        self.assertEqual([worklist.pop() for _ in range(5)], [1, 2, 3, 4, 5])
+        self.assertIsNone(worklist.pop())
+
+    def test_heap_order_after_pop(self):
+        worklist = SimpleWorkList(graph = self.cfg)
+        worklist.add([4, 5])
+        self.assertEqual(worklist.pop(), 4)
+        # the loop header is scheduled before the remaining exit
+        worklist.add([2, 3])
+        self.assertEqual(worklist.peek(), 2)
+        self.assertEqual([worklist.pop() for _ in range(3)], [2, 3, 5])
+
+    def test_remove(self):
+        worklist = SimpleWorkList(graph = self.cfg)
+        worklist.add([1, 2, 3])
+        worklist.remove(1)
+        self.assertNotIn(1, worklist)
+        self.assertEqual(worklist.peek(), 2)
+        worklist.add(1)
+        self.assertEqual([worklist.pop() for _ in range(3)], [1, 2, 3])
+        self.assertEqual(len(worklist), 0)
+
+    def test_fifo_without_graph(self):
+        worklist = SimpleWorkList([3, 1])
+        worklist.add([2, 1])
+        self.assertEqual([worklist.pop() for _ in range(3)], [3, 1, 2])
+        self.assertFalse(worklist.is_available())
+
+if __name__ == '__main__':
+    unittest.main()